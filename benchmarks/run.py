@@ -0,0 +1,413 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim: set et sw=4 sts=4:
+
+# Copyright 2012 Dave Hughes.
+#
+# This file is part of oxitopped.
+#
+# oxitopped is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# oxitopped is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# A PARTICULAR PURPOSE.  See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# oxitopped.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Benchmarks for the hot paths of oxitopped.
+
+Run from the root of the source tree, optionally saving the results as JSON
+and comparing them with the results of a previous run::
+
+    $ python benchmarks/run.py --output after.json --compare before.json
+
+Timing benchmarks are repeated several times and the best and median times
+are reported. Memory benchmarks are each run in a fresh child process and
+report the peak memory allocated by the benchmark. This is measured with
+tracemalloc where it's available. Otherwise it's the growth of the process'
+peak resident set size over its resident size beforehand (skipped on
+platforms without the resource module), and results smaller than
+RSS_RESOLUTION are flagged as below resolution rather than compared. All
+benchmarks use synthetic bottles from `oxitopped.synthetic`; the --scale
+option multiplies their number.
+"""
+
+from __future__ import (
+    unicode_literals,
+    absolute_import,
+    division,
+    print_function,
+    )
+
+import io
+import os
+import re
+import sys
+import json
+import time
+import platform
+import subprocess
+import optparse
+from collections import deque
+from datetime import datetime
+
+# Benchmark the source tree this script lives in rather than any installed
+# version of the package
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from xml.etree.ElementTree import fromstring, tostring
+
+from oxitopped import __version__
+from oxitopped.bottles import (
+    Bottle, BottleAutoReadings, DataAnalyzer, moving_average, xml)
+from oxitopped.export_csv import CsvExporter
+from oxitopped.logger import DataLogger, DummyLogger
+from oxitopped.nullmodem import null_modem
+from oxitopped.synthetic import generate_bottles, write_bottles
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+try:
+    from oxitopped.export_xls import ExcelExporter
+except ImportError:
+    ExcelExporter = None
+
+
+BENCHMARKS = []
+
+# The smallest growth (in KB) of the resident set size that is distinguished
+# from the noise of the allocator and the page granularity of the RSS
+RSS_RESOLUTION = 1024
+
+
+class Skipped(Exception):
+    "Raised by benchmarks which cannot run on this platform"
+
+
+def benchmark(kind='time'):
+    """
+    Decorator which registers a benchmark function. Timing benchmarks are
+    called with the scale and must return a callable which performs the work
+    to be timed (any preparation is done before returning it). Memory
+    benchmarks are called with the scale and must return whatever they
+    allocated, so that it is still alive when peak memory is measured.
+    """
+    def decorator(func):
+        BENCHMARKS.append((func.__name__, kind, func))
+        return func
+    return decorator
+
+
+_bottles = {}
+
+def bottles(count, measurements=1000):
+    "Returns a (cached) repeatable set of synthetic bottles"
+    key = (count, measurements)
+    if key not in _bottles:
+        _bottles[key] = list(generate_bottles(
+            count, modes=('pressure', 'bod'), heads=(1, 6),
+            measurements=measurements, manual_readings=10, seed=1))
+    return _bottles[key]
+
+
+def download(bottles):
+    "Downloads `bottles` from an emulated data logger over a null modem"
+    logger_port, emulator_port = null_modem(timeout=5, throttle=False)
+    emulator = DummyLogger(emulator_port, bottles)
+    try:
+        logger = DataLogger(logger_port)
+        try:
+            logger.download()
+            return logger.bottles
+        finally:
+            logger.close()
+    finally:
+        emulator.terminated = True
+        emulator.join()
+
+
+@benchmark()
+def bottle_from_string(scale):
+    data = [str(bottle) for bottle in bottles(int(100 * scale))]
+    return lambda: [Bottle.from_string(s) for s in data]
+
+
+@benchmark()
+def bottle_from_xml(scale):
+    data = [xml(bottle) for bottle in bottles(int(20 * scale))]
+    return lambda: [Bottle.from_xml(s) for s in data]
+
+
+@benchmark()
+def bottle_xml(scale):
+    data = bottles(int(20 * scale))
+    return lambda: [xml(bottle) for bottle in data]
+
+
+@benchmark()
+def auto_readings_from_string(scale):
+    data = [
+        (head, str(head.auto_readings))
+        for bottle in bottles(int(20 * scale))
+        for head in bottle.heads
+        ]
+    return lambda: [
+        BottleAutoReadings.from_string(head, s) for (head, s) in data]
+
+
+@benchmark()
+def moving_average_25(scale):
+    data = [float(i % 1000) for i in range(int(1000000 * scale))]
+    return lambda: deque(moving_average(data, 25), maxlen=0)
+
+
+@benchmark()
+def data_analyzer(scale):
+    data = bottles(int(20 * scale))
+    def run():
+        for bottle in data:
+            analyzer = DataAnalyzer(bottle, delta=True, points=5)
+            analyzer.timestamps
+            analyzer.heads
+    return run
+
+
+@benchmark()
+def csv_export_bottle(scale):
+    data = bottles(int(20 * scale))
+    exporter = CsvExporter()
+    def run():
+        for bottle in data:
+            exporter.export_bottle(io.BytesIO(), bottle, points=5)
+    return run
+
+
+@benchmark()
+def csv_export_bottles(scale):
+    data = bottles(int(20 * scale)) * 50
+    exporter = CsvExporter()
+    return lambda: exporter.export_bottles(io.BytesIO(), data)
+
+
+@benchmark()
+def xls_export_bottle(scale):
+    if ExcelExporter is None:
+        raise Skipped('xlwt is not installed')
+    data = bottles(int(20 * scale))
+    exporter = ExcelExporter()
+    def run():
+        for bottle in data:
+            exporter.export_bottle(io.BytesIO(), bottle, points=5)
+    return run
+
+
+@benchmark()
+def full_download(scale):
+    data = bottles(int(20 * scale))
+    return lambda: download(data)
+
+
+@benchmark(kind='memory')
+def memory_synthetic_bottles(scale):
+    return bottles(int(200 * scale))
+
+
+@benchmark(kind='memory')
+def memory_from_xml(scale):
+    output = io.BytesIO()
+    write_bottles(
+        generate_bottles(
+            int(200 * scale), modes=('pressure', 'bod'), heads=(1, 6),
+            measurements=1000, seed=1),
+        output)
+    document = fromstring(output.getvalue())
+    del output
+    return [
+        Bottle.from_xml(tostring(bottle))
+        for bottle in document.findall('bottle')
+        ]
+
+
+@benchmark(kind='memory')
+def memory_download(scale):
+    return download(bottles(int(200 * scale)))
+
+
+def peak_memory():
+    "Returns the peak resident set size of this process in KB"
+    result = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Mac OS X reports bytes rather than KB
+    if sys.platform == 'darwin':
+        result //= 1024
+    return result
+
+
+def current_memory():
+    """
+    Returns the current resident set size of this process in KB, or the peak
+    resident set size on platforms where the current size isn't available
+    """
+    try:
+        with open('/proc/self/statm', 'r') as statm:
+            pages = int(statm.read().split()[1])
+    except (IOError, OSError):
+        return peak_memory()
+    return pages * os.sysconf(str('SC_PAGE_SIZE')) // 1024
+
+
+def time_benchmark(func, scale, repeat):
+    run = func(scale)
+    times = []
+    for i in range(repeat):
+        start = time.time()
+        run()
+        times.append(time.time() - start)
+    times.sort()
+    return {
+        'best': times[0],
+        'median': times[len(times) // 2],
+        'repeat': repeat,
+        }
+
+
+def memory_benchmark(name, scale):
+    # Run in a child process so the peak isn't masked by earlier benchmarks
+    if tracemalloc is None and resource is None:
+        raise Skipped('neither tracemalloc nor resource is available')
+    output = subprocess.check_output([
+        sys.executable, os.path.abspath(__file__),
+        '--memory-child', name, '--scale', str(scale)])
+    return json.loads(output.decode('utf-8'))
+
+
+def memory_child(name, scale):
+    func = dict((n, f) for (n, _, f) in BENCHMARKS)[name]
+    if tracemalloc is not None:
+        tracemalloc.start()
+        result = func(scale)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        measured = {'peak_kb': peak / 1024, 'method': 'tracemalloc'}
+    else:
+        # Measure against the current size rather than the peak beforehand,
+        # which may be inflated by the imports
+        before = current_memory()
+        result = func(scale)
+        peak = max(0, peak_memory() - before)
+        measured = {
+            'peak_kb': peak,
+            'method': 'rss',
+            'below_resolution': peak < RSS_RESOLUTION,
+            }
+    del result
+    print(json.dumps(measured))
+
+
+def format_result(result):
+    if 'skipped' in result:
+        return 'skipped (%s)' % result['skipped']
+    elif result.get('below_resolution'):
+        return '%10s MB' % ('<%.1f' % (RSS_RESOLUTION / 1024))
+    elif 'peak_kb' in result:
+        return '%10.1f MB' % (result['peak_kb'] / 1024)
+    else:
+        return '%10.4f s' % result['best']
+
+
+def compare(old, new):
+    print()
+    print('%-28s %13s %13s %8s' % ('Benchmark', 'Before', 'After', 'Change'))
+    for name in sorted(new):
+        if name not in old:
+            continue
+        key = 'peak_kb' if 'peak_kb' in new[name] else 'best'
+        if key not in old[name] or key not in new[name]:
+            continue
+        change = (
+            '%+7.1f%%' % ((new[name][key] / old[name][key] - 1) * 100)
+            if old[name][key]
+            and not old[name].get('below_resolution')
+            and not new[name].get('below_resolution')
+            and old[name].get('method') == new[name].get('method')
+            else '')
+        print('%-28s %13s %13s %8s' % (
+            name, format_result(old[name]), format_result(new[name]),
+            change))
+
+
+def main(args=None):
+    parser = optparse.OptionParser(
+        usage='%prog [options] [pattern]...',
+        description='Runs the oxitopped benchmarks whose names match any of '
+        'the regular expressions given (or all of them)')
+    parser.set_defaults(
+        output='', compare='', scale=1.0, repeat=5, memory_child='')
+    parser.add_option(
+        '-o', '--output', dest='output', action='store',
+        help='save the results as JSON to the specified file')
+    parser.add_option(
+        '-c', '--compare', dest='compare', action='store',
+        help='compare the results with those saved in the specified file')
+    parser.add_option(
+        '-s', '--scale', dest='scale', action='store', type='float',
+        help='multiply the size of the data sets by the specified factor. '
+        'Default: %default')
+    parser.add_option(
+        '-r', '--repeat', dest='repeat', action='store', type='int',
+        help='the number of times to run each timing benchmark. '
+        'Default: %default')
+    parser.add_option(
+        '--memory-child', dest='memory_child', action='store',
+        help=optparse.SUPPRESS_HELP)
+    options, args = parser.parse_args(args)
+    if options.memory_child:
+        memory_child(options.memory_child, options.scale)
+        return 0
+    patterns = [re.compile(pattern) for pattern in args]
+    results = {}
+    for name, kind, func in BENCHMARKS:
+        if patterns and not any(p.search(name) for p in patterns):
+            continue
+        try:
+            if kind == 'memory':
+                results[name] = memory_benchmark(name, options.scale)
+            else:
+                results[name] = time_benchmark(
+                    func, options.scale, options.repeat)
+        except Skipped as exc:
+            results[name] = {'skipped': str(exc)}
+        results[name]['kind'] = kind
+        print('%-28s %s' % (name, format_result(results[name])))
+        sys.stdout.flush()
+    if options.output:
+        with open(options.output, 'w') as output:
+            output.write(json.dumps({
+                'version': __version__,
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'timestamp': datetime.now().isoformat(),
+                'scale': options.scale,
+                'repeat': options.repeat,
+                'results': results,
+                }, indent=4, sort_keys=True))
+    if options.compare:
+        with open(options.compare, 'r') as previous:
+            compare(json.loads(previous.read())['results'], results)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
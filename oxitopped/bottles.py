@@ -36,7 +36,8 @@ from __future__ import (
 from datetime import datetime, timedelta
 from collections import deque
 from itertools import islice
-from xml.etree.ElementTree import fromstring, tostring, Element, SubElement
+from xml.etree.ElementTree import fromstring
+from xml.sax.saxutils import quoteattr
 
 import serial
 
@@ -49,6 +50,14 @@ def xml(e, **args):
     return e.__xml__(**args)
 
 
+def xml_attrs(**attrs):
+    "Formats keyword arguments as XML attributes in the order tostring uses"
+    return ''.join(
+        ' %s=%s' % (name, quoteattr(value))
+        for (name, value) in sorted(attrs.items())
+        )
+
+
 class Bottle(object):
     """
     Represents a bottle as collected from an OxiTop OC110 Data Logger.
@@ -109,13 +118,23 @@ class Bottle(object):
             suffix = '%dh' % (duration.seconds // 3600)
         return '%s %s' % (prefix, suffix)
 
+    @property
+    def port(self):
+        "The name of the port of the data logger the bottle was retrieved from"
+        if self.logger is not None:
+            return self.logger.port.port
+        return None
+
     @property
     def completed(self):
         return 'Yes' if self.finish < datetime.now() else 'No'
 
     @classmethod
     def from_xml(cls, data, logger=None):
-        bottle_elem = fromstring(data)
+        return cls.from_element(fromstring(data), logger)
+
+    @classmethod
+    def from_element(cls, bottle_elem, logger=None):
         assert bottle_elem.tag == 'bottle'
         bottle = cls(
             bottle_elem.attrib['serial'],
@@ -161,7 +180,10 @@ class Bottle(object):
         return bottle
 
     def __xml__(self):
-        bottle_elem = Element('bottle', attrib=dict(
+        # The document is built as text rather than with ElementTree as an
+        # Element per reading is prohibitively slow for large bottles. The
+        # output is the same as tostring() would produce
+        result = ['<bottle%s>' % xml_attrs(
             serial=self.serial,
             id=str(self.id),
             start=self.start.isoformat(),
@@ -171,23 +193,34 @@ class Bottle(object):
             bottlevolume=str(self.bottle_volume),
             samplevolume=str(self.sample_volume),
             dilution=str(self.dilution),
-            ))
+            )]
         for head in self.heads:
-            head_elem = SubElement(bottle_elem, 'head', attrib=dict(
-                serial=head.serial,
-                ))
+            attrs = dict(serial=head.serial)
             if head.pressure_limit is not None:
-                head_elem.attrib['pressurelimit'] = str(head.pressure_limit)
-            auto_readings_elem = SubElement(head_elem, 'autoreadings')
-            for reading in head.auto_readings:
-                e = SubElement(auto_readings_elem, 'reading')
-                e.attrib['value'] = str(reading)
-            manual_readings_elem = SubElement(head_elem, 'manualreadings')
-            for timestamp, reading in head.manual_readings:
-                e = SubElement(manual_readings_elem, 'reading')
-                e.attrib['timestamp'] = str((timestamp - self.start).seconds)
-                e.attrib['value'] = str(reading)
-        return tostring(bottle_elem)
+                attrs['pressurelimit'] = str(head.pressure_limit)
+            result.append('<head%s>' % xml_attrs(**attrs))
+            if len(head.auto_readings):
+                result.append('<autoreadings>')
+                result.extend(
+                    '<reading value="%d" />' % reading
+                    for reading in head.auto_readings
+                    )
+                result.append('</autoreadings>')
+            else:
+                result.append('<autoreadings />')
+            if len(head.manual_readings):
+                result.append('<manualreadings>')
+                result.extend(
+                    '<reading timestamp="%d" value="%d" />' % (
+                        (timestamp - self.start).total_seconds(), reading)
+                    for timestamp, reading in head.manual_readings
+                    )
+                result.append('</manualreadings>')
+            else:
+                result.append('<manualreadings />')
+            result.append('</head>')
+        result.append('</bottle>')
+        return ''.join(result).encode(ENCODING)
 
     @classmethod
     def from_string(cls, data, logger=None):
@@ -392,7 +425,7 @@ class BottleHead(object):
                 # don't specify the head here
                 data = self.bottle.logger._GSNS(self.bottle.serial)
             else:
-                data = []
+                data = b''
             self._manual_readings = BottleManualReadings.from_string(self, data)
         return self._manual_readings
 
@@ -451,7 +484,9 @@ class BottleManualReadings(object):
             return (
                 '%d,\r' % len(self) +
                 ''.join(
-                    '%d,%d,\r' % ((timestamp - self.head.bottle.start).seconds, value)
+                    '%d,%d,\r' % (
+                        (timestamp - self.head.bottle.start).total_seconds(),
+                        value)
                     for (timestamp, value) in self
                     )
                 ).encode(ENCODING)
@@ -507,20 +542,31 @@ class BottleAutoReadings(object):
         assert len(readings) == readings_len
         return readings
 
-    def __str__(self):
-        return (','.join((
-            '%09d' % int(self.head.serial),
-            self.head.bottle.serial,
+    @staticmethod
+    def header_line(head, count):
+        "Returns the header line preceding `count` readings of `head`"
+        return ','.join((
+            '%09d' % int(head.serial),
+            head.bottle.serial,
             '1',
             '1',
             '247', # can be zero, but we've no idea what this means...
-            self.head.bottle.start.strftime(TIMESTAMP_FORMAT),
-            str(len(self)),
-            )) + '\r' +
-            ''.join(
-                ''.join(',%d' % reading for reading in chunk) + '\r'
-                for chunk in [self[i:i + 10] for i in range(0, len(self), 10)]
-                )
+            head.bottle.start.strftime(TIMESTAMP_FORMAT),
+            str(count),
+            )) + '\r'
+
+    @staticmethod
+    def reading_lines(readings):
+        "Returns the lines of the string form of `readings`, ten to a line"
+        return [
+            ''.join(',%d' % reading for reading in readings[i:i + 10]) + '\r'
+            for i in range(0, len(readings), 10)
+            ]
+
+    def __str__(self):
+        return (
+            self.header_line(self.head, len(self)) +
+            ''.join(self.reading_lines(self))
             ).encode(ENCODING)
 
     def __unicode__(self):
@@ -545,6 +591,21 @@ def moving_average(iterable, n):
         yield s / n
 
 
+def smoothed_readings(head, delta=False, points=1):
+    """
+    Generator which yields the moving average of a bottle head's
+    auto-readings, as DataAnalyzer.heads does, but without building a list of
+    them.
+
+    `head` : the bottle head to derive readings from
+    `delta` : if True, yield delta values instead of absolute pressures
+    `points` : the number of points to average for each reading (must be odd)
+    """
+    readings = head.auto_readings
+    base = readings[0] if delta and len(readings) else 0
+    return moving_average((reading - base for reading in readings), points)
+
+
 class DataAnalyzer(object):
     """
     Given a Bottle object, provides a moving average of head readings. The
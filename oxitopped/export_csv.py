@@ -30,10 +30,14 @@ import io
 import csv
 from itertools import izip_longest
 
-from oxitopped.bottles import DataAnalyzer
+from oxitopped.bottles import smoothed_readings
 
 
 class CsvExporter(object):
+    # The number of rows written between flushes of the output when exporting
+    # a bottle's readings
+    flush_rows = 1000
+
     def __init__(self):
         super(CsvExporter, self).__init__()
         self.delimiter = b','
@@ -84,11 +88,15 @@ class CsvExporter(object):
                 filename_or_obj.close()
 
     def export_bottle(self, filename_or_obj, bottle, delta=True, points=1):
+        # Rows are generated, smoothed and written one at a time (rather than
+        # building the full set of timestamps and averages up front as
+        # DataAnalyzer does) so memory use doesn't grow with the length of the
+        # run, and the output is flushed periodically so that consumers of a
+        # pipe see rows as they're produced
         owned = not hasattr(filename_or_obj, 'write')
         if owned:
             filename_or_obj = io.open(filename_or_obj, 'wb')
         try:
-            analyzer = DataAnalyzer(bottle, delta=delta, points=points)
             writer = csv.writer(filename_or_obj,
                 delimiter=self.delimiter,
                 lineterminator=self.lineterminator,
@@ -102,15 +110,62 @@ class CsvExporter(object):
                     'Offset',
                     ] + [
                     'Head %s' % head.serial
-                    for head in analyzer.bottle.heads
+                    for head in bottle.heads
                     ])
-            for row in izip_longest(
-                    range(len(analyzer.timestamps)),
-                    analyzer.timestamps,
-                    (str(t - analyzer.bottle.start) for t in analyzer.timestamps),
-                    *analyzer.heads):
-                writer.writerow(row)
+            heads = [
+                smoothed_readings(head, delta, points)
+                for head in bottle.heads
+                ]
+            for index, values in enumerate(izip_longest(*heads)):
+                offset = bottle.interval * (index + (points - 1) // 2)
+                writer.writerow(
+                    (index, bottle.start + offset, str(offset)) + values)
+                if not index % self.flush_rows:
+                    filename_or_obj.flush()
         finally:
             if owned:
                 filename_or_obj.close()
 
+    def export_readings(self, filename_or_obj, bottles, delta=True, points=1):
+        # Unlike export_bottle this writes one row per reading of each head so
+        # the readings of any number of bottles can go in a single file. Each
+        # head's readings are retrieved, smoothed and written in turn, and the
+        # output is flushed after each head so consumers see rows as soon as
+        # they're downloaded
+        owned = not hasattr(filename_or_obj, 'write')
+        if owned:
+            filename_or_obj = io.open(filename_or_obj, 'wb')
+        try:
+            writer = csv.writer(filename_or_obj,
+                delimiter=self.delimiter,
+                lineterminator=self.lineterminator,
+                quotechar=self.quotechar,
+                quoting=self.quoting,
+                doublequote=csv.excel.doublequote)
+            if self.header_row:
+                writer.writerow((
+                    'Serial',
+                    'Head',
+                    'No.',
+                    'Timestamp',
+                    'Offset',
+                    'Value',
+                    ))
+            for bottle in bottles:
+                for head in bottle.heads:
+                    for index, value in enumerate(
+                            smoothed_readings(head, delta, points)):
+                        offset = bottle.interval * (index + (points - 1) // 2)
+                        writer.writerow((
+                            bottle.serial,
+                            head.serial,
+                            index,
+                            (bottle.start + offset).strftime(
+                                self.timestamp_format),
+                            str(offset),
+                            value,
+                            ))
+                    filename_or_obj.flush()
+        finally:
+            if owned:
+                filename_or_obj.close()
@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+# vim: set et sw=4 sts=4:
+
+# Copyright 2012 Dave Hughes.
+#
+# This file is part of oxitopped.
+#
+# oxitopped is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# oxitopped is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# A PARTICULAR PURPOSE.  See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# oxitopped.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Module implementing NumPy exporters for bottles and bottle readings."""
+
+from __future__ import (
+    unicode_literals,
+    print_function,
+    absolute_import,
+    division,
+    )
+
+import os
+import io
+import shutil
+import zipfile
+import tempfile
+
+import numpy as np
+from numpy.lib import format as npy
+
+
+class NumpyExporter(object):
+    # Every export contains the details of the bottles as arrays with one
+    # element per bottle: serial, id, start, finish, interval, measurements,
+    # mode, bottle_volume, sample_volume, dilution, and heads. Timestamps are
+    # datetime64[s] and intervals timedelta64[s]. Readings are float64 arrays
+    # on a regular grid; reading n of a head was taken at first + n * interval
+    # (first is later than start when a moving average is exported)
+
+    # The name and dtype of each of the arrays describing the bottles, in the
+    # order of the values returned by _bottle_values
+    BOTTLE_ARRAYS = (
+        ('serial',        np.unicode_),
+        ('id',            np.int32),
+        ('start',         'datetime64[s]'),
+        ('finish',        'datetime64[s]'),
+        ('first',         'datetime64[s]'),
+        ('interval',      'timedelta64[s]'),
+        ('measurements',  np.int32),
+        ('mode',          np.unicode_),
+        ('bottle_volume', np.float64),
+        ('sample_volume', np.float64),
+        ('dilution',      np.int32),
+        ('heads',         np.int32),
+        )
+
+    def __init__(self):
+        super(NumpyExporter, self).__init__()
+        self.header_row = True
+
+    def _bottle_values(self, bottle, points):
+        return (
+            bottle.serial,
+            bottle.id,
+            bottle.start,
+            bottle.finish,
+            bottle.start + bottle.interval * ((points - 1) // 2),
+            int(bottle.interval.total_seconds()),
+            bottle.expected_measurements,
+            bottle.mode,
+            bottle.bottle_volume,
+            bottle.sample_volume,
+            bottle.dilution,
+            len(bottle.heads),
+            )
+
+    def _bottle_arrays(self, rows):
+        # Only the values of each bottle are held (not the bottles themselves)
+        # so the bottles can be produced and discarded one at a time
+        columns = list(zip(*rows)) or [()] * len(self.BOTTLE_ARRAYS)
+        return dict(
+            (name, np.array(list(column), dtype=dtype))
+            for ((name, dtype), column) in zip(self.BOTTLE_ARRAYS, columns)
+            )
+
+    def _head_readings(self, head, delta, points):
+        # Equivalent to DataAnalyzer.heads but vectorized
+        readings = np.array(head.auto_readings, dtype=np.float64)
+        if len(readings) < points:
+            return np.empty(0, dtype=np.float64)
+        if delta:
+            readings -= readings[0]
+        if points > 1:
+            readings = np.convolve(
+                readings, np.ones(points) / points, mode='valid')
+        return readings
+
+    def export_bottles(self, filename_or_obj, bottles):
+        np.savez(filename_or_obj, **self._bottle_arrays(
+            [self._bottle_values(bottle, 1) for bottle in bottles]))
+
+    def export_bottle(self, filename_or_obj, bottle, delta=True, points=1):
+        # The readings of all heads are stored as the rows of a single 2D
+        # array, padded with NaN where a head has fewer readings than others
+        arrays = self._bottle_arrays([self._bottle_values(bottle, points)])
+        heads = [
+            self._head_readings(head, delta, points)
+            for head in bottle.heads
+            ]
+        readings = np.empty(
+            (len(heads), max(len(head) for head in heads) if heads else 0),
+            dtype=np.float64)
+        readings.fill(np.nan)
+        for index, head in enumerate(heads):
+            readings[index, :len(head)] = head
+        arrays.update(
+            head_serial=np.array(
+                [head.serial for head in bottle.heads], dtype=np.unicode_),
+            readings=readings,
+            )
+        np.savez(filename_or_obj, **arrays)
+
+    def export_readings(self, filename_or_obj, bottles, delta=True, points=1):
+        # The readings of every head of every bottle are concatenated into a
+        # single flat readings array. Head n's readings are
+        # readings[head_offset[n]:head_offset[n] + head_count[n]] and belong to
+        # the bottle at index head_bottle[n] of the bottle arrays. The bottles
+        # are consumed one at a time and their readings spooled to a temporary
+        # file, so only the (small) per-bottle and per-head arrays are ever
+        # held in memory
+        rows = []
+        head_bottle = []
+        head_serial = []
+        head_count = []
+        with tempfile.TemporaryFile() as spool:
+            for index, bottle in enumerate(bottles):
+                rows.append(self._bottle_values(bottle, points))
+                for head in bottle.heads:
+                    readings = self._head_readings(head, delta, points)
+                    head_bottle.append(index)
+                    head_serial.append(head.serial)
+                    head_count.append(len(readings))
+                    spool.write(readings.tobytes())
+            arrays = self._bottle_arrays(rows)
+            head_count = np.array(head_count, dtype=np.int64)
+            arrays.update(
+                head_bottle=np.array(head_bottle, dtype=np.int32),
+                head_serial=np.array(head_serial, dtype=np.unicode_),
+                head_offset=np.cumsum(head_count) - head_count,
+                head_count=head_count,
+                )
+            spool.seek(0)
+            self._savez(
+                filename_or_obj, arrays, 'readings', spool,
+                int(head_count.sum()))
+
+    def _savez(self, filename_or_obj, arrays, name, spool, count):
+        # Equivalent to np.savez(filename_or_obj, name=readings, **arrays)
+        # where readings is the flat float64 array of count values in the
+        # file spool, which is copied into the archive without being loaded
+        if not hasattr(filename_or_obj, 'write') and not \
+                filename_or_obj.endswith('.npz'):
+            filename_or_obj += '.npz'
+        fd, tmpname = tempfile.mkstemp(suffix='-%s.npy' % name)
+        try:
+            with io.open(fd, 'wb') as tmp:
+                npy.write_array_header_1_0(tmp, {
+                    'descr': npy.dtype_to_descr(np.dtype(np.float64)),
+                    'fortran_order': False,
+                    'shape': (count,),
+                    })
+                shutil.copyfileobj(spool, tmp)
+            archive = zipfile.ZipFile(
+                filename_or_obj, 'w', zipfile.ZIP_STORED, allowZip64=True)
+            try:
+                for key, value in arrays.items():
+                    data = io.BytesIO()
+                    npy.write_array(data, value, allow_pickle=False)
+                    archive.writestr(key + '.npy', data.getvalue())
+                archive.write(tmpname, arcname=name + '.npy')
+            finally:
+                archive.close()
+        finally:
+            os.remove(tmpname)
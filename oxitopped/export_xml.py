@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+# vim: set et sw=4 sts=4:
+
+# Copyright 2012 Dave Hughes.
+#
+# This file is part of oxitopped.
+#
+# oxitopped is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# oxitopped is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# A PARTICULAR PURPOSE.  See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# oxitopped.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Module implementing XML exporters for bottles and bottle readings."""
+
+from __future__ import (
+    unicode_literals,
+    print_function,
+    absolute_import,
+    division,
+    )
+
+import io
+
+from oxitopped.bottles import xml
+
+
+class XmlExporter(object):
+    # The XML format holds complete bottles (details, auto-readings and manual
+    # readings) exactly as retrieved from the logger, so the files can be
+    # served by the emulator or read with --source. Hence every export
+    # includes the readings, and delta and points are ignored
+
+    def __init__(self):
+        super(XmlExporter, self).__init__()
+        self.header_row = True
+
+    def export_bottles(self, filename_or_obj, bottles):
+        # Bottles are converted and written one at a time (and the output
+        # flushed after each) so that memory use doesn't depend on the number
+        # of bottles
+        owned = not hasattr(filename_or_obj, 'write')
+        if owned:
+            filename_or_obj = io.open(filename_or_obj, 'wb')
+        try:
+            filename_or_obj.write(
+                b'<?xml version="1.0" encoding="UTF-8"?>\n<bottles>\n')
+            for bottle in bottles:
+                filename_or_obj.write(xml(bottle))
+                filename_or_obj.write(b'\n')
+                filename_or_obj.flush()
+            filename_or_obj.write(b'</bottles>\n')
+        finally:
+            if owned:
+                filename_or_obj.close()
+
+    def export_bottle(self, filename_or_obj, bottle, delta=True, points=1):
+        self.export_bottles(filename_or_obj, [bottle])
+
+    def export_readings(self, filename_or_obj, bottles, delta=True, points=1):
+        self.export_bottles(filename_or_obj, bottles)
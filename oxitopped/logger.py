@@ -21,10 +21,13 @@
 Defines the interfaces for gathering data from an OC110, and an OC110 emulator.
 
 This module defines a `DataLogger` class which provides an interface to the
-OC110 serial port. For testing purposes a "fake OC110" can be found in the
-`DummyLogger` class. This can be connected to an application with real serial
-ports or with instances of the `NullModem` class in the associated
-`oxitopped.nullmodem` module.
+OC110 serial port, and a `LoggerManager` class which queries several such
+loggers concurrently. For testing purposes a "fake OC110" can be found in the
+`DummyLogger` class (or the `FaultyLogger` class which injects faults into
+its replies), and several of these can be served by a handful of threads with
+the `DummyLoggerPool` class. This can be connected to an
+application with real serial ports or with instances of the `NullModem` class
+in the associated `oxitopped.nullmodem` module.
 """
 
 from __future__ import (
@@ -35,13 +38,28 @@ from __future__ import (
     )
 
 import time
+import random
 import logging
+from bisect import bisect_right
+from collections import deque
+from heapq import heappush, heappop
+from itertools import count
 from datetime import datetime, timedelta
-from threading import Thread
+from threading import Thread, Condition, RLock
+# datetime.strptime imports _strptime on first use, which isn't thread-safe
+# under Python 2; import it up front as the loggers of a LoggerManager parse
+# their bottles in separate threads
+import _strptime
+
+try:
+    from xml.etree.cElementTree import iterparse
+except ImportError:
+    from xml.etree.ElementTree import iterparse
 
 import serial
 
-from oxitopped.bottles import Bottle, BottleHead, ENCODING
+from oxitopped.bottles import (
+    Bottle, BottleHead, BottleAutoReadings, BottleManualReadings, ENCODING)
 
 
 class LoggerError(Exception):
@@ -92,6 +110,212 @@ class ChecksumMismatch(ReceiveError):
     """
 
 
+class LoggerStats(object):
+    """
+    Accumulates wire-level performance counters for a `DataLogger`. Latencies
+    are the time from the start of transmission of a command to the receipt of
+    the prompt following its reply. Throughput is measured from the first byte
+    of each reply to the prompt at its end, so that the time the unit takes to
+    start answering (`wait_time`) is excluded.
+
+    `baudrate` : the nominal baud rate of the serial port
+
+    `line_limited` : whether the port is actually limited by `baudrate`;
+    TCP connections, pseudo-terminals, and emulated ports aren't, so their
+    efficiency is meaningless
+    """
+
+    # Upper bounds (in seconds) of the latency histogram buckets; the last
+    # bucket catches everything larger
+    BUCKETS = (0.1, 0.2, 0.5, 1.0, 2.0, 5.0, 10.0, 20.0, 50.0)
+
+    def __init__(self, baudrate, line_limited=True):
+        super(LoggerStats, self).__init__()
+        self.baudrate = baudrate
+        self.line_limited = line_limited
+        self.reset()
+
+    def reset(self):
+        """
+        Reset all counters to zero.
+        """
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.wait_time = 0.0
+        self.transfer_time = 0.0
+        self.checksum_errors = 0
+        self.retries = 0
+        self.timeouts = 0
+        self.counts = {}
+        self.latencies = {}
+        self.histograms = {}
+
+    def record_latency(self, command, elapsed):
+        """
+        Record that a `command` took `elapsed` seconds to complete.
+
+        `command` : the name of the command (e.g. GMSK)
+        `elapsed` : the round-trip time of the command in seconds
+        """
+        self.counts[command] = self.counts.get(command, 0) + 1
+        self.latencies[command] = self.latencies.get(command, 0.0) + elapsed
+        histogram = self.histograms.setdefault(
+            command, [0] * (len(self.BUCKETS) + 1))
+        histogram[bisect_right(self.BUCKETS, elapsed)] += 1
+
+    def mean_latency(self, command):
+        """
+        Return the mean round-trip time of `command` in seconds, or None if
+        the command hasn't been sent.
+        """
+        if self.counts.get(command):
+            return self.latencies[command] / self.counts[command]
+        return None
+
+    @property
+    def throughput(self):
+        "The effective rate of reception in bytes per second"
+        if self.transfer_time:
+            return self.bytes_received / self.transfer_time
+        return 0.0
+
+    @property
+    def nominal_throughput(self):
+        "The maximum rate of reception at the baud rate (8N1) in bytes per second"
+        return self.baudrate / 10
+
+    @property
+    def efficiency(self):
+        """
+        The effective throughput as a proportion of the nominal throughput, or
+        None if the port isn't limited by its baud rate (or evidently exceeds
+        it, e.g. a USB adapter ignoring the configured rate)
+        """
+        if self.line_limited:
+            efficiency = self.throughput / self.nominal_throughput
+            if efficiency <= 1:
+                return efficiency
+        return None
+
+
+# Indicates whether the reply to each command ends with a checksum; None
+# indicates the command has no reply at all. Commands not listed are assumed to
+# have check-summed replies
+CHECKSUMS = {
+    'MAID': False,
+    'CLOC': None,
+    }
+
+
+class CommandRequest(object):
+    """
+    Represents a command submitted to a `DataLogger` for execution. This acts
+    as a future: `result` waits for the command to be executed and returns
+    its reply (or raises the exception that the command raised). Progress
+    notifications for the command are delivered by `result` in the thread
+    that calls it. Don't construct this class directly; use
+    `DataLogger.submit`.
+
+    `command` : the command to send
+    `args` : a sequence of arguments to send with the command
+    `progress` : (optional) triple of progress reporting functions (start, update, finish)
+    `background` : if True, the command yields to all foreground commands
+    """
+
+    def __init__(self, command, args, progress=None, background=False):
+        super(CommandRequest, self).__init__()
+        self.command = command
+        self.args = tuple(args)
+        self.checksum = CHECKSUMS.get(command, True)
+        self.progress = progress
+        self.background = background
+        self._cond = Condition()
+        self._done = False
+        self._result = None
+        self._exception = None
+        self._events = []
+        self._started = None
+        self._updated = None
+
+    def done(self):
+        """
+        Returns True if the command has been executed.
+        """
+        with self._cond:
+            return self._done
+
+    def wait(self):
+        """
+        Waits for the command to be executed without calling the progress
+        functions, leaving any notifications for `result`.
+        """
+        with self._cond:
+            while not self._done:
+                # Wait with a timeout to permit KeyboardInterrupt
+                self._cond.wait(1)
+
+    def attach(self, progress):
+        """
+        Deliver subsequent progress notifications to `progress`. If the reply
+        is already arriving, `result` first reports its start and the latest
+        update so that the caller sees the transfer from where it stands.
+
+        `progress` : triple of progress reporting functions (start, update, finish)
+        """
+        with self._cond:
+            self.progress = progress
+            if progress and self._started is not None:
+                self._events.append((0, self._started))
+                if self._updated is not None:
+                    self._events.append((1, self._updated))
+                self._cond.notify_all()
+
+    def result(self):
+        """
+        Waits for the command to be executed and returns its reply, calling
+        the progress functions (if any) as notifications arrive.
+        """
+        while True:
+            with self._cond:
+                while not self._events and not self._done:
+                    # Wait with a timeout to permit KeyboardInterrupt
+                    self._cond.wait(1)
+                events, self._events = self._events, []
+                done = self._done
+            for (index, args) in events:
+                if self.progress and self.progress[index]:
+                    self.progress[index](*args)
+            if done and not events:
+                break
+        if self._exception is not None:
+            raise self._exception
+        return self._result
+
+    def _notify(self, index, *args):
+        # Called by the execution thread to queue a progress notification;
+        # index is 0, 1 or 2 for start, update, or finish. The state of the
+        # reply is tracked even without progress functions so that `attach`
+        # can catch up
+        with self._cond:
+            if index == 0:
+                self._started, self._updated = args, None
+            elif index == 1:
+                self._updated = args
+            else:
+                self._started = self._updated = None
+            if self.progress:
+                self._events.append((index, args))
+                self._cond.notify_all()
+
+    def _complete(self, result=None, exception=None):
+        # Called by the execution thread with the outcome of the command
+        with self._cond:
+            self._result = result
+            self._exception = exception
+            self._done = True
+            self._cond.notify_all()
+
+
 class DataLogger(object):
     """
     Interfaces with the serial port of an OxiTop Data Logger and communicates
@@ -101,29 +325,151 @@ class DataLogger(object):
     `timeout` : the number of seconds to wait for a response before timing out
     `retries` : the number of retries to attempt in the case of invalid data
     `progress` : (optional) triple of progress reporting functions (start, update, finish)
+    `prefetch` : if True, download the readings of all bottles in the background
+    `progress_interval` : the minimum number of seconds between progress updates
+
+    The progress functions are called as start(expected) when a reply begins,
+    update(received, expected) as it arrives (no more often than
+    `progress_interval`), and finish() when it ends. `received` is the number
+    of bytes received so far, and `expected` the estimated total size of the
+    reply in bytes (or None if it can't be estimated). The size of GMSK replies
+    is estimated from the number of readings given in their first line; other
+    replies are assumed to be the same size as the last reply to the same
+    command.
+
+    Commands are executed by a background thread which owns the serial port;
+    any number of threads may `submit` commands, which are executed in the
+    order they were submitted (commands submitted by the prefetcher yield to
+    all others). Progress functions are called in the thread waiting for the
+    command's result.
+
+    Wire-level performance counters are accumulated in the `stats` attribute
+    (an instance of `LoggerStats`). If `prefetch` is enabled, the readings of
+    all bottles are downloaded by a `ReadingsPrefetcher` thread after the
+    bottle list is retrieved.
     """
 
-    def __init__(self, port, retries=3, progress=None):
+    # The maximum number of bytes to read from the port at once
+    READ_SIZE = 4096
+
+    def __init__(
+            self, port, retries=3, progress=None, prefetch=False,
+            progress_interval=0.1):
         super(DataLogger, self).__init__()
         self.port = port
         if self.port.timeout is None or self.port.timeout == 0:
             raise ValueError('serial port timeout must be a positive integer')
         self.retries = retries
-        self._progress_start = self._progress_update = self._progress_finish = None
-        if progress is not None:
-            (   self._progress_start,
-                self._progress_update,
-                self._progress_finish,
-            ) = progress
+        self.progress_interval = progress_interval
+        self._progress = progress
+        self._reply_sizes = {}
         self._bottles = None
+        self._bottles_lock = RLock()
         self._seen_prompt = False
-        # Ensure the port is connected to an OC110 by requesting the
-        # manufacturer's ID
-        logging.debug('DTE: Testing for known response from MAID command')
-        self.id = self._MAID().rstrip('\r')
-        if self.id != 'OC110':
-            raise UnexpectedReply(
-                'Unexpected manufacturer ID: %s' % self.id)
+        self._pending = b''
+        self._request = None
+        self._queue = []
+        self._queue_cond = Condition()
+        self._counter = count()
+        self._closed = False
+        self.stats = LoggerStats(
+            self.port.baudrate, isinstance(self.port, serial.Serial))
+        self._executor = Thread(target=self._execute_loop)
+        self._executor.daemon = True
+        self._executor.start()
+        try:
+            # Ensure the port is connected to an OC110 by requesting the
+            # manufacturer's ID
+            logging.debug('DTE: Testing for known response from MAID command')
+            self.id = self._MAID().rstrip('\r')
+            if self.id != 'OC110':
+                raise UnexpectedReply(
+                    'Unexpected manufacturer ID: %s' % self.id)
+        except:
+            self._shutdown()
+            raise
+        self._prefetcher = ReadingsPrefetcher(self) if prefetch else None
+
+    def submit(self, command, *args, **kwargs):
+        """
+        Queues `command` (with optional `args`) for execution and returns a
+        `CommandRequest` whose `result` method returns the reply. Replies with
+        checksums are verified, and the command retried up to `retries` times
+        in the event of a mismatch.
+
+        `command` : The command to send
+        `background` : (keyword only) if True, the command yields to all
+        foreground commands and reports no progress
+        """
+        background = kwargs.get('background', False)
+        request = CommandRequest(
+            command, args,
+            progress=None if background else self._progress,
+            background=background)
+        with self._queue_cond:
+            if self._closed:
+                raise LoggerError('The data logger has been closed')
+            heappush(self._queue, (
+                1 if background else 0, next(self._counter), request))
+            self._queue_cond.notify_all()
+        return request
+
+    def _execute_loop(self):
+        """
+        The main method of the execution thread. Executes submitted commands
+        in order until the logger is closed.
+        """
+        while True:
+            with self._queue_cond:
+                while not self._queue and not self._closed:
+                    self._queue_cond.wait()
+                if not self._queue:
+                    break
+                (_, _, request) = heappop(self._queue)
+            self._request = request
+            try:
+                result = self._execute(request)
+            except Exception as exc:
+                request._complete(exception=exc)
+            else:
+                request._complete(result=result)
+            finally:
+                self._request = None
+
+    def _execute(self, request):
+        """
+        Sends the command of `request` to the OC110 and returns the response.
+        """
+        if request.checksum is None:
+            start = time.time()
+            self._tx(request.command, *request.args)
+            if request.command == 'CLOC':
+                self._seen_prompt = False
+            self.stats.record_latency(request.command, time.time() - start)
+            return None
+        for retry in range(self.retries):
+            if retry:
+                self.stats.retries += 1
+            start = time.time()
+            try:
+                self._tx(request.command, *request.args)
+                result = self._rx(
+                    checksum=request.checksum, command=request.command)
+            except ChecksumMismatch as exc:
+                e = exc
+            else:
+                self.stats.record_latency(request.command, time.time() - start)
+                return result
+        raise e
+
+    def _shutdown(self):
+        """
+        Stops the execution thread once all submitted commands are executed.
+        """
+        with self._queue_cond:
+            self._closed = True
+            self._queue_cond.notify_all()
+        self._executor.join()
 
     def _tx(self, command, *args):
         """
@@ -138,11 +484,12 @@ class DataLogger(object):
             self.port.open()
         if not self._seen_prompt:
             self.port.flushInput()
+            self._pending = b''
             # If we've not seen the ">" prompt yet, prod the unit repeatedly
             # until we see it or hit the retries limit
             for i in range(self.retries):
                 logging.debug('DTE: no prompt seen, prodding unit')
-                self.port.write('\r\n')
+                self.stats.bytes_sent += self.port.write(b'\r\n')
                 try:
                     response += self._rx(checksum=False)
                 except TimeoutError:
@@ -160,38 +507,88 @@ class DataLogger(object):
         data = ','.join([command] + [str(arg) for arg in args]) + '\r\n'
         logging.debug('DTE TX: %s' % data.rstrip('\r\n'))
         written = self.port.write(data.encode(ENCODING))
+        self.stats.bytes_sent += written
         if written != len(data):
             raise PartialSend(
                 'Only wrote first %d bytes of %d' % (written, len(data)))
 
-    def _rx(self, checksum=True):
+    def _rx(self, checksum=True, command=None):
         """
         Receives a response from the OC110. If checksum is True, also checks
         that the transmitted checksum matches the transmitted data.
 
         `checksum` : If true, treat the last line of the repsonse as a checksum
+        `command` : The command the response is to (for progress estimates)
         """
-        response = ''
-        if self._progress_start:
-            self._progress_start()
+        chunks = []
+        request = self._request
+        expected = self._reply_sizes.get(command)
+        estimated = command != 'GMSK'
+        debug = logging.getLogger().isEnabledFor(logging.DEBUG)
+        line = ''
+        last = ''
+        received = 0
+        request._notify(0, expected)
+        start = last_update = time.time()
+        first = None
         try:
-            while '>\r' not in response:
-                data = self.port.read().decode(ENCODING)
-                if not data:
-                    raise TimeoutError('Failed to read any data before timeout')
-                elif data == '\n':
-                    # Chuck away any LFs; these only appear in the BIOS output on
-                    # unit startup and mess up line splits later on
-                    continue
-                elif data == '\r':
-                    logging.debug('DTE RX: %s' % response.split('\r')[-1])
-                    if self._progress_update:
-                        self._progress_update()
-                response += data
+            while True:
+                if self._pending:
+                    # Left over from the read that completed the last reply
+                    data, self._pending = self._pending, b''
+                else:
+                    # Read whatever has arrived in one go, or block (up to the
+                    # port's timeout) for a single byte if nothing has
+                    data = self.port.read(
+                        max(1, min(self.port.inWaiting(), self.READ_SIZE)))
+                    if not data:
+                        self.stats.timeouts += 1
+                        raise TimeoutError(
+                            'Failed to read any data before timeout')
+                    received += len(data)
+                    self.stats.bytes_received += len(data)
+                now = time.time()
+                if first is None:
+                    first = now
+                # Chuck away any LFs; these only appear in the BIOS output on
+                # unit startup and mess up line splits later on
+                data = data.decode(ENCODING).replace('\n', '')
+                # Look for the prompt, allowing for it straddling two reads
+                end = (last + data).find('>\r')
+                if end != -1:
+                    end += 2 - len(last)
+                    self._pending = data[end:].encode(ENCODING)
+                    data = data[:end]
+                chunks.append(data)
+                if debug and '\r' in data:
+                    lines = (line + data).split('\r')
+                    for line in lines[:-1]:
+                        logging.debug('DTE RX: %s' % line)
+                    line = lines[-1]
+                if not estimated and '\r' in data:
+                    response = ''.join(chunks)
+                    if response.count('\r') >= 2:
+                        estimated = True
+                        expected = self._expected_readings_size(
+                            response, expected)
+                if end != -1:
+                    break
+                if data:
+                    last = data[-1:]
+                if now - last_update >= self.progress_interval:
+                    last_update = now
+                    request._notify(1, received, expected)
             self._seen_prompt = True
+            if command is not None:
+                self._reply_sizes[command] = received
         finally:
-            if self._progress_finish:
-                self._progress_finish()
+            if first is None:
+                self.stats.wait_time += time.time() - start
+            else:
+                self.stats.wait_time += first - start
+                self.stats.transfer_time += time.time() - first
+            request._notify(2)
+        response = ''.join(chunks)
         # Split the response on the CRs and strip off the prompt at the end
         response = response.split('\r')[:-2]
         # If we're expecting a check-sum, check the last line for one and
@@ -207,51 +604,69 @@ class DataLogger(object):
                 ''.join(line + '\r' for line in response)
                 )
             if checksum_received != checksum_calculated:
+                self.stats.checksum_errors += 1
                 raise ChecksumMismatch('Checksum does not match data')
         # Return the reconstructed response (without prompt or checksum)
         return ''.join(line + '\r' for line in response)
 
+    def _expected_readings_size(self, response, expected):
+        """
+        Estimates the total size of a GMSK reply from the partial `response`
+        received so far, which must include the header line (which includes
+        the number of readings) and the first line of readings. The size of
+        the remaining readings is extrapolated from these. If the header can't
+        be parsed, `expected` is returned unchanged.
+        """
+        lines = response.split('\r', 2)
+        if len(lines) != 3:
+            return expected
+        header, first, _ = lines
+        try:
+            readings_len = int(header.rsplit(',', 1)[-1])
+        except ValueError:
+            return expected
+        # Assume all lines of readings are the length of the first (including
+        # its line break), and allow for the checksum line and prompt
+        values = max(1, first.count(','))
+        return int(
+            len(header) + 1 +
+            (len(first) + 1) * readings_len / values +
+            len(',000000\r>\r'))
+
+    def _query(self, command, *args):
+        """
+        Sends `command` (with optional `args`) to the OC110 and returns the
+        response, waiting for any previously submitted commands first.
+        """
+        return self.submit(command, *args).result()
+
     def _MAID(self):
         """
         Sends a MAID (MAnufacturer ID) command to the OC110 and returns the
         response.
         """
-        self._tx('MAID')
-        return self._rx(checksum=False)
+        return self._query('MAID')
 
     def _CLOC(self):
         """
         Sends a CLOC (CLOse Connection) command to the OC110 and sets RTS to
         low (indicating we're going to stop talking to it).
         """
-        self._tx('CLOC')
-        self._seen_prompt = False
+        self._query('CLOC')
 
     def _GAPB(self):
         """
         Sends a GAPB (Get All Pressure Bottles) command to the OC110 and
         returns the data received.
         """
-        for retry in range(self.retries):
-            try:
-                self._tx('GAPB')
-                return self._rx()
-            except ChecksumMismatch as exc:
-                e = exc
-        raise e
+        return self._query('GAPB')
 
     def _GPRB(self, bottle):
         """
         Sends a GPRB (Get PRessure Bottle) command to the OC110 and returns
         the data received.
         """
-        for retry in range(self.retries):
-            try:
-                self._tx('GPRB', bottle)
-                return self._rx()
-            except ChecksumMismatch as exc:
-                e = exc
-        raise e
+        return self._query('GPRB', bottle)
 
     def _GSNS(self, bottle):
         """
@@ -260,51 +675,53 @@ class DataLogger(object):
         bottle head when operating in pressure mode (this command isn't issued
         against bottles run in any of the BOD modes).
         """
-        for retry in range(self.retries):
-            try:
-                self._tx('GSNS', bottle)
-                return self._rx()
-            except ChecksumMismatch as exc:
-                e = exc
-        raise e
+        data = None
+        if self._prefetcher is not None:
+            data = self._prefetcher.fetch('GSNS', bottle)
+        if data is None:
+            data = self._query('GSNS', bottle)
+        return data
 
     def _GMSK(self, bottle, head):
         """
         Sends a GMSK (Get ... erm ... bottle head readings - no idea how they
         get MSK out of that) command to the OC110. Returns the data received.
         """
-        for retry in range(self.retries):
-            try:
-                self._tx('GMSK', bottle, head)
-                return self._rx()
-            except ChecksumMismatch as exc:
-                e = exc
-        raise e
+        data = None
+        if self._prefetcher is not None:
+            data = self._prefetcher.fetch('GMSK', bottle, head)
+        if data is None:
+            data = self._query('GMSK', bottle, head)
+        return data
 
     @property
     def bottles(self):
         """
         Return all bottles stored on the connected device.
         """
-        if self._bottles is None:
-            # Use the GAPB command to retrieve the details of all bottles
-            # stored in the device
-            data = self._GAPB()
-            self._bottles = []
-            bottle = ''
-            # Split the response into individual bottles and their head line(s)
-            for line in data.split('\r')[:-1]:
-                if not line.startswith(','):
-                    if bottle:
-                        self._bottles.append(
-                            Bottle.from_string(bottle, logger=self))
-                    bottle = line + '\r'
-                else:
-                    bottle += line + '\r'
-            if bottle:
-                self._bottles.append(
-                    Bottle.from_string(bottle, logger=self))
-        return self._bottles
+        with self._bottles_lock:
+            if self._bottles is None:
+                # Use the GAPB command to retrieve the details of all bottles
+                # stored in the device
+                data = self._GAPB()
+                self._bottles = []
+                bottle = ''
+                # Split the response into individual bottles and their head
+                # line(s)
+                for line in data.split('\r')[:-1]:
+                    if not line.startswith(','):
+                        if bottle:
+                            self._bottles.append(
+                                Bottle.from_string(bottle, logger=self))
+                        bottle = line + '\r'
+                    else:
+                        bottle += line + '\r'
+                if bottle:
+                    self._bottles.append(
+                        Bottle.from_string(bottle, logger=self))
+                if self._prefetcher is not None:
+                    self._prefetcher.enqueue(self._bottles)
+            return self._bottles
 
     def bottle(self, serial):
         """
@@ -325,159 +742,912 @@ class DataLogger(object):
         data = self._GPRB(serial)
         return Bottle.from_string(data, logger=self)
 
+    def download(self, bottles=None):
+        """
+        Retrieve the readings of the specified bottles (or all bottles on the
+        device if none are specified) so that subsequent accesses are served
+        from memory.
+
+        `bottles` : (optional) the sequence of bottles to retrieve readings for
+        """
+        if bottles is None:
+            bottles = self.bottles
+        for bottle in bottles:
+            for head in bottle.heads:
+                head.auto_readings
+                head.manual_readings
+
     def refresh(self):
         """
         Force the details of all bottles to be re-read on next access.
         """
         self._bottles = None
+        if self._prefetcher is not None:
+            self._prefetcher.clear()
 
     def close(self):
         """
         Tell the logger to close its connection and reset.
         """
+        if self._prefetcher is not None:
+            self._prefetcher.terminate()
+        if not self._closed:
+            if self.port.isOpen():
+                self._CLOC()
+            self._shutdown()
         if self.port.isOpen():
-            self._CLOC()
             self.port.close()
 
 
+class ReadingsPrefetcher(Thread):
+    """
+    Downloads the readings of bottle heads from a `DataLogger` in a background
+    thread. Bottles are downloaded in the order they are queued, except that a
+    bottle whose readings are requested is moved to the front of the queue.
+    The raw replies are held in memory until the logger asks for them. If the
+    logger asks for a reply that is still arriving, the transfer's progress is
+    reported to the logger's progress functions while it waits.
+    Don't construct this class directly; pass prefetch=True to `DataLogger`.
+
+    `logger` : the data logger to download readings from
+    """
+
+    def __init__(self, logger):
+        super(ReadingsPrefetcher, self).__init__()
+        self.daemon = True
+        self.terminated = False
+        self.logger = logger
+        self._cond = Condition()
+        self._counter = count()
+        self._queue = []
+        self._pending = {}
+        self._replies = {}
+        self._current = None
+        self._generation = 0
+        self.start()
+
+    def enqueue(self, bottles):
+        """
+        Queue the specified bottles for download.
+
+        `bottles` : the sequence of bottles to download the readings of
+        """
+        with self._cond:
+            for bottle in bottles:
+                if bottle.serial not in self._pending:
+                    self._pending[bottle.serial] = bottle
+                    heappush(self._queue, (1, next(self._counter), bottle.serial))
+            self._cond.notify_all()
+
+    def clear(self):
+        """
+        Discard all queued bottles and all downloaded replies.
+        """
+        with self._cond:
+            self._generation += 1
+            self._queue = []
+            self._pending = {}
+            self._replies = {}
+            self._cond.notify_all()
+
+    def terminate(self):
+        """
+        Stop the background thread, waiting for any download in progress to
+        finish.
+        """
+        with self._cond:
+            self.terminated = True
+            self._cond.notify_all()
+        self.join()
+
+    def fetch(self, command, *args):
+        """
+        Return the reply to `command` (GMSK or GSNS) with `args`, moving the
+        associated bottle to the front of the queue and waiting for it if
+        necessary. Returns None if the reply is not, and will not be,
+        available from the prefetcher, in which case the caller should query
+        the logger itself.
+
+        `command` : the command that the reply is required for
+        """
+        key = (command,) + tuple(str(arg) for arg in args)
+        serial = key[1]
+        progress = self.logger._progress
+        with self._cond:
+            if serial in self._pending and key not in self._replies:
+                heappush(self._queue, (0, next(self._counter), serial))
+                self._cond.notify_all()
+        while True:
+            with self._cond:
+                if (key in self._replies or serial not in self._pending
+                        or not self.is_alive()):
+                    request = self._replies.pop(key, None)
+                    break
+                current = self._current
+                if current is None or current.done():
+                    self._cond.wait(0.1)
+                    continue
+            # Until the prefetcher reaches the reply, report the progress of
+            # the transfer it is waiting on
+            current.attach(progress)
+            try:
+                current.result()
+            except Exception:
+                # The prefetcher deals with failures of its own requests
+                pass
+        if request is None:
+            return None
+        # The reply may still be arriving; report its progress from this
+        # thread rather than waiting silently
+        request.attach(progress)
+        try:
+            return request.result()
+        except LoggerError as exc:
+            logging.debug('DTE: prefetch of %s failed: %s' % (serial, exc))
+            return None
+
+    def run(self):
+        while True:
+            with self._cond:
+                while not self.terminated and not self._queue:
+                    self._cond.wait()
+                if self.terminated:
+                    break
+                (_, _, serial) = heappop(self._queue)
+                bottle = self._pending.get(serial)
+                generation = self._generation
+            if bottle is None:
+                # Already downloaded, or a stale queue entry from a promotion
+                continue
+            try:
+                self._download(bottle, generation)
+            except LoggerError as exc:
+                # Leave the bottle to be downloaded in the foreground when
+                # something asks for it
+                logging.debug('DTE: prefetch of %s failed: %s' % (serial, exc))
+            finally:
+                with self._cond:
+                    if generation == self._generation:
+                        self._pending.pop(serial, None)
+                    self._cond.notify_all()
+
+    def _download(self, bottle, generation):
+        requests = [('GMSK', bottle.serial, head.serial) for head in bottle.heads]
+        if bottle.mode == 'pressure':
+            requests.append(('GSNS', bottle.serial))
+        for key in requests:
+            if self.terminated or generation != self._generation:
+                break
+            # The request itself is stored so that fetch can wait for it
+            # (and report its progress) before the reply has arrived
+            request = self.logger.submit(*key, background=True)
+            with self._cond:
+                self._current = request
+                if generation == self._generation:
+                    self._replies[key] = request
+                self._cond.notify_all()
+            try:
+                request.wait()
+            finally:
+                with self._cond:
+                    self._current = None
+                    if (request._exception is not None and
+                            self._replies.get(key) is request):
+                        del self._replies[key]
+                    self._cond.notify_all()
+            if request._exception is not None:
+                raise request._exception
+
+
+def concurrent_map(func, iterable):
+    """
+    Calls `func` with each item of `iterable`, each in its own thread, and
+    returns a list of the results in the same order as the items. If any call
+    raises an exception, the first (in item order) is re-raised once all
+    threads have finished.
+
+    `func` : the function to call with each item
+    `iterable` : the items to call the function with
+    """
+    items = list(iterable)
+    results = [None] * len(items)
+    errors = [None] * len(items)
+    def worker(index, item):
+        try:
+            results[index] = func(item)
+        except Exception as exc:
+            errors[index] = exc
+    threads = [
+        Thread(target=worker, args=(index, item))
+        for (index, item) in enumerate(items)
+        ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    for error in errors:
+        if error is not None:
+            raise error
+    return results
+
+
+class LoggerManager(object):
+    """
+    Manages several OxiTop Data Loggers, each connected to its own serial
+    port, and talks to all of them concurrently. The bottles of all loggers are
+    presented as a single collection; the `port` attribute of each bottle
+    indicates the logger it was retrieved from. The interface mirrors that of
+    `DataLogger` so the two can be used interchangeably.
+
+    `ports` : a sequence of serial ports, one for each data logger
+    `retries` : the number of retries to attempt in the case of invalid data
+    `progress` : (optional) triple of progress reporting functions (start, update, finish)
+    `prefetch` : if True, download the readings of all bottles in the background
+    `progress_interval` : the minimum number of seconds between progress updates
+    """
+
+    def __init__(
+            self, ports, retries=3, progress=None, prefetch=False,
+            progress_interval=0.1):
+        super(LoggerManager, self).__init__()
+        ports = list(ports)
+        if not ports:
+            raise ValueError('at least one serial port must be specified')
+        loggers = [None] * len(ports)
+        def connect(index):
+            loggers[index] = DataLogger(
+                ports[index], retries, progress, prefetch, progress_interval)
+        try:
+            concurrent_map(connect, range(len(ports)))
+        except:
+            # Don't leave the successfully connected loggers hanging when
+            # another failed to connect
+            for logger in loggers:
+                if logger is not None:
+                    logger.close()
+            raise
+        self.loggers = loggers
+        self._bottles = None
+
+    @property
+    def bottles(self):
+        """
+        Return all bottles stored on all connected devices.
+        """
+        if self._bottles is None:
+            self._bottles = [
+                bottle
+                for bottles in concurrent_map(
+                    lambda logger: logger.bottles, self.loggers)
+                for bottle in bottles
+                ]
+        return self._bottles
+
+    def bottle(self, serial, port=None):
+        """
+        Return a bottle with a specific serial number. If several devices
+        store a bottle with the same serial number, `port` must be specified
+        to pick between them.
+
+        `serial` : the serial number of the bottle to retrieve
+        `port` : (optional) the name of the port of the device to retrieve
+        the bottle from
+        """
+        bottles = [
+            bottle for bottle in self.bottles
+            if bottle.serial == serial and port in (None, bottle.port)
+            ]
+        if not bottles:
+            raise ValueError('%s is not a valid bottle serial number' % serial)
+        elif len(bottles) > 1:
+            raise ValueError(
+                '%s is stored on several data loggers (%s); specify the port' % (
+                    serial, ', '.join(bottle.port for bottle in bottles)))
+        return bottles[0]
+
+    def download(self, bottles=None):
+        """
+        Retrieve the readings of the specified bottles (or all bottles on all
+        devices if none are specified). Each device is queried in its own
+        thread so the total time is that of the slowest device.
+
+        `bottles` : (optional) the sequence of bottles to retrieve readings for
+        """
+        if bottles is None:
+            bottles = self.bottles
+        bottles = list(bottles)
+        concurrent_map(
+            lambda logger: logger.download(
+                bottle for bottle in bottles if bottle.logger is logger),
+            self.loggers)
+
+    def refresh(self):
+        """
+        Force the details of all bottles to be re-read on next access.
+        """
+        self._bottles = None
+        for logger in self.loggers:
+            logger.refresh()
+
+    def close(self):
+        """
+        Tell all loggers to close their connections and reset.
+        """
+        concurrent_map(lambda logger: logger.close(), self.loggers)
+
+
+class FileLogger(object):
+    """
+    Presents the bottles stored in an XML file (in the format produced by
+    `write_bottles`, or served by the emulator) through the same interface as
+    `DataLogger`. The file is read straight into memory with no serial port
+    or emulator involved, so archived readings can be listed or re-exported
+    almost instantly.
+
+    `filename` : the name of the XML file to load bottles from
+    """
+
+    def __init__(self, filename):
+        super(FileLogger, self).__init__()
+        self.filename = filename
+        self._bottles = []
+        # Parse incrementally, discarding each bottle's elements once it's
+        # been converted, so that the whole document tree is never held
+        for event, elem in iterparse(filename):
+            if elem.tag == 'bottle':
+                self._bottles.append(Bottle.from_element(elem))
+                elem.clear()
+
+    @property
+    def bottles(self):
+        """
+        Return all bottles stored in the file.
+        """
+        return self._bottles
+
+    def bottle(self, serial):
+        """
+        Return a bottle with a specific serial number.
+
+        `serial` : the serial number of the bottle to retrieve
+        """
+        for bottle in self._bottles:
+            if bottle.serial == serial:
+                return bottle
+        raise ValueError('%s is not a valid bottle serial number' % serial)
+
+    def download(self, bottles=None):
+        """
+        Does nothing; the readings of all bottles are loaded with the file.
+
+        `bottles` : (optional) ignored
+        """
+        pass
+
+    def refresh(self):
+        """
+        Does nothing; the file is only read once.
+        """
+        pass
+
+    def close(self):
+        """
+        Does nothing; the file is closed once it has been read.
+        """
+        pass
+
+
 class DummyLogger(Thread):
     """
     Emulates an OxiTop OC110 Data Logger for testing. Can be combined with
     DummySerial below for a complete testing solution without having to involve
     a physical serial port.
 
+    Commands are dispatched through the `handlers` mapping which associates
+    each command name with a (method name, argument count) tuple. Commands
+    with the wrong number of arguments are answered with INVALID COMMAND;
+    otherwise the method is called with the command's arguments and returns
+    the data to send back (without the trailing prompt). Descendents can
+    support further commands by extending the mapping, e.g.::
+
+        class MyLogger(DummyLogger):
+            handlers = dict(DummyLogger.handlers, FOO=('do_FOO', 0))
+
+            def do_FOO(self):
+                return 'BAR\\r'
+
     `port` : the serial port that the emulated data logger should listen to
     `bottles` : the sequence of bottles that the emulated logger will serve
+    `threaded` : if False, the emulator's thread is not started and the
+    emulator must be driven by calling `poll` (see `DummyLoggerPool`)
+    `clock` : (optional) a callable returning the current time for the unit,
+    such as a `SimulatedClock`. If specified, the bottles' readings are
+    treated as the complete runs and only those taken by the current time
+    are served. Otherwise all readings are served
     """
 
-    def __init__(self, port, bottles):
+    handlers = {
+        'MAID': ('do_MAID', 0),
+        'CLOC': ('do_CLOC', 0),
+        'GAPB': ('do_GAPB', 0),
+        'GPRB': ('do_GPRB', 1),
+        'GSNS': ('do_GSNS', 1),
+        'GMSK': ('do_GMSK', 2),
+        }
+
+    def __init__(self, port, bottles, threaded=True, clock=None):
         super(DummyLogger, self).__init__()
         self.terminated = False
         self.port = port
+        self.clock = clock
         self._sent_prompt = False
+        self._buffer = bytearray()
+        self._restarted = 0
+        self._rebooting = False
+        self._lines = {}
+        self._output = deque()
+        self._paused = None
         assert self.port.timeout > 0
         assert self.port.bytesize == serial.EIGHTBITS
         assert self.port.parity == serial.PARITY_NONE
         assert self.port.stopbits == serial.STOPBITS_ONE
         # Set up the list of gas bottles and pressure readings
         self.bottles = bottles
+        self._bottles_by_serial = dict(
+            (bottle.serial, bottle) for bottle in bottles)
         # Start the emulator thread
-        self.start()
+        if threaded:
+            self.start()
 
-    def run(self):
+    def startup(self):
         """
-        The main method of the background thread. Waits for OC110 commands and
-        acts upon them when received.
+        Opens the port and sends the unit's start-up banner.
         """
-        buf = ''
         if not self.port.isOpen():
             self.port.open()
         # On start-up, device sends some BIOS crap, regardless of whether or
         # not anything is listening
-        self.port.write('\r\n')
-        self.port.write('BIOS OC Version 1.0\r\n')
+        self.send('\r\nBIOS OC Version 1.0\r\n')
+
+    def run(self):
+        """
+        The main method of the background thread. Waits for OC110 commands and
+        acts upon them when received.
+        """
+        self.startup()
+        self.transmit()
         while not self.terminated:
-            buf += self.port.read().decode('ASCII')
-            while '\r\n' in buf:
-                command, buf = buf.split('\r\n', 1)
-                logging.debug('DCE RX: %s' % command)
-                if ',' in command:
-                    command = command.split(',')
-                    command, args = command[0], command[1:]
-                else:
-                    args = []
-                self.handle(command, *args)
+            delay = self._restarted - time.time()
+            if delay > 0:
+                time.sleep(delay)
+            if self._rebooting:
+                self._reboot()
+                self.transmit()
+            # Block for the first byte (up to the port's timeout), then grab
+            # whatever else has arrived in one go
+            data = self.port.read(1)
+            if data:
+                waiting = self.port.inWaiting()
+                if waiting:
+                    data += self.port.read(waiting)
+                self.feed(data)
+                self.transmit()
         self.port.close()
 
+    def poll(self):
+        """
+        Executes any commands waiting at the port without blocking. Returns
+        True if any data was read from the port.
+        """
+        if time.time() < self._restarted:
+            return False
+        if self._rebooting:
+            self._reboot()
+        waiting = self.port.inWaiting()
+        if waiting:
+            self.feed(self.port.read(waiting))
+        return bool(waiting)
+
+    def _reboot(self):
+        # Called once a restart has finished to send the start-up banner
+        self._rebooting = False
+        self.startup()
+
+    def feed(self, data):
+        """
+        Appends `data` (received from the port) to the command buffer and
+        executes any complete commands found within it.
+
+        `data` : the bytes received from the port
+        """
+        self._buffer += data
+        start = 0
+        while True:
+            end = self._buffer.find(b'\r\n', start)
+            if end == -1:
+                break
+            line = bytes(self._buffer[start:end]).decode('ASCII')
+            start = end + 2
+            logging.debug('DCE RX: %s' % line)
+            args = line.split(',')
+            self.handle(args[0], *args[1:])
+        if start:
+            del self._buffer[:start]
+
     def send(self, data, checksum=False):
         """
-        Sends data over the serial port with an optional checksum suffix. The
-        method ensures the port is open, RTS is set, and CTS is received before
-        beginning transmission.
+        Queues data for transmission over the serial port with an optional
+        checksum suffix. Queued data is written to the port by `transmit`.
         """
-        if not self.port.isOpen():
-            self.port.open()
         if data:
-            for line in data.strip('\r').split('\r'):
-                logging.debug('DCE TX: %s' % line)
-            self.port.write(data)
+            if logging.getLogger().isEnabledFor(logging.DEBUG):
+                for line in data.strip('\r').split('\r'):
+                    logging.debug('DCE TX: %s' % line)
             if checksum:
-                value = sum(ord(c) for c in data)
-                self.send(',%d\r' % value, checksum=False)
+                data = self.checksummed(data)
+            self._output.append(data.encode('ASCII'))
+
+    def pause(self, delay):
+        """
+        Delays the transmission of anything sent after this call by `delay`
+        seconds (once everything sent before it has been transmitted).
+        """
+        self._output.append(delay)
+
+    def transmit(self, limit=None):
+        """
+        Writes data queued by `send` to the port and returns the number of
+        bytes written. If `limit` is specified, at most that many bytes are
+        written and the method returns rather than waiting for a pause to
+        elapse, so that a thread serving several units can interleave their
+        replies. Otherwise, everything queued is written.
+
+        `limit` : (optional) the maximum number of bytes to write
+        """
+        written = 0
+        while self._output and (limit is None or written < limit):
+            item = self._output[0]
+            if not isinstance(item, bytes):
+                now = time.time()
+                if self._paused is None:
+                    self._paused = now + item
+                if now < self._paused:
+                    if limit is not None:
+                        break
+                    time.sleep(self._paused - now)
+                self._paused = None
+                self._output.popleft()
+                continue
+            if limit is not None and len(item) > limit - written:
+                self._output[0] = item[limit - written:]
+                item = item[:limit - written]
+            else:
+                self._output.popleft()
+            if not self.port.isOpen():
+                self.port.open()
+            self.port.write(item)
+            written += len(item)
+        return written
 
     def handle(self, command, *args):
         """
         Executes the OC110 ``command`` with the specified ``args``
         """
-        if command == 'MAID':
-            # MAnufacturer IDentifier; OC110 sends 'OC110'
-            self.send('OC110\r')
-        elif command == 'CLOC':
-            # CLOse Connection; OC110 sends a return, a prompt, closes the
-            # connection, then re-opens it, and finally sends the 'LOGON'
-            # prompt
-            self.send('\r')
-            self.send('>\r')
-            self.port.close()
-            self._sent_prompt = False
-            # Emulate the unit taking a half second to restart
-            time.sleep(0.5)
-        elif command == 'GAPB':
-            # Get All Pressure Bottles command returns the header details of
-            # all bottles and their heads
-            data = ''.join(str(bottle) for bottle in self.bottles)
-            self.send(data, checksum=True)
-        elif command == 'GPRB':
-            # Get PRessure Bottle command returns the details of the specified
-            # bottle and its heads
-            if len(args) != 1:
-                self.send('INVALID COMMAND\r')
-            else:
-                try:
-                    bottle = self.bottle_by_serial(args[0])
-                except ValueError:
-                    self.send(',\r')
-                else:
-                    self.send(str(bottle), checksum=True)
-        elif command == 'GSNS':
-            # GSNS returns all manual-readings from the specified bottle
-            if len(args) != 1:
-                self.send('INVALID COMMAND\r')
-            else:
-                try:
-                    bottle = self.bottle_by_serial(args[0])
-                except ValueError:
-                    self.send(',\r')
-                else:
-                    self.send(str(bottle.head[0].manual_readings), checksum=True)
-        elif command.startswith('GMSK'):
-            # GMSK returns all auto-readings from a specified bottle head
-            if len(args) != 2:
-                self.send('INVALID COMMAND\r')
+        try:
+            name, arity = self.handlers[command]
+        except KeyError:
+            if not self._sent_prompt:
+                self._sent_prompt = True
+                response = 'LOGON\r'
             else:
-                try:
-                    bottle = self.bottle_by_serial(args[0])
-                except ValueError:
-                    self.send(',\r')
-                for head in bottle.heads:
-                    if head.serial == args[1]:
-                        break
-                    head = None
-                if not head:
-                    self.send(',\r')
-                self.send(str(head.auto_readings), checksum=True)
-        elif not self._sent_prompt:
-            self.send('LOGON\r')
-            self._sent_prompt = True
+                response = 'INVALID COMMAND\r'
         else:
-            self.send('INVALID COMMAND\r')
+            if len(args) == arity:
+                response = getattr(self, name)(*args)
+            else:
+                response = 'INVALID COMMAND\r'
+        self.reply(response or '')
+
+    def reply(self, response):
+        """
+        Sends `response` to a command, followed by the prompt.
+        """
+        self.send(response)
         self.send('>\r')
 
+    def do_MAID(self):
+        # MAnufacturer IDentifier; OC110 sends 'OC110'
+        return 'OC110\r'
+
+    def do_CLOC(self):
+        # CLOse Connection; OC110 sends a return, a prompt, closes the
+        # connection, then re-opens it, and finally sends the 'LOGON' prompt
+        self.send('\r')
+        self.send('>\r')
+        self.transmit()
+        self.port.close()
+        self._sent_prompt = False
+        # Emulate the unit taking a half second to restart; input isn't read
+        # until then
+        self._restarted = time.time() + 0.5
+
+    def do_GAPB(self):
+        # Get All Pressure Bottles command returns the header details of all
+        # bottles and their heads
+        return self.checksummed(
+            ''.join(self.bottle_string(bottle) for bottle in self.bottles))
+
+    def do_GPRB(self, serial):
+        # Get PRessure Bottle command returns the details of the specified
+        # bottle and its heads
+        try:
+            bottle = self.bottle_by_serial(serial)
+        except ValueError:
+            return ',\r'
+        return self.checksummed(self.bottle_string(bottle))
+
+    def do_GSNS(self, serial):
+        # GSNS returns all manual-readings from the specified bottle
+        try:
+            bottle = self.bottle_by_serial(serial)
+        except ValueError:
+            return ',\r'
+        readings = bottle.heads[0].manual_readings
+        if self.clock is not None:
+            now = self.clock()
+            readings = BottleManualReadings(bottle.heads[0], [
+                (timestamp, value)
+                for (timestamp, value) in readings
+                if timestamp <= now
+                ])
+        return self.checksummed(str(readings))
+
+    def do_GMSK(self, serial, head_serial):
+        # GMSK returns all auto-readings from a specified bottle head
+        try:
+            bottle = self.bottle_by_serial(serial)
+        except ValueError:
+            return ',\r'
+        for head in bottle.heads:
+            if head.serial == head_serial:
+                return self.checksummed(self.readings_string(head))
+        return ',\r'
+
+    def bottle_string(self, bottle):
+        """
+        Returns the header details of `bottle` as sent by GAPB and GPRB. If the
+        unit has a clock, the completion flag reflects its time.
+        """
+        data = str(bottle)
+        if self.clock is not None:
+            header, heads = data.split('\r', 1)
+            fields = header.split(',')
+            # The eighth field is 2 for finished runs and 1 otherwise (see
+            # Bottle.__str__)
+            fields[7] = '2' if bottle.finish < self.clock() else '1'
+            data = ','.join(fields) + '\r' + heads
+        return data
+
+    def readings_string(self, head):
+        """
+        Returns the auto-readings of `head` as sent by GMSK. If the unit has a
+        clock, only the readings taken by its time are included. The lines of
+        readings are formatted once and cached so that serving a growing
+        prefix of them doesn't reformat every reading on every request.
+        """
+        readings = head.auto_readings
+        count = len(readings)
+        if self.clock is not None:
+            elapsed = (self.clock() - head.bottle.start).total_seconds()
+            interval = head.bottle.interval.total_seconds()
+            if elapsed < 0:
+                count = 0
+            elif interval:
+                count = min(count, int(elapsed // interval) + 1)
+        try:
+            lines = self._lines[head]
+        except KeyError:
+            lines = self._lines[head] = BottleAutoReadings.reading_lines(
+                readings)
+        full, remainder = divmod(count, 10)
+        return ''.join(
+            [BottleAutoReadings.header_line(head, count)] + lines[:full] + (
+                BottleAutoReadings.reading_lines(
+                    readings[full * 10:count]) if remainder else []))
+
+    def checksummed(self, data):
+        """
+        Returns `data` suffixed with the checksum line the OC110 appends to
+        the responses of the data retrieval commands.
+        """
+        return data + ',%d\r' % sum(bytearray(data.encode('ASCII')))
+
     def bottle_by_serial(self, serial):
-        for bottle in self.bottles:
-            if bottle.serial == serial:
-                return bottle
-        raise ValueError('%s is not a valid bottle serial number')
+        try:
+            return self._bottles_by_serial[serial]
+        except KeyError:
+            raise ValueError('%s is not a valid bottle serial number' % serial)
+
+
+class SimulatedClock(object):
+    """
+    A callable returning the current time of a simulated clock which runs
+    `speed` times faster than real time. Several emulated units may share a
+    clock.
+
+    `start` : (optional) the simulated time when the clock is constructed,
+    which defaults to the current time
+    `speed` : the multiple of real time at which the clock runs
+    """
+
+    def __init__(self, start=None, speed=1.0):
+        super(SimulatedClock, self).__init__()
+        if speed <= 0:
+            raise ValueError('speed must be a positive number')
+        self.start = datetime.now() if start is None else start
+        self.speed = speed
+        self._origin = time.time()
+
+    def __call__(self):
+        return self.start + timedelta(
+            seconds=(time.time() - self._origin) * self.speed)
+
+
+class FaultyLogger(DummyLogger):
+    """
+    A `DummyLogger` which injects faults into its communication with the
+    specified probabilities, for testing and benchmarking how the client
+    recovers from line noise and misbehaving units. The following faults are
+    supported:
+
+    ``checksum``
+        the checksum of a reply is corrupted
+    ``drop``
+        a byte is dropped from a reply
+    ``delay``
+        the prompt following a reply is delayed by `delay` seconds
+    ``partial``
+        only part of a reply is sent, and no prompt follows it
+    ``banner``
+        the BIOS start-up banner is sent before a reply
+    ``restart``
+        the unit ignores a command and restarts, as it does after CLOC, and
+        sends its start-up banner once it has restarted
+
+    `port` : the serial port that the emulated data logger should listen to
+    `bottles` : the sequence of bottles that the emulated logger will serve
+    `faults` : a mapping of fault names to the probability (between 0 and 1)
+    of each command suffering that fault
+    `delay` : the number of seconds by which delayed prompts are delayed
+    `seed` : (optional) the seed for the random number generator, to produce
+    a repeatable sequence of faults
+    `threaded` : if False, the emulator's thread is not started
+    `clock` : (optional) a callable returning the current time for the unit
+    """
+
+    FAULTS = ('checksum', 'drop', 'delay', 'partial', 'banner', 'restart')
+
+    def __init__(
+            self, port, bottles, faults, delay=1.0, seed=None, threaded=True,
+            clock=None):
+        for fault, probability in faults.items():
+            if fault not in self.FAULTS:
+                raise ValueError('unknown fault %s' % fault)
+            if not (0.0 <= probability <= 1.0):
+                raise ValueError(
+                    'probability of %s must be between 0 and 1' % fault)
+        self.faults = dict(faults)
+        self.delay = delay
+        self._random = random.Random(seed)
+        super(FaultyLogger, self).__init__(port, bottles, threaded, clock)
+
+    def fault(self, name):
+        """
+        Returns True if the fault `name` should be injected into the current
+        command.
+        """
+        result = self._random.random() < self.faults.get(name, 0.0)
+        if result:
+            logging.debug('DCE: injecting %s fault' % name)
+        return result
 
+    def handle(self, command, *args):
+        if self.fault('restart'):
+            # Anything not yet transmitted is lost with the restart
+            self._output.clear()
+            self._paused = None
+            self.port.close()
+            self._sent_prompt = False
+            # The start-up banner is sent once the unit has finished
+            # restarting (see poll and run)
+            self._restarted = time.time() + 0.5
+            self._rebooting = True
+        else:
+            super(FaultyLogger, self).handle(command, *args)
+
+    def reply(self, response):
+        if self.fault('banner'):
+            self.send('\r\nBIOS OC Version 1.0\r\n')
+        lines = response.split('\r')
+        if (
+                len(lines) > 1 and lines[-2][1:].isdigit() and
+                lines[-2].startswith(',') and self.fault('checksum')):
+            lines[-2] = ',%d' % (int(lines[-2][1:]) + 1)
+            response = '\r'.join(lines)
+        if response and self.fault('drop'):
+            index = self._random.randrange(len(response))
+            response = response[:index] + response[index + 1:]
+        if response and self.fault('partial'):
+            self.send(response[:self._random.randrange(len(response))])
+            return
+        self.send(response)
+        if self.fault('delay'):
+            self.pause(self.delay)
+        self.send('>\r')
+
+
+class DummyLoggerPool(object):
+    """
+    Serves several emulated data loggers from a small pool of worker threads
+    instead of a thread per logger. Each worker is assigned a share of the
+    loggers and polls their ports in turn, sleeping for `interval` seconds
+    whenever none of them has any input waiting or output to write.
+
+    Replies are written at most `WRITE_SIZE` bytes per logger on each pass,
+    so that a long reply (such as a GMSK of thousands of readings) doesn't
+    stall the other loggers served by the same worker.
+
+    Provides the `terminated` attribute, and the `is_alive` and `join`
+    methods of a `DummyLogger` thread so the pool can be used in place of
+    one.
+
+    `loggers` : the `DummyLogger` instances to serve, which must have been
+    constructed with `threaded` set to False
+    `workers` : the maximum number of worker threads to use
+    `interval` : the number of seconds an idle worker waits between polls
+    """
+
+    # The maximum number of bytes written to each port per pass; at 9600 baud
+    # this takes about 67ms
+    WRITE_SIZE = 64
+
+    def __init__(self, loggers, workers=4, interval=0.01):
+        super(DummyLoggerPool, self).__init__()
+        self.terminated = False
+        self.loggers = list(loggers)
+        self.interval = interval
+        workers = max(1, min(workers, len(self.loggers)))
+        self._workers = [
+            Thread(target=self._serve, args=(self.loggers[i::workers],))
+            for i in range(workers)
+            ]
+        for worker in self._workers:
+            worker.start()
+
+    def _serve(self, loggers):
+        for logger in loggers:
+            logger.startup()
+        try:
+            while not self.terminated:
+                busy = False
+                for logger in loggers:
+                    if logger.poll():
+                        busy = True
+                    if logger.transmit(self.WRITE_SIZE):
+                        busy = True
+                if not busy:
+                    time.sleep(self.interval)
+        finally:
+            for logger in loggers:
+                if logger.port.isOpen():
+                    logger.port.close()
 
+    def is_alive(self):
+        return any(worker.is_alive() for worker in self._workers)
 
+    def join(self, timeout=None):
+        if timeout is not None:
+            timeout += time.time()
+        for worker in self._workers:
+            worker.join(
+                None if timeout is None else max(0, timeout - time.time()))
@@ -29,7 +29,6 @@ from __future__ import (
     )
 
 import time
-from collections import deque
 from threading import Condition
 
 import serial
@@ -38,18 +37,21 @@ import serial
 def null_modem(
         baudrate=9600, bytesize=serial.EIGHTBITS, parity=serial.PARITY_NONE,
         stopbits=serial.STOPBITS_ONE, timeout=None, xonxoff=False,
-        rtscts=False, writeTimeout=None, dsrdtr=False, interCharTimeout=None):
+        rtscts=False, writeTimeout=None, dsrdtr=False, interCharTimeout=None,
+        throttle=True):
     """
     Construct both ends of a null-modem cable, returning a tuple of two serial
-    ports. All parameters are the same as the pyserial Serial class.
+    ports. All parameters are the same as the pyserial Serial class, except
+    `throttle` which can be set to False to transfer data as fast as possible
+    instead of at the specified baud rate (useful for tests and benchmarks).
     """
     port1 = NullModem(
             'DTE', baudrate, bytesize, parity, stopbits, timeout,
-            xonxoff, rtscts, writeTimeout, dsrdtr, interCharTimeout
+            xonxoff, rtscts, writeTimeout, dsrdtr, interCharTimeout, throttle
             )
     port2 = NullModem(
             'DCE', baudrate, bytesize, parity, stopbits, timeout,
-            xonxoff, rtscts, writeTimeout, dsrdtr, interCharTimeout
+            xonxoff, rtscts, writeTimeout, dsrdtr, interCharTimeout, throttle
             )
     port1._other = port2
     port2._other = port1
@@ -60,16 +62,25 @@ class NullModem(object):
     """
     Emulates one end of a null modem. Don't construct this class directly, but
     use the null_modem routine below to construct both ends of the null-modem.
-    All parameters are equivalent to the pyserial Serial class.
+    All parameters are equivalent to the pyserial Serial class, except
+    `throttle` (see below).
+
+    Writes are paced with a token bucket so that data arrives at the other end
+    at the rate the baud rate (and framing) would allow, in bursts of at most
+    `BURST` bytes, much as a UART's FIFO would deliver it. If `throttle` is
+    False, written data is available to the other end immediately.
 
     Note: do not instantiate this class directly; use the `null_modem` function
     to instantiate two at once and associate each with the other.
     """
 
+    # The number of bytes which may be transmitted back-to-back
+    BURST = 16
+
     def __init__(self, port=None, baudrate=9600, bytesize=serial.EIGHTBITS,
             parity=serial.PARITY_NONE, stopbits=serial.STOPBITS_ONE,
             timeout=None, xonxoff=False, rtscts=False, writeTimeout=None,
-            dsrdtr=False, interCharTimeout=None):
+            dsrdtr=False, interCharTimeout=None, throttle=True):
         super(NullModem, self).__init__()
         self.port = port
         self.name = port
@@ -83,10 +94,16 @@ class NullModem(object):
         self.dsrdtr = dsrdtr
         self.writeTimeout = writeTimeout
         self.interCharTimeout = interCharTimeout
+        self.throttle = throttle
+        self._tokens = self.BURST
+        self._refilled = time.time()
         self._other = None
         self._rts = False
         self._lock = Condition()
-        self._buf = deque()
+        # Received data lives in _buf from offset _head onwards; consumed
+        # space at the front is reclaimed once it exceeds half the buffer
+        self._buf = bytearray()
+        self._head = 0
         self._opened = False
         if self.port:
             self.open()
@@ -119,7 +136,8 @@ class NullModem(object):
 
     def flushInput(self):
         with self._lock:
-            self._buf = deque()
+            self._buf = bytearray()
+            self._head = 0
 
     def flushOutput(self):
         pass
@@ -166,37 +184,98 @@ class NullModem(object):
     def getRI(self):
         raise NotImplementedError
 
+    def _consume(self, size):
+        # Returns a memoryview of (up to) the next size bytes of the buffer
+        # and marks them as read. Must be called with _lock held, and the
+        # view released before the buffer is next modified
+        size = min(size, len(self._buf) - self._head)
+        result = memoryview(self._buf)[self._head:self._head + size]
+        self._head += size
+        return result
+
+    def _compact(self):
+        # Must be called with _lock held and no views of the buffer in
+        # existence
+        if self._head == len(self._buf):
+            del self._buf[:]
+            self._head = 0
+        elif self._head > len(self._buf) // 2:
+            del self._buf[:self._head]
+            self._head = 0
+
+    def _wait(self, size):
+        # Waits until at least size bytes are available, or the timeout
+        # elapses. Must be called with _lock held
+        if self.timeout is None:
+            while len(self._buf) - self._head < size:
+                self._lock.wait()
+        else:
+            deadline = time.time() + self.timeout
+            while len(self._buf) - self._head < size:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                self._lock.wait(remaining)
+
     def readinto(self, b):
-        # XXX Should implement this from read()
-        raise NotImplementedError
+        assert self._opened
+        b = memoryview(b)
+        with self._lock:
+            self._wait(len(b))
+            data = self._consume(len(b))
+            size = len(data)
+            b[:size] = data
+            del data
+            self._compact()
+        return size
 
     def inWaiting(self):
         with self._lock:
-            return len(self._buf)
+            return len(self._buf) - self._head
 
     def read(self, size=1):
         assert self._opened
-        start = time.time()
-        result = b''
-        while len(result) < size and (
-                self.timeout is None or time.time() < start + self.timeout):
-            with self._lock:
-                if self._buf:
-                    result += self._buf.popleft()
-                else:
-                    self._lock.wait(0.1)
-        assert len(result) <= size
+        with self._lock:
+            self._wait(size)
+            data = self._consume(size)
+            result = data.tobytes()
+            del data
+            self._compact()
         return result
 
     def write(self, data):
         assert self._opened
-        for byte in data:
-            with self._other._lock:
-                if self._other._opened:
-                    self._other._buf.append(byte)
-                    self._other._lock.notify()
-            # Pause for the amount of time it would take to send data
-            time.sleep(10.0 / self.baudrate)
+        data = bytes(data)
+        if not self.throttle:
+            self._transmit(data)
+            return len(data)
+        # Start bit, data bits, parity bit (if any) and stop bits
+        rate = self.baudrate / (
+            1 + self.bytesize + (self.parity != serial.PARITY_NONE) +
+            self.stopbits)
+        sent = 0
+        while sent < len(data):
+            now = time.time()
+            self._tokens = min(
+                self.BURST, self._tokens + (now - self._refilled) * rate)
+            self._refilled = now
+            count = min(len(data) - sent, int(self._tokens))
+            if count:
+                self._transmit(data[sent:sent + count])
+                self._tokens -= count
+                sent += count
+            else:
+                # Wait for enough tokens to send half a burst; leaving room
+                # in the bucket means oversleeping doesn't lose any time
+                time.sleep((
+                    min(self.BURST // 2, len(data) - sent) - self._tokens) /
+                    rate)
         return len(data)
 
+    def _transmit(self, data):
+        with self._other._lock:
+            if self._other._opened:
+                self._other._buf += data
+                self._other._lock.notify()
+
 
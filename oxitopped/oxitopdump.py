@@ -30,10 +30,12 @@ from __future__ import (
     )
 
 import os
+import re
 import sys
 import csv
-import fnmatch
 from datetime import datetime
+from threading import Thread
+from Queue import Queue, Empty, Full
 
 from oxitopped.terminal import OxiTopApplication
 
@@ -51,22 +53,74 @@ QUOTING = {
     'nonnumeric': csv.QUOTE_NONNUMERIC,
     }
 
+
+def get(queue):
+    """
+    Returns the next item from `queue`, waiting for it in a way which doesn't
+    block KeyboardInterrupt.
+    """
+    while True:
+        try:
+            return queue.get(timeout=0.1)
+        except Empty:
+            pass
+
+
+def put(queue, item):
+    """
+    Puts `item` on `queue`, waiting for space in a way which doesn't block
+    KeyboardInterrupt.
+    """
+    while True:
+        try:
+            return queue.put(item, timeout=0.1)
+        except Full:
+            pass
+
+
+class FilenameBottle(object):
+    """
+    Wraps a bottle for substitution into a filename template. Characters of
+    its string attributes which can't safely appear in a filename (like the
+    slashes and colons of a port such as socket://host:port) are replaced
+    with underscores.
+
+    `bottle` : the bottle to wrap
+    """
+
+    def __init__(self, bottle):
+        self._bottle = bottle
+
+    def __getattr__(self, name):
+        value = getattr(self._bottle, name)
+        if isinstance(value, (bytes, type(''))):
+            value = re.sub(r'[^\w.-]+', '_', value).strip('_')
+        return value
+
+
 class DumpApplication(OxiTopApplication):
     """
     %prog [options] [bottle-serial]... filename
 
     This utility dumps the sample readings stored on a connected OxiTop Data
-    Logger to files in CSV or Excel format. If bottle-serial values are
-    specified, the details of those bottles and all heads attached to them will
-    be exported, otherwise a list of all available bottles is exported.
+    Logger to files in CSV, Excel, NumPy, or XML format. If bottle-serial values
+    or filter options are specified, the details of the selected bottles and
+    all heads attached to them will be exported, otherwise a list of all
+    available bottles is exported.
     The bottle-serial values may include *, ?, and [] wildcards. The filename
     value may include references to bottle attributes like {bottle.serial} or
     {bottle.id} (and must if the bottle-serial expansion results in more than
-    one bottle's readings being retrieved).
+    one bottle's readings being retrieved), unless --all-readings is used to
+    export every reading to a single file. Bottles can also be selected by
+    the details in their headers with the filter options. If --port is specified several
+    times, all the data loggers are queried concurrently. When exporting
+    several bottles, each file is written while the readings of the next
+    bottles are downloaded.
     """
 
     def __init__(self):
         super(DumpApplication, self).__init__()
+        self.add_client_options()
         self.parser.set_defaults(
             delimiter=',',
             lineterminator='dos',
@@ -77,6 +131,8 @@ class DumpApplication(OxiTopApplication):
             row_colors=False,
             delta=True,
             points=1,
+            jobs=1,
+            all_readings=False,
             )
         self.parser.add_option(
             '-a', '--absolute', dest='delta', action='store_false',
@@ -115,11 +171,167 @@ class DumpApplication(OxiTopApplication):
             '-T', '--timestamp-format', dest='timestamp_format', action='store',
             help='specifies the formatting of timestamps in the output file. '
             'Defaults to %default (.csv only)')
+        self.parser.add_option(
+            '-j', '--jobs', dest='jobs', action='store',
+            help='specifies the number of threads writing output files while '
+            'the readings of further bottles are downloaded. Defaults to '
+            '%default')
+        self.parser.add_option(
+            '-A', '--all-readings', dest='all_readings', action='store_true',
+            help='if specified, export the readings of all heads of the '
+            'selected bottles (or all bottles) to a single file with one row '
+            'per reading (.csv and .npz only; .xml files always contain all '
+            'readings)')
+        self.add_filter_options()
+
+    def release_readings(self, bottles):
+        """
+        Generator which yields each of `bottles` and, once the consumer has
+        finished with it, discards its readings so that memory use doesn't
+        grow with the number of bottles.
+
+        `bottles` : the sequence of bottles to yield
+        """
+        for bottle in bottles:
+            yield bottle
+            self.release_bottle(bottle)
+
+    def release_bottle(self, bottle):
+        """
+        Discards the readings of `bottle` (if they can be downloaded again).
+
+        `bottle` : the bottle to discard the readings of
+        """
+        if bottle.logger is not None:
+            for head in bottle.heads:
+                head.refresh()
+
+    def download_pipelined(self, items, depth):
+        """
+        Generator which downloads the readings of the bottles in `items` and
+        yields each item once its bottle's readings are downloaded. One thread
+        per data logger drives its serial port, so the bottles of several data
+        loggers are downloaded concurrently and the items are yielded in the
+        order their downloads complete (which is their original order for a
+        single data logger). At most `depth` downloaded items wait to be
+        consumed.
+
+        If the consumer stops early (or is interrupted), the data logger is
+        closed so that no further downloads are started.
+
+        `items` : a sequence of tuples, the first element of which is a bottle
+        `depth` : the maximum number of downloaded items waiting to be consumed
+        """
+        # Each data logger can only talk about one bottle at a time, so group
+        # the bottles by logger (preserving their order) and give each logger
+        # its own downloading thread
+        loggers = []
+        groups = {}
+        for item in items:
+            # Bottles loaded from a file have no logger of their own
+            logger = item[0].logger or self.data_logger
+            if logger not in groups:
+                loggers.append(logger)
+                groups[logger] = []
+            groups[logger].append(item)
+        queue = Queue(maxsize=depth)
+        errors = []
+        stopped = []
+        def download(logger):
+            try:
+                for item in groups[logger]:
+                    if errors or stopped:
+                        break
+                    logger.download([item[0]])
+                    queue.put(item)
+            except Exception as exc:
+                errors.append(exc)
+            finally:
+                queue.put(None)
+        # Daemon threads so that an interrupted export never leaves the
+        # process waiting for them
+        for logger in loggers:
+            thread = Thread(target=download, args=(logger,))
+            thread.daemon = True
+            thread.start()
+        remaining = len(loggers)
+        try:
+            while remaining:
+                item = get(queue)
+                if item is None:
+                    remaining -= 1
+                elif not errors:
+                    yield item
+            if errors:
+                raise errors[0]
+        finally:
+            if remaining:
+                # Closing the data logger makes any further command fail, so
+                # the downloading threads stop once their current command
+                # completes. Drain the queue so that none is left blocked on it
+                stopped.append(True)
+                self.data_logger.close()
+                while remaining:
+                    if get(queue) is None:
+                        remaining -= 1
+
+    def export_pipelined(self, exporter, bottles, jobs, delta, points):
+        """
+        Exports the readings of `bottles` to their files, overlapping the
+        download of each bottle's readings with the export of those already
+        downloaded. The bottles are downloaded by `download_pipelined` and
+        passed through a bounded queue to `jobs` threads which write the
+        files. Each bottle's readings are discarded once its file is written,
+        so memory use doesn't grow with the number of bottles.
+
+        `exporter` : the exporter to write each file with
+        `bottles` : a sequence of (bottle, filename) tuples
+        `jobs` : the number of threads writing files
+        `delta` : passed to the exporter's export_bottle method
+        `points` : passed to the exporter's export_bottle method
+        """
+        queue = Queue(maxsize=jobs)
+        errors = []
+        def export():
+            while True:
+                item = queue.get()
+                if item is None:
+                    break
+                # After a failure keep draining the queue so that the
+                # main thread is never left blocked on it
+                if not errors:
+                    bottle, filename = item
+                    try:
+                        exporter.export_bottle(
+                            filename, bottle, delta=delta, points=points)
+                    except Exception as exc:
+                        errors.append(exc)
+                    finally:
+                        self.release_bottle(bottle)
+        exporters = [Thread(target=export) for i in range(jobs)]
+        for thread in exporters:
+            thread.daemon = True
+            thread.start()
+        try:
+            for item in self.download_pipelined(bottles, jobs):
+                if errors:
+                    break
+                put(queue, item)
+        finally:
+            for thread in exporters:
+                put(queue, None)
+            # Join with a timeout so that KeyboardInterrupt isn't blocked
+            for thread in exporters:
+                while thread.is_alive():
+                    thread.join(0.1)
+        if errors:
+            raise errors[0]
 
     def main(self, options, args):
-        super(DumpApplication, self).main(options, args)
+        # Validate all options before any port is opened
         if len(args) < 1:
             self.parser.error('you must specify an output filename')
+        filtered = self.parse_filter_options(options)
         try:
             options.points = int(options.points)
         except ValueError:
@@ -128,7 +340,17 @@ class DumpApplication(OxiTopApplication):
         if options.points % 2 == 0:
             self.parser.error(
                 '--moving-average value must be an odd number')
-        ext = os.path.splitext(args[-1])[-1].lower()
+        try:
+            options.jobs = int(options.jobs)
+        except ValueError:
+            self.parser.error('--jobs value must be an integer number')
+        if options.jobs < 1:
+            self.parser.error('--jobs value must be at least 1')
+        # Output to stdout is always in CSV format
+        if args[-1] == '-':
+            ext = '.csv'
+        else:
+            ext = os.path.splitext(args[-1])[-1].lower()
         try:
             if ext == '.csv':
                 from oxitopped.export_csv import CsvExporter
@@ -154,6 +376,15 @@ class DumpApplication(OxiTopApplication):
                         'invalid value for --timestamp-format: %s' % str(exc))
                 else:
                     exporter.timestamp_format = options.timestamp_format
+            elif ext == '.xml':
+                from oxitopped.export_xml import XmlExporter
+                exporter = XmlExporter()
+            elif ext == '.npz':
+                from oxitopped.export_npz import NumpyExporter
+                exporter = NumpyExporter()
+            elif options.all_readings:
+                self.parser.error(
+                    '--all-readings can only export to .csv, .npz, or .xml')
             elif ext == '.xls':
                 from oxitopped.export_xls import ExcelExporter
                 exporter = ExcelExporter()
@@ -163,54 +394,55 @@ class DumpApplication(OxiTopApplication):
         except ImportError:
             self.parser.error(
                 'unable to load exporter for file extension %s' % ext)
+        super(DumpApplication, self).main(options, args)
         filename_or_obj = sys.stdout if args[-1] == '-' else args[-1]
         args = args[:-1]
-        if len(args) > 0:
-            # Construct a set of unique serial numbers (we use a set instead
-            # of a list so that in the event of multiple patterns matching a
-            # single bottle it doesn't get listed multiple times)
-            serials = set()
-            for arg in args:
-                if set('*?[') & set(arg):
-                    serials |= set(
-                        fnmatch.filter((
-                            bottle.serial
-                            for bottle in self.data_logger.bottles), arg))
-                else:
-                    serials.add(arg)
-            if len(serials) > 1:
+        bottles = self.select_bottles(options, args)
+        if options.all_readings or ext == '.xml':
+            # XML files always hold complete bottles, so any selection of
+            # bottles goes to a single file
+            # Each data logger downloads in its own thread (so several take
+            # only as long as the slowest) while the readings are written
+            exporter.export_readings(
+                filename_or_obj, self.release_readings(
+                    bottle for (bottle,) in self.download_pipelined(
+                        [(bottle,) for bottle in bottles], options.jobs)),
+                delta=options.delta, points=options.points)
+        elif args or filtered:
+            # Filters select bottles to export the readings of, just as
+            # bottle-serials do
+            if not bottles:
+                raise ValueError('no bottles match the selection')
+            elif len(bottles) > 1:
                 # Ensure output filename is a string with a format part
                 if hasattr(filename_or_obj, 'write'):
                     self.parser.error(
                         'cannot use stdout for output with more than '
                         'one bottle')
                 bottles = [
-                    self.data_logger.bottle(serial)
-                    for serial in serials
-                    ]
-                bottles = [
-                    (bottle, filename_or_obj.format(bottle=bottle))
+                    (bottle, filename_or_obj.format(
+                        bottle=FilenameBottle(bottle)))
                     for bottle in bottles
                     ]
                 all_filenames = [f for (_, f) in bottles]
                 if len(set(all_filenames)) < len(bottles):
                     self.parser.error(
                         'filename must be unique for each bottle '
-                        '(use {bottle.serial} in filename)')
-                for bottle, filename in bottles:
-                    exporter.export_bottle(
-                        filename, bottle,
-                        delta=options.delta, points=options.points)
+                        '(use {bottle.serial} in filename, and {bottle.port} '
+                        'if several data loggers store the same serial)')
+                self.export_pipelined(
+                    exporter, bottles, options.jobs,
+                    delta=options.delta, points=options.points)
             else:
-                bottle = self.data_logger.bottle(serials.pop())
+                bottle = bottles[0]
                 if not hasattr(filename_or_obj, 'write'):
-                    filename_or_obj = filename_or_obj.format(bottle=bottle)
+                    filename_or_obj = filename_or_obj.format(
+                        bottle=FilenameBottle(bottle))
                 exporter.export_bottle(
                     filename_or_obj, bottle,
                     delta=options.delta, points=options.points)
         else:
-            exporter.export_bottles(filename_or_obj, self.data_logger.bottles)
-
+            exporter.export_bottles(filename_or_obj, bottles)
 
 main = DumpApplication()
 
@@ -34,24 +34,44 @@ import os
 import sys
 import logging
 import signal
+from datetime import datetime
 from xml.etree.ElementTree import fromstring, tostring
 
 import serial
 
 from oxitopped.terminal import OxiTopApplication
 from oxitopped.bottles import Bottle
-from oxitopped.logger import DummyLogger
+from oxitopped.logger import (
+    DummyLogger, FaultyLogger, DummyLoggerPool, SimulatedClock)
+from oxitopped.synthetic import EPOCH, generate_bottles, write_bottles
 from oxitopped.daemon import DaemonContext
 
 
 class EmuApplication(OxiTopApplication):
     """
-    %prog [options] bottles-xml
+    %prog [options] [bottles-xml]...
 
     This utility emulates an OxiTop OC110 data dummy_logger for the purposes of
     easy development without access to an actual OC110. The bottle data served
     by the emulator is specified in an XML-based file which can be generated
     using oxitopdump or oxitopview with a real unit.
+
+    Instead of a bottles definition file, the --generate option can be used
+    to serve the specified number of synthetic bottles. With the --output
+    option, the generated bottles are written to the specified file instead
+    of being served.
+
+    Several units can be emulated at once by specifying the --port option
+    multiple times. In this case, either a single bottles definition file is
+    served by all units, or one file must be given for each port (in the same
+    order as the ports).
+
+    If the port is PTY, a pseudo-terminal is created instead of opening a
+    serial port and the path of its client side is printed. Clients can open
+    this path as if it were a serial port. If the port is a socket://HOST:PORT
+    URL, the emulator listens for a client on the specified TCP address
+    instead (a PORT of 0 picks a free port), and prints the URL clients
+    should use.
     """
 
     def __init__(self):
@@ -60,33 +80,169 @@ class EmuApplication(OxiTopApplication):
         self.handle_sigterm = None
         self.parser.set_defaults(
             daemon=False,
+            workers=4,
+            generate=0,
+            output='',
+            seed=None,
+            faults=[],
+            fault_delay=1.0,
+            live=None,
+            clock='',
             )
         self.parser.add_option(
             '-d', '--daemon', dest='daemon', action='store_true',
             help='if specified, start the emulator as a background daemon')
+        self.parser.add_option(
+            '-w', '--workers', dest='workers', action='store', type='int',
+            help='specify the number of threads used to serve the emulated '
+            'units. Default: %default')
+        self.parser.add_option(
+            '-g', '--generate', dest='generate', action='store', type='int',
+            metavar='COUNT',
+            help='serve COUNT synthetic bottles instead of reading a bottles '
+            'definition file')
+        self.parser.add_option(
+            '-o', '--output', dest='output', action='store',
+            help='write the bottles generated by --generate to the specified '
+            'file (or - for stdout) instead of serving them')
+        self.parser.add_option(
+            '--seed', dest='seed', action='store', type='int',
+            help='specify the seed used by --generate and --fault to produce '
+            'repeatable bottles and faults. Seeded bottles are generated as '
+            'of %s rather than the current time' % EPOCH.strftime('%Y-%m-%d'))
+        self.parser.add_option(
+            '-f', '--fault', dest='faults', action='append',
+            metavar='FAULT=PROBABILITY',
+            help='inject the specified fault (one of %s) into replies with '
+            'the specified probability (between 0 and 1). May be specified '
+            'multiple times' % ', '.join(FaultyLogger.FAULTS))
+        self.parser.add_option(
+            '--fault-delay', dest='fault_delay', action='store', type='float',
+            help='specify the number of seconds by which the delay fault '
+            'delays prompts. Default: %default')
+        self.parser.add_option(
+            '--live', dest='live', action='store', type='float',
+            metavar='SPEED',
+            help='run the emulated units on a simulated clock running SPEED '
+            'times faster than real time; bottles only report the readings '
+            'taken by the simulated time')
+        self.parser.add_option(
+            '--clock', dest='clock', action='store',
+            help='specify the simulated time (YYYY-MM-DDTHH:MM:SS) at which '
+            'the --live clock starts. Default: the start of the earliest '
+            'bottle')
 
     def main(self, options, args):
-        if options.port == 'TEST':
+        if not options.port:
+            options.port = [self.default_port]
+        if 'TEST' in options.port:
             self.parser.error('Cannot use TEST serial port with the emulator')
-        if not args:
-            # Use a default bottles definition file if none was specified
-            args = [os.path.join(os.path.dirname(__file__), 'example.xml')]
-        if len(args) == 1:
-            with io.open(args[0], 'r') as bottles_file:
-                bottles_xml = fromstring(bottles_file.read())
+        if options.workers < 1:
+            self.parser.error('The number of workers must be at least 1')
+        faults = {}
+        for fault in options.faults:
+            try:
+                fault, probability = fault.split('=', 1)
+                probability = float(probability)
+            except ValueError:
+                self.parser.error(
+                    'Faults must be specified as FAULT=PROBABILITY')
+            if fault not in FaultyLogger.FAULTS:
+                self.parser.error('Unknown fault %s' % fault)
+            if not (0.0 <= probability <= 1.0):
+                self.parser.error(
+                    'The probability of %s must be between 0 and 1' % fault)
+            faults[fault] = probability
+        if options.generate:
+            if args:
+                self.parser.error(
+                    'You cannot specify bottles definition files with '
+                    '--generate')
+            if options.output:
+                self.write_generated(options)
+                return
+            # Each unit gets its own set of bottles, keyed by the unit's index
+            args = list(range(len(options.port)))
+            bottles = dict(
+                (i, list(generate_bottles(
+                    options.generate,
+                    seed=None if options.seed is None else options.seed + i)))
+                for i in args
+                )
         else:
-            self.parser.error(
-                'You may only specify a single bottles definition file')
-        bottles = [
-            Bottle.from_xml(tostring(bottle))
-            for bottle in bottles_xml.findall('bottle')
-            ]
-        logging.info('Opening serial port %s' % options.port)
-        port = serial.Serial(
-            options.port, baudrate=9600, bytesize=serial.EIGHTBITS,
-            parity=serial.PARITY_NONE, stopbits=serial.STOPBITS_ONE,
-            timeout=5, rtscts=True)
-        files_preserve = [port]
+            if options.output:
+                self.parser.error('--output may only be used with --generate')
+            if not args:
+                # Use a default bottles definition file if none was specified
+                args = [
+                    os.path.join(os.path.dirname(__file__), 'example.xml')]
+            if len(args) == 1:
+                args = args * len(options.port)
+            elif len(args) != len(options.port):
+                self.parser.error(
+                    'You must specify a single bottles definition file or '
+                    'one for each serial port')
+            bottles = {}
+            for filename in set(args):
+                with io.open(filename, 'r') as bottles_file:
+                    bottles_xml = fromstring(bottles_file.read())
+                bottles[filename] = [
+                    Bottle.from_xml(tostring(bottle))
+                    for bottle in bottles_xml.findall('bottle')
+                    ]
+        clock = None
+        if options.live is not None:
+            if options.live <= 0:
+                self.parser.error('The --live speed must be positive')
+            if options.clock:
+                try:
+                    start = datetime.strptime(
+                        options.clock, '%Y-%m-%dT%H:%M:%S')
+                except ValueError:
+                    self.parser.error(
+                        'The --clock time must be YYYY-MM-DDTHH:MM:SS')
+            else:
+                start = min(
+                    bottle.start
+                    for unit_bottles in bottles.values()
+                    for bottle in unit_bottles
+                    )
+            clock = SimulatedClock(start, options.live)
+        elif options.clock:
+            self.parser.error('--clock may only be used with --live')
+        ports = []
+        files_preserve = []
+        for port in options.port:
+            if port == 'PTY':
+                try:
+                    from oxitopped.ptyport import PtyPort
+                except ImportError:
+                    self.parser.error(
+                        'pseudo-terminals are not supported on this platform')
+                port = PtyPort(timeout=5)
+                logging.info('Created pseudo-terminal %s' % port.port)
+                # Print the path for the benefit of scripts launching clients
+                print(port.port)
+                sys.stdout.flush()
+                files_preserve.append(port.slave_fd)
+            elif port.startswith('socket://'):
+                try:
+                    from oxitopped.tcpport import TcpServerPort
+                except ImportError:
+                    self.parser.error(
+                        'socket:// ports are not supported on this platform')
+                port = TcpServerPort(port, timeout=5)
+                logging.info('Listening on %s' % port.port)
+                print(port.port)
+                sys.stdout.flush()
+            else:
+                logging.info('Opening serial port %s' % port)
+                port = serial.Serial(
+                    port, baudrate=9600, bytesize=serial.EIGHTBITS,
+                    parity=serial.PARITY_NONE, stopbits=serial.STOPBITS_ONE,
+                    timeout=5, rtscts=True)
+            ports.append(port)
+        files_preserve.extend(ports)
         for handler in logging.getLogger().handlers:
             if isinstance(handler, logging.FileHandler):
                 files_preserve.append(handler.stream)
@@ -103,27 +259,61 @@ class EmuApplication(OxiTopApplication):
                     signal.SIGTERM: self.terminate,
                     signal.SIGINT: self.interrupt,
                     }):
-            logging.info('Starting emulator loop')
-            self.dummy_logger = DummyLogger(port, bottles)
-            # Loop around waiting for the dummy logger thread to terminate. If
-            # we attempt to simply join() here then the thread blocks and the
-            # signal handlers below never get a chance to execute
+            logging.info(
+                'Starting emulator loop for %d unit(s)' % len(ports))
+            if faults:
+                loggers = [
+                    FaultyLogger(
+                        port, bottles[filename], faults,
+                        delay=options.fault_delay,
+                        seed=None if options.seed is None else options.seed + i,
+                        threaded=False, clock=clock)
+                    for (i, (port, filename)) in enumerate(zip(ports, args))
+                    ]
+            else:
+                loggers = [
+                    DummyLogger(
+                        port, bottles[filename], threaded=False, clock=clock)
+                    for (port, filename) in zip(ports, args)
+                    ]
+            dummy_logger = DummyLoggerPool(loggers, workers=options.workers)
+            self.dummy_loggers.append(dummy_logger)
+            # Loop around waiting for the dummy logger threads to terminate.
+            # If we attempt to simply join() here then the thread blocks and
+            # the signal handlers below never get a chance to execute
             try:
-                while self.dummy_logger.is_alive():
-                    self.dummy_logger.join(0.1)
+                while dummy_logger.is_alive():
+                    dummy_logger.join(0.1)
             except (SystemExit, KeyboardInterrupt) as exc:
                 pass
             logging.info('Waiting for emulator loop to finish')
-            self.dummy_logger.join()
+            dummy_logger.join()
+            # Pseudo-terminals and listening sockets are destroyed explicitly
+            # rather than left to the garbage collector at interpreter exit
+            for port in ports:
+                if hasattr(port, 'destroy'):
+                    port.destroy()
             logging.info('Exiting')
 
+    def write_generated(self, options):
+        bottles = generate_bottles(options.generate, seed=options.seed)
+        if options.output == '-':
+            write_bottles(bottles, getattr(sys.stdout, 'buffer', sys.stdout))
+        else:
+            logging.info('Writing %d bottles to %s' % (
+                options.generate, options.output))
+            with io.open(options.output, 'wb') as output:
+                write_bottles(bottles, output)
+
     def terminate(self, signum, frame):
         logging.info('Received SIGTERM')
-        self.dummy_logger.terminated = True
+        for dummy_logger in self.dummy_loggers:
+            dummy_logger.terminated = True
 
     def interrupt(self, signum, frame):
         logging.info('Received SIGINT')
-        self.dummy_logger.terminated = True
+        for dummy_logger in self.dummy_loggers:
+            dummy_logger.terminated = True
 
 
 main = EmuApplication()
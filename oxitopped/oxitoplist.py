@@ -30,11 +30,12 @@ from __future__ import (
     )
 
 import sys
-import fnmatch
+import json
+from datetime import datetime
 from itertools import izip_longest
 
 from oxitopped.terminal import OxiTopApplication
-from oxitopped.bottles import DataAnalyzer
+from oxitopped.bottles import smoothed_readings
 
 
 class ListApplication(OxiTopApplication):
@@ -45,15 +46,19 @@ class ListApplication(OxiTopApplication):
     Logger. If bottle-serial values are specified, the details of those bottles
     and all heads attached to them will be displayed, otherwise a list of all
     available bottle serials provided. The bottle-serial values may include *,
-    ?, and [] wildcards.
+    ?, and [] wildcards. Bottles can also be selected by the details in their
+    headers with the filter options. With --format jsonl the output is one JSON object per
+    line for consumption by other programs.
     """
 
     def __init__(self):
         super(ListApplication, self).__init__()
+        self.add_client_options()
         self.parser.set_defaults(
             readings=False,
             delta=True,
             points=1,
+            format='table',
             )
         self.parser.add_option(
             '-r', '--readings', dest='readings', action='store_true',
@@ -67,47 +72,93 @@ class ListApplication(OxiTopApplication):
             '-m', '--moving-average', dest='points', action='store',
             help='if specified with --readings, output a moving average '
             'over the specified number of points instead of actual readings')
+        self.parser.add_option(
+            '-f', '--format', dest='format', action='store',
+            help='specifies the output format. Can be table (the default) for '
+            'human-readable tables, or jsonl for one JSON object per line')
+        self.add_filter_options()
 
     def main(self, options, args):
+        if options.format not in ('table', 'jsonl'):
+            self.parser.error('--format must be one of table, jsonl')
+        try:
+            options.points = int(options.points)
+        except ValueError:
+            self.parser.error(
+                '--moving-average value must be an integer number')
+        if options.points % 2 == 0:
+            self.parser.error(
+                '--moving-average value must be an odd number')
+        self.parse_filter_options(options)
         super(ListApplication, self).main(options, args)
-        if args:
-            try:
-                options.points = int(options.points)
-            except ValueError:
-                self.parser.error(
-                    '--moving-average value must be an integer number')
-            if options.points % 2 == 0:
-                self.parser.error(
-                    '--moving-average value must be an odd number')
-            # Construct a set of unique serial numbers (we use a set instead
-            # of a list so that in the event of multiple patterns matching a
-            # single bottle it doesn't get listed multiple times)
-            serials = set()
-            for arg in args:
-                if set('*?[') & set(arg):
-                    serials |= set(
-                        fnmatch.filter((
-                            bottle.serial
-                            for bottle in self.data_logger.bottles), arg))
-                else:
-                    serials.add(arg)
+        bottles = self.select_bottles(options, args)
+        if options.format == 'jsonl':
+            self.print_jsonl(
+                bottles, readings=options.readings, delta=options.delta,
+                points=options.points)
+        elif args:
             first = True
-            for serial in serials:
+            for bottle in bottles:
                 if first:
                     first = False
                 else:
                     print()
                 self.print_bottle(
-                    serial, readings=options.readings, delta=options.delta,
+                    bottle, readings=options.readings, delta=options.delta,
                     points=options.points)
         else:
-            self.print_bottles()
+            self.print_bottles(bottles)
+
+    def print_jsonl(self, bottles, readings=False, delta=True, points=1):
+        # Each line is written as soon as it's produced. Bottle lines only
+        # contain details from the bottle's header so that listing bottles
+        # never causes their readings to be downloaded
+        for bottle in bottles:
+            self.print_json(dict(
+                type='bottle',
+                serial=bottle.serial,
+                id=bottle.id,
+                start=bottle.start.isoformat(),
+                finish=bottle.finish.isoformat(),
+                interval=bottle.interval.total_seconds(),
+                completed=bottle.completed == 'Yes',
+                mode=bottle.mode,
+                measurements=bottle.expected_measurements,
+                bottle_volume=bottle.bottle_volume,
+                sample_volume=bottle.sample_volume,
+                dilution=bottle.dilution,
+                heads=[
+                    dict(serial=head.serial, pressure_limit=head.pressure_limit)
+                    for head in bottle.heads
+                    ],
+                ))
+            if readings:
+                for head in bottle.heads:
+                    # Encoding a dict per reading is slow, so the constant
+                    # parts of the line are encoded once per head. The result
+                    # is identical to print_json's output
+                    template = (
+                        '{"head":%s,"index":%%d,"serial":%s,'
+                        '"timestamp":"%%s","type":"reading","value":%%r}\n' % (
+                            json.dumps(head.serial), json.dumps(bottle.serial)))
+                    for index, value in enumerate(
+                            smoothed_readings(head, delta, points)):
+                        sys.stdout.write(template % (
+                            index,
+                            (bottle.start + bottle.interval * (
+                                index + (points - 1) // 2)).isoformat(),
+                            value,
+                            ))
 
-    def print_bottles(self):
+    def print_json(self, obj):
+        sys.stdout.write(
+            json.dumps(obj, sort_keys=True, separators=(',', ':')) + '\n')
+
+    def print_bottles(self, bottles):
         table = [
             ('Serial', 'ID', 'Started', 'Finished', 'Complete', 'Mode', 'Heads'),
             ]
-        for bottle in self.data_logger.bottles:
+        for bottle in bottles:
             table.append((
                 bottle.serial,
                 str(bottle.id),
@@ -119,10 +170,9 @@ class ListApplication(OxiTopApplication):
                 ))
         self.print_table(table)
         print()
-        print('%d results returned' % len(self.data_logger.bottles))
+        print('%d results returned' % len(bottles))
 
-    def print_bottle(self, serial, readings=False, delta=True, points=1):
-        bottle = self.data_logger.bottle(serial)
+    def print_bottle(self, bottle, readings=False, delta=True, points=1):
         form = [
             ('Serial',               bottle.serial),
             ('ID',                   str(bottle.id)),
@@ -140,21 +190,46 @@ class ListApplication(OxiTopApplication):
             ]
         self.print_form(form)
         if readings:
-            analyzer = DataAnalyzer(bottle, delta=delta, points=points)
             print()
-            table = [
-                tuple([''] + ['Head' for head in bottle.heads]),
-                tuple(['Timestamp'] + [head.serial for head in bottle.heads]),
-                ]
-            table.extend(
-                tuple(
-                    str(reading)
-                    for reading in head
-                    )
-                for head in izip_longest(analyzer.timestamps, *analyzer.heads)
-                )
-            self.print_table(table, header_lines=2)
+            self.print_readings(bottle, delta=delta, points=points)
 
+    def print_readings(self, bottle, delta=True, points=1):
+        # The readings are streamed straight to the output rather than built
+        # into a table first, so the column widths are derived from what the
+        # values can be: timestamps only vary in width if they can include
+        # microseconds, and the moving average of a head's readings can't
+        # exceed the range of those readings
+        precision = 1 if points == 1 else 2
+        if bottle.start.microsecond or bottle.interval.microseconds:
+            timestamp_width = len(str(datetime(2000, 1, 1, microsecond=1)))
+        else:
+            timestamp_width = len(str(datetime(2000, 1, 1)))
+        lengths = [max(len('Timestamp'), timestamp_width)]
+        for head in bottle.heads:
+            length = max(len('Head'), len(head.serial))
+            readings = head.auto_readings
+            if len(readings):
+                base = readings[0] if delta else 0
+                length = max(
+                    length,
+                    len('%.*f' % (precision, min(readings) - base)),
+                    len('%.*f' % (precision, max(readings) - base)),
+                    )
+            lengths.append(length)
+        def lines():
+            yield tuple([''] + ['Head' for head in bottle.heads])
+            yield tuple(['Timestamp'] + [head.serial for head in bottle.heads])
+            for index, values in enumerate(izip_longest(*(
+                    smoothed_readings(head, delta, points)
+                    for head in bottle.heads))):
+                yield (
+                    str(bottle.start +
+                        bottle.interval * (index + (points - 1) // 2)),
+                    ) + tuple(
+                        '' if value is None else '%.*f' % (precision, value)
+                        for value in values
+                        )
+        self.print_table_stream(lines(), lengths, header_lines=2)
 
 main = ListApplication()
 
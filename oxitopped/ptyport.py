@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+# vim: set et sw=4 sts=4:
+
+# Copyright 2012 Dave Hughes.
+#
+# This file is part of oxitopped.
+#
+# oxitopped is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# oxitopped is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# A PARTICULAR PURPOSE.  See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# oxitopped.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Defines a serial port emulation backed by a pseudo-terminal.
+
+The `PtyPort` class creates a pseudo-terminal pair and behaves as a serial
+port on the master side. Any other process (a client application, a terminal
+program, etc.) can open the slave side by its path, given by the `port`
+attribute, as if it were a real serial port such as /dev/ttyUSB0. This is only
+available on platforms which provide `os.openpty` (Linux, Mac OS X, etc.)
+"""
+
+from __future__ import (
+    unicode_literals,
+    absolute_import,
+    division,
+    print_function,
+    )
+
+import os
+import tty
+import time
+import fcntl
+import struct
+import select
+import termios
+
+import serial
+
+
+class PtyPort(object):
+    """
+    Emulates a serial port with the master side of a new pseudo-terminal pair.
+    The slave side is placed in raw mode and held open for the lifetime of
+    the object so that clients may open and close it repeatedly.
+
+    Closing the port doesn't destroy the pseudo-terminal; like `NullModem` it
+    simply discards any pending input and prevents reads until the port is
+    opened again. Call `destroy` to destroy the pseudo-terminal itself once
+    the port is no longer required.
+
+    `timeout` : the number of seconds reads wait for data
+    `baudrate` : the nominal baud rate reported by the port
+    """
+
+    def __init__(self, timeout=None, baudrate=9600):
+        super(PtyPort, self).__init__()
+        self.master_fd, self.slave_fd = os.openpty()
+        tty.setraw(self.slave_fd)
+        self.port = os.ttyname(self.slave_fd)
+        self.name = self.port
+        self.timeout = timeout
+        self.baudrate = baudrate
+        self.bytesize = serial.EIGHTBITS
+        self.parity = serial.PARITY_NONE
+        self.stopbits = serial.STOPBITS_ONE
+        self._opened = True
+
+    def fileno(self):
+        return self.master_fd
+
+    def open(self):
+        self._opened = True
+
+    def close(self):
+        self.flushInput()
+        self._opened = False
+
+    def isOpen(self):
+        return self._opened
+
+    def destroy(self):
+        """
+        Closes both sides of the pseudo-terminal. The port cannot be used
+        afterwards.
+        """
+        self._opened = False
+        for fd in (self.master_fd, self.slave_fd):
+            if fd is not None:
+                try:
+                    os.close(fd)
+                except OSError:
+                    pass
+        self.master_fd = self.slave_fd = None
+
+    def flush(self):
+        pass
+
+    def flushInput(self):
+        while select.select([self.master_fd], [], [], 0)[0]:
+            os.read(self.master_fd, 4096)
+
+    def flushOutput(self):
+        pass
+
+    def setRTS(self, level=True):
+        pass
+
+    def setDTR(self, level=True):
+        pass
+
+    def inWaiting(self):
+        result = fcntl.ioctl(
+            self.master_fd, termios.FIONREAD, struct.pack(str('I'), 0))
+        return struct.unpack(str('I'), result)[0]
+
+    def read(self, size=1):
+        assert self._opened
+        deadline = None if self.timeout is None else time.time() + self.timeout
+        result = b''
+        while len(result) < size:
+            if deadline is None:
+                remaining = None
+            else:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+            if not select.select([self.master_fd], [], [], remaining)[0]:
+                break
+            result += os.read(self.master_fd, size - len(result))
+        return result
+
+    def readinto(self, b):
+        data = self.read(len(b))
+        b[:len(data)] = data
+        return len(data)
+
+    def write(self, data):
+        assert self._opened
+        data = bytes(data)
+        written = 0
+        while written < len(data):
+            written += os.write(self.master_fd, data[written:])
+        return written
@@ -0,0 +1,262 @@
+# -*- coding: utf-8 -*-
+# vim: set et sw=4 sts=4:
+
+# Copyright 2012 Dave Hughes.
+#
+# This file is part of oxitopped.
+#
+# oxitopped is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# oxitopped is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# A PARTICULAR PURPOSE.  See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# oxitopped.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Defines classes for recording serial sessions and replaying them.
+
+The `RecordingPort` class wraps a serial port (real or otherwise) and records
+every chunk of data read from or written to it, with a timestamp, in a session
+file. The `ReplayPort` class reads such a file and emulates the port, serving
+the recorded data back either at the recorded speed or as fast as possible.
+Session files are plain text with one chunk per line: the number of seconds
+since the start of the session, R (read) or W (written), and the data in
+hexadecimal. Lines beginning with # are comments.
+"""
+
+from __future__ import (
+    unicode_literals,
+    absolute_import,
+    division,
+    print_function,
+    )
+
+import io
+import time
+from binascii import hexlify, unhexlify
+
+import serial
+
+
+def read_session(filename_or_obj):
+    """
+    Reads the session file specified by `filename_or_obj`, returning a list of
+    (timestamp, direction, data) tuples.
+
+    `filename_or_obj` : the filename or file-like object to read from
+    """
+    owned = not hasattr(filename_or_obj, 'read')
+    if owned:
+        filename_or_obj = io.open(filename_or_obj, 'r')
+    try:
+        events = []
+        for line in filename_or_obj:
+            line = line.strip()
+            if line and not line.startswith('#'):
+                timestamp, direction, data = line.split(' ', 2)
+                assert direction in ('R', 'W')
+                events.append((
+                    float(timestamp), direction,
+                    unhexlify(data.encode('ascii'))))
+        return events
+    finally:
+        if owned:
+            filename_or_obj.close()
+
+
+class RecordingPort(object):
+    """
+    Wraps a serial port and records all data read from, or written to, the
+    port in a session file which can later be served by `ReplayPort`. All
+    attributes not defined here are passed through to the wrapped port.
+
+    `port` : the serial port to wrap
+    `filename_or_obj` : the filename or file-like object to record to
+    """
+
+    def __init__(self, port, filename_or_obj):
+        super(RecordingPort, self).__init__()
+        self._port = port
+        self._owned = not hasattr(filename_or_obj, 'write')
+        if self._owned:
+            filename_or_obj = io.open(filename_or_obj, 'w')
+        self._output = filename_or_obj
+        self._start = time.time()
+        self._output.write(
+            '# oxitopped session recorded from %s at %d baud\n' % (
+                port.port, port.baudrate))
+
+    def __getattr__(self, name):
+        return getattr(self._port, name)
+
+    def _record(self, direction, data):
+        if data:
+            self._output.write('%.6f %s %s\n' % (
+                time.time() - self._start, direction,
+                hexlify(data).decode('ascii')))
+
+    def read(self, size=1):
+        data = self._port.read(size)
+        self._record('R', data)
+        return data
+
+    def write(self, data):
+        result = self._port.write(data)
+        self._record('W', data)
+        return result
+
+    def close(self):
+        self._port.close()
+        if self._owned:
+            self._output.close()
+        else:
+            self._output.flush()
+
+
+class ReplayPort(object):
+    """
+    Emulates a serial port by serving a session recorded by `RecordingPort`.
+    Data read during the session becomes available for reading once the data
+    written before it in the session has been written to the port. If `speed`
+    is specified, the recorded delay between each write and the subsequent
+    reads is reproduced (divided by `speed`); otherwise data is served as fast
+    as possible and reads which timed out in the session return immediately.
+    Writing anything other than what was written during the session, or
+    writing past its end, raises `serial.SerialException`.
+
+    `filename_or_obj` : the filename or file-like object to replay
+    `speed` : (optional) the multiple of the recorded speed to replay at
+    `timeout` : the number of seconds reads wait for data
+    `baudrate` : the nominal baud rate reported by the port
+    """
+
+    def __init__(self, filename_or_obj, speed=None, timeout=3, baudrate=9600):
+        super(ReplayPort, self).__init__()
+        if speed is not None and speed <= 0:
+            raise ValueError('speed must be a positive number')
+        self.port = 'replay:%s' % getattr(
+            filename_or_obj, 'name', filename_or_obj)
+        self.name = self.port
+        self.speed = speed
+        self.timeout = timeout
+        self.baudrate = baudrate
+        self.bytesize = serial.EIGHTBITS
+        self.parity = serial.PARITY_NONE
+        self.stopbits = serial.STOPBITS_ONE
+        self._events = read_session(filename_or_obj)
+        self._index = 0
+        self._offset = 0
+        self._anchor = (0.0, time.time())
+        self._opened = True
+
+    def open(self):
+        self._opened = True
+
+    def close(self):
+        self._opened = False
+
+    def isOpen(self):
+        return self._opened
+
+    def flush(self):
+        pass
+
+    def flushInput(self):
+        pass
+
+    def flushOutput(self):
+        pass
+
+    def setRTS(self, level=True):
+        pass
+
+    def setDTR(self, level=True):
+        pass
+
+    def _due(self):
+        # Returns the time at which the current read event becomes available
+        recorded, replayed = self._anchor
+        timestamp = self._events[self._index][0]
+        return replayed + (timestamp - recorded) / self.speed
+
+    def inWaiting(self):
+        result = 0
+        index, offset = self._index, self._offset
+        while index < len(self._events) and self._events[index][1] == 'R':
+            if self.speed is not None and self._events[index][0] > (
+                    self._anchor[0] +
+                    (time.time() - self._anchor[1]) * self.speed):
+                break
+            result += len(self._events[index][2]) - offset
+            index += 1
+            offset = 0
+        return result
+
+    def read(self, size=1):
+        assert self._opened
+        result = b''
+        while len(result) < size:
+            if (
+                    self._index >= len(self._events) or
+                    self._events[self._index][1] != 'R'):
+                # Nothing more was read before the next write; the session
+                # must have timed out here
+                if self.speed is not None and not result and self.timeout:
+                    time.sleep(self.timeout / self.speed)
+                break
+            if self.speed is not None:
+                delay = self._due() - time.time()
+                if delay > 0:
+                    if result:
+                        break
+                    if self.timeout is not None and delay > self.timeout:
+                        time.sleep(self.timeout)
+                        break
+                    time.sleep(delay)
+            data = self._events[self._index][2]
+            chunk = data[self._offset:self._offset + size - len(result)]
+            result += chunk
+            self._offset += len(chunk)
+            if self._offset >= len(data):
+                self._index += 1
+                self._offset = 0
+        return result
+
+    def readinto(self, b):
+        data = self.read(len(b))
+        b[:len(data)] = data
+        return len(data)
+
+    def write(self, data):
+        assert self._opened
+        remaining = bytes(data)
+        while remaining:
+            # Skip anything the client didn't read in the session
+            while (
+                    self._index < len(self._events) and
+                    self._events[self._index][1] == 'R'):
+                self._index += 1
+                self._offset = 0
+            if self._index >= len(self._events):
+                raise serial.SerialException(
+                    'Wrote past the end of the replayed session')
+            timestamp, _, expected = self._events[self._index]
+            expected = expected[self._offset:]
+            if not (remaining.startswith(expected) or
+                    expected.startswith(remaining)):
+                raise serial.SerialException(
+                    'Replayed session diverged: expected %r but got %r' % (
+                        expected, remaining))
+            length = min(len(expected), len(remaining))
+            remaining = remaining[length:]
+            self._offset += length
+            if self._offset >= len(self._events[self._index][2]):
+                self._index += 1
+                self._offset = 0
+            self._anchor = (timestamp, time.time())
+        return len(data)
@@ -0,0 +1,194 @@
+# -*- coding: utf-8 -*-
+# vim: set et sw=4 sts=4:
+
+# Copyright 2012 Dave Hughes.
+#
+# This file is part of oxitopped.
+#
+# oxitopped is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# oxitopped is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# A PARTICULAR PURPOSE.  See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# oxitopped.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Generates synthetic bottles for testing at scale.
+
+The `generate_bottles` function yields an arbitrary number of bottles with
+plausible pressure curves: an initial drop as the sample adapts to the
+incubation temperature, followed by an exponential decay towards a plateau as
+the sample consumes oxygen, with some noise and the occasional spike. The
+`write_bottles` function streams any sequence of bottles to an XML file in
+the same format as the ``example.xml`` file included with the package, one
+bottle at a time.
+"""
+
+from __future__ import (
+    unicode_literals,
+    absolute_import,
+    division,
+    print_function,
+    )
+
+import math
+import random
+from datetime import datetime, timedelta
+
+from oxitopped.bottles import Bottle, BottleHead
+from oxitopped.export_xml import XmlExporter
+
+
+# Sample volumes (ml) recommended for the standard 510ml bottle, depending on
+# the expected measuring range
+SAMPLE_VOLUMES = (432.0, 365.0, 250.0, 164.0, 97.0, 43.5, 22.7)
+
+# The time at which seeded sets of bottles are generated (unless otherwise
+# specified) so that the same seed always produces the same bottles
+EPOCH = datetime(2013, 1, 1)
+
+
+def generate_readings(
+        rng, count, interval, duration, noise=0.7, spike_probability=0.002):
+    """
+    Returns a list of `count` synthetic auto-readings for a bottle head.
+
+    `rng` : the `random.Random` instance to draw values from
+    `count` : the number of readings to generate
+    `interval` : the `timedelta` between readings
+    `duration` : the `timedelta` of the whole run
+    `noise` : the standard deviation of the noise added to each reading
+    `spike_probability` : the probability of each reading being a spike
+    """
+    baseline = rng.gauss(985, 20)
+    adaptation = rng.uniform(0, 20)
+    consumption = rng.uniform(0, 100)
+    # Time constant of the oxygen consumption, as a fraction of the run
+    tau = rng.uniform(0.05, 0.5) * duration.total_seconds()
+    step = interval.total_seconds()
+    result = []
+    for i in range(count):
+        value = baseline - consumption * (1 - math.exp(-i * step / tau))
+        if i:
+            value -= adaptation
+        value += rng.gauss(0, noise)
+        if rng.random() < spike_probability:
+            value += rng.uniform(10, 40)
+        result.append(int(round(value)))
+    return result
+
+
+def generate_bottles(
+        count, modes=('pressure',), heads=1, measurements=360,
+        duration=timedelta(days=28), start=None, stagger=timedelta(hours=1),
+        noise=0.7, spike_probability=0.002, manual_readings=0, seed=None,
+        now=None):
+    """
+    Generator function which yields `count` synthetic bottles, complete with
+    auto-readings (and optionally manual readings) for each head. Bottles are
+    generated one at a time so that arbitrarily large sets can be streamed to
+    a file with `write_bottles`.
+
+    Bottles which haven't finished by `now` only have readings up to that
+    time. By default, `start` is chosen so that every bottle has finished by
+    then.
+
+    `count` : the number of bottles to generate
+    `modes` : a sequence of the modes ('pressure' or 'bod') to pick from
+    `heads` : the number of heads for BOD bottles, or a (min, max) tuple to
+    pick from (pressure bottles always have a single head)
+    `measurements` : the number of measurements in each run
+    `duration` : the `timedelta` of each run
+    `start` : (optional) the start timestamp of the first bottle
+    `stagger` : the `timedelta` between the start of each bottle
+    `noise` : the standard deviation of the noise added to each reading
+    `spike_probability` : the probability of each reading being a spike
+    `manual_readings` : the number of manual readings for pressure bottles
+    `seed` : (optional) the seed for the random number generator, to produce
+    repeatable sets of bottles
+    `now` : (optional) the time at which the bottles are generated, which
+    defaults to `EPOCH` if `seed` is given, or the current time otherwise
+    """
+    if stagger < timedelta(days=1) // 99:
+        raise ValueError(
+            'stagger must be long enough that no more than 99 bottles start '
+            'on any day')
+    if isinstance(heads, int):
+        heads = (heads, heads)
+    rng = random.Random(seed)
+    if now is None:
+        now = EPOCH if seed is not None else datetime.now().replace(
+            microsecond=0)
+    if start is None:
+        start = now - duration - stagger * count
+    day = None
+    for index in range(count):
+        bottle_start = start + stagger * index
+        if bottle_start.date() != day:
+            day = bottle_start.date()
+            number = 0
+        number += 1
+        mode = rng.choice(modes)
+        bottle = Bottle(
+            '%s%02d' % (bottle_start.strftime('%y%m%d'), number),
+            index % 999 + 1,
+            bottle_start,
+            bottle_start + duration,
+            measurements,
+            mode,
+            510.0,
+            rng.choice(SAMPLE_VOLUMES),
+            0)
+        # Include the reading at the start and at the end of the run
+        readings = 0
+        if bottle_start <= now:
+            readings = min(
+                measurements,
+                int((now - bottle_start).total_seconds() //
+                    bottle.interval.total_seconds())) + 1
+        for serial in rng.sample(
+                range(60000, 70000),
+                1 if mode == 'pressure' else rng.randint(*heads)):
+            head = BottleHead(
+                bottle, '%d' % serial,
+                150 if mode == 'pressure' else None,
+                generate_readings(
+                    rng, readings, bottle.interval, duration, noise,
+                    spike_probability))
+            # Manual readings are taken at random times during the run and
+            # lie close to the auto-reading taken before them
+            offsets = []
+            if mode == 'pressure' and readings:
+                offsets = sorted(
+                    rng.randint(0, (readings - 1) * int(
+                        bottle.interval.total_seconds()))
+                    for i in range(manual_readings)
+                    )
+            head.manual_readings = [
+                (
+                    bottle_start + timedelta(seconds=offset),
+                    head.auto_readings[
+                        int(offset // bottle.interval.total_seconds())] +
+                    int(round(rng.gauss(0, noise))),
+                    )
+                for offset in offsets
+                ]
+            bottle.heads.append(head)
+        yield bottle
+
+
+def write_bottles(bottles, output):
+    """
+    Writes `bottles` as an XML document to the binary file-like object
+    `output`, one bottle at a time. The document can be served by the
+    emulator.
+
+    `bottles` : the sequence of bottles to write
+    `output` : the file-like object to write the document to
+    """
+    XmlExporter().export_bottles(output, bottles)
@@ -0,0 +1,282 @@
+# -*- coding: utf-8 -*-
+# vim: set et sw=4 sts=4:
+
+# Copyright 2012 Dave Hughes.
+#
+# This file is part of oxitopped.
+#
+# oxitopped is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# oxitopped is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# A PARTICULAR PURPOSE.  See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# oxitopped.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Defines serial port emulations which carry the data over TCP sockets.
+
+The `TcpPort` class connects to a ``socket://host:port`` URL and can be used
+by `DataLogger` in place of a serial port, while the `TcpServerPort` class
+listens on such an address and can be served by `DummyLogger`. Both carry the
+raw bytes of the serial line. Unlike pyserial's own ``socket://`` handler,
+reads honour the port's timeout exactly and `flushInput` actually discards
+pending data, both of which `DataLogger` relies upon.
+"""
+
+from __future__ import (
+    unicode_literals,
+    absolute_import,
+    division,
+    print_function,
+    )
+
+import time
+import socket
+import select
+
+import serial
+
+
+def parse_url(url):
+    """
+    Returns the (host, port) tuple specified by a ``socket://host:port`` URL.
+
+    `url` : the URL to parse
+    """
+    if not url.startswith('socket://'):
+        raise ValueError('%s is not a socket:// URL' % url)
+    try:
+        host, port = url[len('socket://'):].rstrip('/').rsplit(':', 1)
+        port = int(port)
+    except ValueError:
+        raise ValueError('%s must be of the form socket://host:port' % url)
+    if not (0 <= port < 65536):
+        raise ValueError('invalid TCP port %d' % port)
+    return (host or 'localhost', port)
+
+
+class _SocketPort(object):
+    # Common implementation of the serial port interface over a connected
+    # socket. Descendents implement _connection() which returns the connected
+    # socket (or None), and _disconnect() which is called when the peer
+    # closes the connection
+
+    # The maximum number of pending bytes reported by inWaiting
+    PEEK_SIZE = 65536
+
+    def __init__(self, timeout=None, baudrate=9600):
+        super(_SocketPort, self).__init__()
+        self.timeout = timeout
+        self.baudrate = baudrate
+        self.bytesize = serial.EIGHTBITS
+        self.parity = serial.PARITY_NONE
+        self.stopbits = serial.STOPBITS_ONE
+        self._socket = None
+        self._opened = False
+
+    def _connection(self, timeout=0):
+        raise NotImplementedError
+
+    def _disconnect(self):
+        if self._socket is not None:
+            self._socket.close()
+            self._socket = None
+
+    def _recv(self, connection, size, flags=0):
+        # A connection reset by the peer is treated just like one closed
+        # normally; in both cases an empty result is returned
+        try:
+            return connection.recv(size, flags)
+        except socket.error:
+            return b''
+
+    def isOpen(self):
+        return self._opened
+
+    def flush(self):
+        pass
+
+    def flushInput(self):
+        connection = self._connection()
+        while (
+                connection is not None and
+                select.select([connection], [], [], 0)[0]):
+            if not self._recv(connection, 4096):
+                self._disconnect()
+                break
+
+    def flushOutput(self):
+        pass
+
+    def setRTS(self, level=True):
+        pass
+
+    def setDTR(self, level=True):
+        pass
+
+    def inWaiting(self):
+        # Peek at the pending data rather than asking for FIONREAD, which
+        # isn't available on all platforms. The result is capped at
+        # PEEK_SIZE, which is fine as callers simply read what's reported
+        connection = self._connection()
+        if connection is None or not select.select(
+                [connection], [], [], 0)[0]:
+            return 0
+        result = len(self._recv(
+            connection, self.PEEK_SIZE, socket.MSG_PEEK))
+        if not result:
+            # Readable with nothing to read means the peer has gone
+            self._disconnect()
+        return result
+
+    def read(self, size=1):
+        assert self._opened
+        deadline = None if self.timeout is None else time.time() + self.timeout
+        result = b''
+        while len(result) < size:
+            if deadline is None:
+                remaining = None
+            else:
+                remaining = max(0, deadline - time.time())
+            connection = self._connection(remaining)
+            if connection is None:
+                break
+            if deadline is not None:
+                remaining = max(0, deadline - time.time())
+            if not select.select([connection], [], [], remaining)[0]:
+                break
+            data = self._recv(connection, size - len(result))
+            if not data:
+                self._disconnect()
+                continue
+            result += data
+        return result
+
+    def readinto(self, b):
+        data = self.read(len(b))
+        b[:len(data)] = data
+        return len(data)
+
+    def write(self, data):
+        assert self._opened
+        connection = self._connection()
+        if connection is not None:
+            try:
+                connection.sendall(bytes(data))
+            except socket.error:
+                self._disconnect()
+        return len(data)
+
+
+class TcpPort(_SocketPort):
+    """
+    Emulates a serial port with a TCP connection to the specified
+    ``socket://host:port`` URL (for example, an emulator started with
+    ``oxitopemu -p socket://localhost:7777``).
+
+    `url` : the URL to connect to
+    `timeout` : the number of seconds reads wait for data
+    `baudrate` : the nominal baud rate reported by the port
+    """
+
+    def __init__(self, url, timeout=None, baudrate=9600):
+        super(TcpPort, self).__init__(timeout, baudrate)
+        self._address = parse_url(url)
+        self.port = url
+        self.name = url
+        self.open()
+
+    def fileno(self):
+        return self._socket.fileno()
+
+    def _connection(self, timeout=0):
+        return self._socket
+
+    def _disconnect(self):
+        super(TcpPort, self)._disconnect()
+        raise serial.SerialException(
+            'Connection to %s closed by peer' % self.port)
+
+    def open(self):
+        if not self._opened:
+            try:
+                self._socket = socket.create_connection(self._address)
+            except socket.error as exc:
+                raise serial.SerialException(
+                    'Unable to connect to %s: %s' % (self.port, exc))
+            self._socket.setsockopt(
+                socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            self._opened = True
+
+    def close(self):
+        if self._opened:
+            self._opened = False
+            if self._socket is not None:
+                self._socket.close()
+                self._socket = None
+
+
+class TcpServerPort(_SocketPort):
+    """
+    Emulates a serial port with a TCP socket listening on the specified
+    ``socket://host:port`` URL. One client is connected at a time; further
+    clients wait until the current client disconnects. Data written while no
+    client is connected is discarded, like data sent down a serial line with
+    nothing at the other end.
+
+    If the port in `url` is 0 an ephemeral port is chosen; the `port`
+    attribute contains the URL clients should connect to.
+
+    Closing the port doesn't stop it listening; like `NullModem` it simply
+    discards any pending input and prevents reads until the port is opened
+    again. Call `destroy` to stop listening once the port is no longer
+    required.
+
+    `url` : the URL to listen on
+    `timeout` : the number of seconds reads wait for data
+    `baudrate` : the nominal baud rate reported by the port
+    """
+
+    def __init__(self, url, timeout=None, baudrate=9600):
+        super(TcpServerPort, self).__init__(timeout, baudrate)
+        self._listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._listener.bind(parse_url(url))
+        self._listener.listen(1)
+        self.port = 'socket://%s:%d' % self._listener.getsockname()
+        self.name = self.port
+        self._opened = True
+
+    def fileno(self):
+        return self._listener.fileno()
+
+    def _connection(self, timeout=0):
+        if self._socket is None and select.select(
+                [self._listener], [], [], timeout)[0]:
+            self._socket, _ = self._listener.accept()
+            self._socket.setsockopt(
+                socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        return self._socket
+
+    def open(self):
+        self._opened = True
+
+    def close(self):
+        self.flushInput()
+        self._opened = False
+
+    def destroy(self):
+        """
+        Disconnects any client and stops listening. The port cannot be used
+        afterwards.
+        """
+        self._opened = False
+        if self._socket is not None:
+            self._socket.close()
+            self._socket = None
+        self._listener.close()
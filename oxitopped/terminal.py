@@ -250,13 +250,20 @@ class TerminalApplication(object):
 
 
 import io
-import serial
+import time
+import fnmatch
+import threading
+from datetime import datetime, timedelta
 from xml.etree.ElementTree import fromstring, tostring
 
+import serial
+
 from oxitopped import __version__
 from oxitopped.bottles import Bottle
-from oxitopped.logger import DataLogger, DummyLogger, LoggerError
+from oxitopped.logger import (
+    DataLogger, DummyLogger, FileLogger, LoggerManager, LoggerError)
 from oxitopped.nullmodem import null_modem
+from oxitopped.replay import RecordingPort, ReplayPort
 
 
 class OxiTopApplication(TerminalApplication):
@@ -270,18 +277,27 @@ class OxiTopApplication(TerminalApplication):
 
     def __init__(self):
         super(OxiTopApplication, self).__init__(__version__)
-        self.dummy_logger = None
+        self.dummy_loggers = []
         self.data_logger = None
         self.progress_visible = False
+        self.progress_width = 40
+        # Several loggers may report progress concurrently from separate
+        # threads, so each tracks its own start time
+        self.progress_state = threading.local()
+        self.default_port = (
+            'COM1' if sys.platform.startswith('win') else '/dev/ttyUSB0')
+        self.show_stats = False
         self.parser.set_defaults(
-            port='COM1' if sys.platform.startswith('win') else '/dev/ttyUSB0',
+            port=None,
             timeout=3,
             )
         self.parser.add_option(
-            '-p', '--port', dest='port', action='store',
+            '-p', '--port', dest='port', action='append',
             help='specify the port which the OxiTop Data Logger is connected '
             'to. This will be something like /dev/ttyUSB0 on Linux or COM1 '
-            'on Windows. Default: %default')
+            'on Windows, or socket://HOST:PORT for a data logger reachable '
+            'over TCP. May be specified multiple times to talk to several '
+            'data loggers concurrently. Default: %s' % self.default_port)
         self.parser.add_option(
             '-t', '--timeout', dest='timeout', action='store',
             help='specify the number of seconds to wait for data from the '
@@ -291,10 +307,12 @@ class OxiTopApplication(TerminalApplication):
         try:
             return super(OxiTopApplication, self).__call__(args)
         finally:
-            if self.dummy_logger:
-                self.dummy_logger.terminated = True
+            for dummy_logger in self.dummy_loggers:
+                dummy_logger.terminated = True
             if self.data_logger:
                 self.data_logger.close()
+                if self.show_stats:
+                    self.print_stats()
 
     def handle(self, exc_type, exc_value, exc_trace):
         "Global application exception handler"
@@ -306,13 +324,198 @@ class OxiTopApplication(TerminalApplication):
             return super(OxiTopApplication, self).handle(
                     exc_type, exc_value, exc_trace)
 
-    def print_table(self, lines, header_lines=1, footer_lines=0):
+    def add_client_options(self):
+        """
+        Adds options which only apply to applications talking to a data
+        logger (rather than emulating one) to the command line parser.
+        Descendents which act as clients should call this from __init__().
+        """
+        self.parser.set_defaults(
+            record='',
+            source='',
+            stats=False,
+            )
+        self.parser.add_option(
+            '--record', dest='record', action='store', metavar='FILE',
+            help='if specified, record all data sent and received over the '
+            'serial port to the specified file. The recording can be '
+            'replayed by specifying replay:FILE as the port')
+        self.parser.add_option(
+            '--source', dest='source', action='store', metavar='FILE',
+            help='if specified, read bottles from the specified XML file '
+            '(like those produced by oxitopdump or oxitopemu --generate) '
+            'instead of a data logger')
+        self.parser.add_option(
+            '--stats', dest='stats', action='store_true',
+            help='if specified, print a summary of the serial port performance '
+            'counters to stderr on exit')
+
+    def match_serials(self, patterns):
+        """
+        Returns the set of bottle serial numbers matching `patterns`. We use a
+        set instead of a list so that in the event of multiple patterns
+        matching a single bottle it doesn't get listed multiple times.
+
+        `patterns` : a sequence of serial numbers, which may include *, ?,
+        and [] wildcards
+        """
+        serials = set()
+        for pattern in patterns:
+            if set('*?[') & set(pattern):
+                serials |= set(
+                    fnmatch.filter((
+                        bottle.serial
+                        for bottle in self.data_logger.bottles), pattern))
+            else:
+                serials.add(pattern)
+        return serials
+
+    def add_filter_options(self):
+        """
+        Adds options for selecting bottles by the details in their headers to
+        the command line parser. Descendents which support them should call
+        this from __init__() and use select_bottles() to apply them.
+        """
+        self.parser.set_defaults(
+            started_after=None,
+            started_before=None,
+            finished_after=None,
+            finished_before=None,
+            mode=None,
+            ids=[],
+            completed=None,
+            heads=None,
+            )
+        self.parser.add_option(
+            '--started-after', dest='started_after', action='store',
+            metavar='DATE', help='only select bottles started on or after '
+            'the specified date (YYYY-MM-DD, optionally followed by HH:MM:SS)')
+        self.parser.add_option(
+            '--started-before', dest='started_before', action='store',
+            metavar='DATE', help='only select bottles started before the '
+            'specified date')
+        self.parser.add_option(
+            '--finished-after', dest='finished_after', action='store',
+            metavar='DATE', help='only select bottles finishing on or after '
+            'the specified date')
+        self.parser.add_option(
+            '--finished-before', dest='finished_before', action='store',
+            metavar='DATE', help='only select bottles finishing before the '
+            'specified date')
+        self.parser.add_option(
+            '--mode', dest='mode', action='store',
+            help='only select bottles in the specified mode (pressure or bod)')
+        self.parser.add_option(
+            '--id', dest='ids', action='append', type='int', metavar='ID',
+            help='only select bottles with the specified ID. May be specified '
+            'multiple times to select several IDs')
+        self.parser.add_option(
+            '--completed', dest='completed', action='store_true',
+            help='only select bottles whose measurements have completed')
+        self.parser.add_option(
+            '--running', dest='completed', action='store_false',
+            help='only select bottles whose measurements are still running')
+        self.parser.add_option(
+            '--heads', dest='heads', action='store', type='int', metavar='N',
+            help='only select bottles with the specified number of heads')
+
+    def parse_filter_options(self, options):
+        """
+        Validates the options added by add_filter_options(), converting the
+        dates to datetime values. Returns True if any filters were specified.
+
+        `options` : the options returned by the command line parser
+        """
+        for option in (
+                'started_after', 'started_before',
+                'finished_after', 'finished_before'):
+            value = getattr(options, option)
+            if value is not None and not isinstance(value, datetime):
+                for fmt in ('%Y-%m-%d %H:%M:%S', '%Y-%m-%dT%H:%M:%S', '%Y-%m-%d'):
+                    try:
+                        value = datetime.strptime(value, fmt)
+                    except ValueError:
+                        pass
+                    else:
+                        break
+                else:
+                    self.parser.error(
+                        '--%s value must be a date like YYYY-MM-DD' %
+                        option.replace('_', '-'))
+                setattr(options, option, value)
+        if options.mode is not None:
+            options.mode = options.mode.lower()
+            if options.mode not in ('pressure', 'bod'):
+                self.parser.error('--mode must be one of pressure, bod')
+        return any((
+            options.started_after is not None,
+            options.started_before is not None,
+            options.finished_after is not None,
+            options.finished_before is not None,
+            options.mode is not None,
+            options.ids,
+            options.completed is not None,
+            options.heads is not None,
+            ))
+
+    def select_bottles(self, options, patterns):
+        """
+        Returns a list of the bottles matching `patterns` (or all bottles if
+        no patterns are given) which also pass the filters specified by the
+        options added by add_filter_options(). The filters are evaluated
+        against the bottle headers retrieved by a single GAPB command, so only
+        the bottles selected ever have their readings downloaded.
+
+        `options` : the options returned by the command line parser
+        `patterns` : a sequence of serial numbers, which may include *, ?,
+        and [] wildcards
+        """
+        if not self.parse_filter_options(options):
+            if patterns and not isinstance(self.data_logger, LoggerManager):
+                # Without filters, retrieve specific bottles individually
+                # rather than listing every bottle on the device. Several
+                # devices may store bottles with the same serial number, so
+                # those of a LoggerManager are always matched against its
+                # listing (which it retrieves to find a bottle anyway)
+                return [
+                    self.data_logger.bottle(serial)
+                    for serial in sorted(self.match_serials(patterns))
+                    ]
+            elif not patterns:
+                return list(self.data_logger.bottles)
+        bottles = self.data_logger.bottles
+        if patterns:
+            serials = self.match_serials(patterns)
+            bottles = [
+                bottle for bottle in bottles
+                if bottle.serial in serials
+                ]
+        ids = set(options.ids)
+        return [
+            bottle for bottle in bottles
+            if (options.started_after is None or
+                    bottle.start >= options.started_after)
+            and (options.started_before is None or
+                    bottle.start < options.started_before)
+            and (options.finished_after is None or
+                    bottle.finish >= options.finished_after)
+            and (options.finished_before is None or
+                    bottle.finish < options.finished_before)
+            and (options.mode is None or bottle.mode == options.mode)
+            and (not ids or bottle.id in ids)
+            and (options.completed is None or
+                    (bottle.completed == 'Yes') == options.completed)
+            and (options.heads is None or len(bottle.heads) == options.heads)
+            ]
+
+    def print_table(self, lines, header_lines=1, footer_lines=0, output=None):
         """
         Routine for pretty-printing a text table.
 
         `lines` : a sequence of tuples representing a row of values in the table
         `header_lines` : number of lines at the start that are headers
         `footer_lines` : number of lines at the end that are footers
+        `output` : the file to print to (defaults to stdout)
         """
         lines = list(lines)
         # Calculate the maximum length of each field
@@ -329,14 +532,40 @@ class OxiTopApplication(TerminalApplication):
             lines.insert(-footer_lines, tuple('-' * l for l in lengths))
         # Output the data
         for line in lines:
-            print(' '.join('%-*s' % (l, s) for (l, s) in zip(lengths, line)))
+            print(' '.join('%-*s' % (l, s) for (l, s) in zip(lengths, line)),
+                file=output)
 
-    def print_form(self, lines, fmt='{field: <{width}}{value}'):
+    def print_table_stream(self, lines, lengths, header_lines=1, output=None):
+        """
+        Routine for pretty-printing a text table as its rows are produced.
+        Unlike print_table the width of each column must be known in advance,
+        but nothing is held in memory and the first rows appear immediately,
+        which suits long tables. Values wider than their column are not
+        truncated (but will misalign the rest of the row).
+
+        `lines` : an iterable of tuples representing a row of values in the table
+        `lengths` : a sequence of the widths of each column
+        `header_lines` : number of lines at the start that are headers
+        `output` : the file to print to (defaults to stdout)
+        """
+        separator = tuple('-' * l for l in lengths)
+        count = 0
+        for line in lines:
+            if header_lines != 0 and count == header_lines:
+                print(' '.join(separator), file=output)
+            print(' '.join('%-*s' % (l, s) for (l, s) in zip(lengths, line)),
+                file=output)
+            count += 1
+        if header_lines != 0 and count <= header_lines:
+            print(' '.join(separator), file=output)
+
+    def print_form(self, lines, fmt='{field: <{width}}{value}', output=None):
         """
         Routine for pretty-printing a form of fields.
 
         `lines` : a sequence of 2-tuples representing each field and its value
         `fmt` : a format string specifying how to lay out each line
+        `output` : the file to print to (defaults to stdout)
         """
         lines = list(lines)
         columns = max(len(line) for line in lines)
@@ -344,51 +573,133 @@ class OxiTopApplication(TerminalApplication):
         # Calculate the maximum length of each field
         width = max(len(line[0]) for line in lines) + 2
         for (field, value) in lines:
-            print(fmt.format(width=width, field=field, value=value))
-
-    progress_spinner = ['\\', '|', '/' ,'-']
+            print(fmt.format(width=width, field=field, value=value),
+                file=output)
 
-    def progress_start(self):
-        self.progress_index = 0
-        self.progress_update(erase=False)
-
-    def progress_update(self, erase=True):
+    def print_stats(self):
+        """
+        Routine for printing the performance counters of all data loggers to
+        stderr.
+        """
+        loggers = getattr(self.data_logger, 'loggers', [self.data_logger])
+        for logger in loggers:
+            stats = logger.stats
+            if stats.efficiency is None:
+                throughput = '%.1f bytes/s' % stats.throughput
+            else:
+                throughput = '%.1f bytes/s (%.0f%% of %d baud)' % (
+                    stats.throughput, stats.efficiency * 100, stats.baudrate)
+            print(file=sys.stderr)
+            self.print_form([
+                ('Port',            str(logger.port.port)),
+                ('Bytes sent',      str(stats.bytes_sent)),
+                ('Bytes received',  str(stats.bytes_received)),
+                ('Wait time',       '%.2fs' % stats.wait_time),
+                ('Transfer time',   '%.2fs' % stats.transfer_time),
+                ('Throughput',      throughput),
+                ('Checksum errors', str(stats.checksum_errors)),
+                ('Retries',         str(stats.retries)),
+                ('Timeouts',        str(stats.timeouts)),
+                ], output=sys.stderr)
+            print(file=sys.stderr)
+            self.print_table([
+                ('Command', 'Count', 'Mean') + tuple(
+                    '<%gs' % bucket for bucket in stats.BUCKETS) +
+                    ('>=%gs' % stats.BUCKETS[-1],),
+                ] + [
+                (command, str(stats.counts[command]),
+                    '%.3fs' % stats.mean_latency(command)) + tuple(
+                    str(count) for count in stats.histograms[command])
+                for command in sorted(stats.counts)
+                ], output=sys.stderr)
+
+    def progress_start(self, expected=None):
+        self.progress_state.start = time.time()
+        self.progress_update(0, expected)
+
+    def progress_update(self, received, expected=None):
         if not self.progress_visible:
             return
-        if erase:
-            sys.stderr.write('\b')
-        sys.stderr.write(self.progress_spinner[self.progress_index % len(self.progress_spinner)])
+        if expected:
+            # Never claim completion until the reply has actually finished
+            fraction = min(received / expected, 0.99)
+            elapsed = time.time() - self.progress_state.start
+            if received and elapsed:
+                eta = timedelta(seconds=int(
+                    elapsed * (expected - min(received, expected)) / received))
+            else:
+                eta = '?'
+            message = '%3d%% %d/%d bytes, ETA %s' % (
+                fraction * 100, received, expected, eta)
+        else:
+            message = '%d bytes' % received
+        sys.stderr.write('\r' + message.ljust(self.progress_width))
         sys.stderr.flush()
-        self.progress_index += 1
 
     def progress_finish(self):
         if not self.progress_visible:
             return
-        sys.stderr.write('\b')
+        sys.stderr.write('\r' + ' ' * self.progress_width + '\r')
+        sys.stderr.flush()
 
-    def main(self, options, args):
-        self.progress_visible = (options.loglevel == logging.INFO)
-        if options.port == 'TEST':
+    def open_port(self, port, timeout):
+        """
+        Opens the serial port named by `port` with the settings used by the
+        OC110. The special port name TEST connects to an emulated data logger
+        serving the bundled example bottles, replay:FILE replays a session
+        previously recorded with --record as fast as possible, and
+        socket://HOST:PORT connects to a data logger (or emulator) over TCP.
+
+        `port` : the name of the serial port to open
+        `timeout` : the number of seconds to wait for data from the port
+        """
+        if port == 'TEST':
             data_logger_port, dummy_logger_port = null_modem(
                 baudrate=9600, bytesize=serial.EIGHTBITS,
                 parity=serial.PARITY_NONE, stopbits=serial.STOPBITS_ONE,
-                timeout=options.timeout, rtscts=True)
+                timeout=timeout, rtscts=True)
             with io.open(
                     os.path.join(os.path.dirname(__file__),
                         'example.xml'), 'r') as bottles_file:
                 bottles_xml = fromstring(bottles_file.read())
-            self.dummy_logger = DummyLogger(dummy_logger_port, [
+            self.dummy_loggers.append(DummyLogger(dummy_logger_port, [
                 Bottle.from_xml(tostring(bottle))
                 for bottle in bottles_xml.findall('bottle')
-                ])
+                ]))
+        elif port.startswith('replay:'):
+            data_logger_port = ReplayPort(port[len('replay:'):], timeout=timeout)
+        elif port.startswith('socket://'):
+            from oxitopped.tcpport import TcpPort
+            data_logger_port = TcpPort(port, timeout=timeout)
         else:
             data_logger_port = serial.Serial(
-                options.port, baudrate=9600, bytesize=serial.EIGHTBITS,
+                port, baudrate=9600, bytesize=serial.EIGHTBITS,
                 parity=serial.PARITY_NONE, stopbits=serial.STOPBITS_ONE,
-                timeout=options.timeout, rtscts=True)
-        self.data_logger = DataLogger(data_logger_port, progress=(
+                timeout=timeout, rtscts=True)
+        return data_logger_port
+
+    def main(self, options, args):
+        self.progress_visible = (options.loglevel == logging.INFO)
+        self.show_stats = options.stats
+        if options.source:
+            if options.port or options.record or options.stats:
+                self.parser.error(
+                    'cannot use --port, --record, or --stats with --source')
+            self.data_logger = FileLogger(options.source)
+            return
+        if not options.port:
+            options.port = [self.default_port]
+        ports = [self.open_port(port, options.timeout) for port in options.port]
+        if options.record:
+            if len(ports) > 1:
+                self.parser.error('cannot use --record with more than one port')
+            ports = [RecordingPort(ports[0], options.record)]
+        progress = (
             self.progress_start,
             self.progress_update,
             self.progress_finish,
-            ))
-
+            )
+        if len(ports) == 1:
+            self.data_logger = DataLogger(ports[0], progress=progress)
+        else:
+            self.data_logger = LoggerManager(ports, progress=progress)
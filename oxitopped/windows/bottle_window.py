@@ -88,6 +88,10 @@ class BottleWindow(QtGui.QWidget):
     def bottle(self):
         return self.model.analyzer.bottle
 
+    @property
+    def data_logger(self):
+        return self.bottle.logger
+
     def refresh_window(self):
         "Forces the list to be re-read from the data logger"
         self.model.beginResetModel()
@@ -294,3 +298,13 @@ class BottleExporter(BaseExporter):
                 delta=self.parent.model.delta,
                 points=self.parent.model.points)
 
+    def export_numpy(self, filename):
+        "Export the bottle readings to a NumPy file"
+        from oxitopped.export_npz import NumpyExporter
+        exporter = NumpyExporter()
+        exporter.export_bottle(
+            filename,
+            self.parent.model.analyzer.bottle,
+            delta=self.parent.model.delta,
+            points=self.parent.model.points)
+
@@ -187,3 +187,9 @@ class DataLoggerExporter(BaseExporter):
             exporter.row_colors = dialog.row_colors
             exporter.export_bottles(filename, self.parent.data_logger.bottles)
 
+    def export_numpy(self, filename):
+        "Export the bottle list to a NumPy file"
+        from oxitopped.export_npz import NumpyExporter
+        exporter = NumpyExporter()
+        exporter.export_bottles(filename, self.parent.data_logger.bottles)
+
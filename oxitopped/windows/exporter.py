@@ -42,6 +42,11 @@ try:
     xls = True
 except ImportError:
     xls = False
+try:
+    import oxitopped.export_npz
+    npz = True
+except ImportError:
+    npz = False
 
 
 class BaseExporter(object):
@@ -60,6 +65,9 @@ class BaseExporter(object):
         if xls:
             exports['.xls'] = (
                 self.parent.tr('XLS - Excel files'), self.export_excel)
+        if npz:
+            exports['.npz'] = (
+                self.parent.tr('NPZ - NumPy array files'), self.export_numpy)
         if not exports:
             raise RuntimeError('Failed to load any export modules')
         filter_map = dict(
@@ -101,3 +109,6 @@ class BaseExporter(object):
     def export_excel(self, filename):
         raise NotImplementedError
 
+    def export_numpy(self, filename):
+        raise NotImplementedError
+
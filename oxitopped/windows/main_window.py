@@ -28,6 +28,8 @@ from __future__ import (
 
 import io
 import os
+import time
+from datetime import timedelta
 from xml.etree.ElementTree import fromstring, tostring
 
 import serial
@@ -64,7 +66,9 @@ class MainWindow(QtGui.QMainWindow):
         # Configure status bar elements
         self.ui.progress_label = QtGui.QLabel('')
         self.statusBar().addWidget(self.ui.progress_label)
-        self.progress_index = 0
+        self.ui.stats_label = QtGui.QLabel('')
+        self.statusBar().addPermanentWidget(self.ui.stats_label)
+        self.progress_started = None
         # Connect up signals to methods
         self.ui.mdi_area.subWindowActivated.connect(self.window_changed)
         self.ui.quit_action.setIcon(get_icon('application-exit'))
@@ -133,6 +137,9 @@ class MainWindow(QtGui.QMainWindow):
                         Bottle.from_xml(tostring(bottle))
                         for bottle in bottles_xml.findall('bottle')
                         ])
+                elif dialog.com_port.startswith('socket://'):
+                    from oxitopped.tcpport import TcpPort
+                    data_logger_port = TcpPort(dialog.com_port, timeout=5)
                 else:
                     data_logger_port = serial.Serial(
                         dialog.com_port, baudrate=9600, bytesize=serial.EIGHTBITS,
@@ -144,7 +151,7 @@ class MainWindow(QtGui.QMainWindow):
                             self.progress_start,
                             self.progress_update,
                             self.progress_finish
-                            ))))
+                            ), prefetch=True)))
                 window.show()
             except KeyboardInterrupt:
                 if window is not None:
@@ -199,6 +206,7 @@ Project homepage is at
     def window_changed(self, window):
         "Called when the MDI child window changes"
         self.update_actions()
+        self.update_stats()
 
     def update_actions(self):
         "Called to update the main window actions"
@@ -206,15 +214,55 @@ Project homepage is at
         self.ui.export_action.setEnabled(self.sub_widget is not None)
         self.ui.refresh_action.setEnabled(self.sub_widget is not None)
 
-    def progress_start(self):
+    def progress_start(self, expected=None):
+        self.progress_started = time.time()
         QtGui.QApplication.instance().setOverrideCursor(QtCore.Qt.WaitCursor)
 
-    def progress_update(self):
-        self.progress_index += 1
-        self.ui.progress_label.setText('Communicating' + '.' * (self.progress_index % 8))
+    def progress_update(self, received, expected=None):
+        if expected:
+            elapsed = time.time() - self.progress_started
+            received = min(received, expected)
+            if received and elapsed:
+                eta = timedelta(seconds=int(
+                    elapsed * (expected - received) / received))
+            else:
+                eta = '?'
+            self.ui.progress_label.setText(
+                str(self.tr('Communicating: {percent}%, ETA {eta}')).format(
+                    percent=received * 100 // expected, eta=eta))
+        else:
+            self.ui.progress_label.setText(
+                str(self.tr('Communicating: {received} bytes')).format(
+                    received=received))
         QtGui.QApplication.instance().processEvents()
 
+    def update_stats(self):
+        "Called to update the performance counters shown in the status bar"
+        data_logger = getattr(self.sub_widget, 'data_logger', None)
+        if data_logger is None:
+            self.ui.stats_label.setText('')
+        else:
+            stats = data_logger.stats
+            if stats.efficiency is None:
+                template = self.tr(
+                    '{received} bytes received at {throughput:.0f} bytes/s, '
+                    '{retries} retries, {timeouts} timeouts')
+            else:
+                template = self.tr(
+                    '{received} bytes received at {throughput:.0f} bytes/s '
+                    '({efficiency:.0%} of line rate), {retries} retries, '
+                    '{timeouts} timeouts')
+            self.ui.stats_label.setText(
+                str(template).format(
+                    received=stats.bytes_received,
+                    throughput=stats.throughput,
+                    efficiency=stats.efficiency,
+                    retries=stats.retries,
+                    timeouts=stats.timeouts,
+                    ))
+
     def progress_finish(self):
         self.ui.progress_label.setText('')
+        self.update_stats()
         QtGui.QApplication.instance().restoreOverrideCursor()
 
@@ -61,6 +61,7 @@ REQUIRES = [
 
 EXTRA_REQUIRES = {
     'XLS':        ['xlwt'],
+    'NPZ':        ['numpy'],
     'GUI':        ['pyqt', 'matplotlib', 'numpy'],
     'daemon':     ['python-daemon'],
     'completion': ['optcomplete'],
@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+# vim: set et sw=4 sts=4:
+
+# Copyright 2012 Dave Hughes.
+#
+# This file is part of oxitopped.
+#
+# oxitopped is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# oxitopped is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# A PARTICULAR PURPOSE.  See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# oxitopped.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Tests for the NumPy exporters."""
+
+from __future__ import (
+    unicode_literals,
+    print_function,
+    absolute_import,
+    division,
+    )
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from oxitopped.bottles import DataAnalyzer
+from oxitopped.synthetic import generate_bottles
+from oxitopped.export_npz import NumpyExporter
+
+
+class ExportReadingsTest(unittest.TestCase):
+    def setUp(self):
+        self.bottles = list(generate_bottles(
+            3, seed=1, modes=('bod',), heads=(2, 3), measurements=30))
+        # Give some heads fewer readings than the moving averages below need
+        self.bottles[1].heads[0].auto_readings = list(
+            self.bottles[1].heads[0].auto_readings)[:2]
+        self.bottles[2].heads[1].auto_readings = list(
+            self.bottles[2].heads[1].auto_readings)[:4]
+        self.tempdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def export(self, delta, points):
+        filename = os.path.join(self.tempdir, 'readings.npz')
+        NumpyExporter().export_readings(
+            filename, iter(self.bottles), delta=delta, points=points)
+        archive = np.load(filename)
+        try:
+            return dict((name, archive[name]) for name in archive.files)
+        finally:
+            archive.close()
+
+    def check_export(self, delta, points):
+        arrays = self.export(delta, points)
+        heads = [
+            (index, bottle, head, readings)
+            for index, bottle in enumerate(self.bottles)
+            for head, readings in zip(
+                bottle.heads, DataAnalyzer(bottle, delta, points).heads)
+            ]
+        self.assertEqual(
+            list(arrays['serial']),
+            [bottle.serial for bottle in self.bottles])
+        self.assertEqual(
+            list(arrays['head_bottle']),
+            [index for (index, _, _, _) in heads])
+        self.assertEqual(
+            list(arrays['head_serial']),
+            [head.serial for (_, _, head, _) in heads])
+        self.assertEqual(
+            list(arrays['head_count']),
+            [len(readings) for (_, _, _, readings) in heads])
+        self.assertEqual(
+            list(arrays['head_offset']),
+            list(np.cumsum([0] + list(arrays['head_count'][:-1]))))
+        self.assertEqual(
+            len(arrays['readings']), int(arrays['head_count'].sum()))
+        for n, (_, _, _, readings) in enumerate(heads):
+            offset = arrays['head_offset'][n]
+            np.testing.assert_allclose(
+                arrays['readings'][offset:offset + arrays['head_count'][n]],
+                np.array(readings, dtype=np.float64))
+        for index, bottle in enumerate(self.bottles):
+            analyzer = DataAnalyzer(bottle, delta, points)
+            self.assertEqual(
+                arrays['first'][index].astype(object), analyzer.timestamps[0])
+
+    def test_single_points(self):
+        self.check_export(delta=False, points=1)
+        self.check_export(delta=True, points=1)
+
+    def test_moving_average(self):
+        self.check_export(delta=False, points=3)
+        self.check_export(delta=True, points=5)
+
+    def test_short_heads(self):
+        arrays = self.export(delta=True, points=5)
+        counts = list(arrays['head_count'])
+        heads = [
+            len(head.auto_readings)
+            for bottle in self.bottles
+            for head in bottle.heads
+            ]
+        self.assertEqual(counts[heads.index(2)], 0)
+        self.assertEqual(counts[heads.index(4)], 0)
+        self.assertEqual(
+            [count for (count, n) in zip(counts, heads) if n == 30],
+            [26] * heads.count(30))
@@ -0,0 +1,419 @@
+# -*- coding: utf-8 -*-
+# vim: set et sw=4 sts=4:
+
+# Copyright 2012 Dave Hughes.
+#
+# This file is part of oxitopped.
+#
+# oxitopped is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# oxitopped is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# A PARTICULAR PURPOSE.  See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# oxitopped.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Tests for the data logger interfaces and the emulated data logger."""
+
+from __future__ import (
+    unicode_literals,
+    print_function,
+    absolute_import,
+    division,
+    )
+
+import time
+import unittest
+import threading
+from datetime import timedelta
+
+import serial
+
+from oxitopped.nullmodem import null_modem
+from oxitopped.synthetic import generate_bottles
+from oxitopped.logger import (
+    DataLogger, DummyLogger, DummyLoggerPool, FaultyLogger, LoggerManager,
+    LoggerError, LoggerStats, TimeoutError, UnexpectedReply, concurrent_map)
+
+
+def connect(name, bottles, timeout=0.5):
+    """
+    Returns a (port, emulator) tuple for a DummyLogger named `name` serving
+    `bottles` over an unthrottled null-modem. If `bottles` is None, nothing
+    listens to the other end of the port.
+    """
+    port, dummy_port = null_modem(
+        baudrate=9600, bytesize=serial.EIGHTBITS, parity=serial.PARITY_NONE,
+        stopbits=serial.STOPBITS_ONE, timeout=timeout, rtscts=True,
+        throttle=False)
+    port.port = name
+    if bottles is None:
+        return (port, None)
+    return (port, DummyLogger(dummy_port, bottles))
+
+
+class ConcurrentMapTest(unittest.TestCase):
+    def test_results_in_order(self):
+        self.assertEqual(
+            concurrent_map(lambda n: n * 2, range(10)),
+            [n * 2 for n in range(10)])
+
+    def test_first_error_in_item_order(self):
+        def func(n):
+            if n in (3, 7):
+                raise ValueError(n)
+            return n
+        with self.assertRaises(ValueError) as cm:
+            concurrent_map(func, range(10))
+        self.assertEqual(cm.exception.args, (3,))
+
+
+class LoggerStatsTest(unittest.TestCase):
+    def test_efficiency(self):
+        stats = LoggerStats(9600)
+        stats.bytes_received = 480
+        stats.transfer_time = 1.0
+        self.assertEqual(stats.efficiency, 0.5)
+
+    def test_efficiency_exceeds_line_rate(self):
+        stats = LoggerStats(9600)
+        stats.bytes_received = 9600
+        stats.transfer_time = 1.0
+        self.assertIsNone(stats.efficiency)
+
+    def test_efficiency_not_line_limited(self):
+        stats = LoggerStats(9600, line_limited=False)
+        stats.bytes_received = 480
+        stats.transfer_time = 1.0
+        self.assertIsNone(stats.efficiency)
+
+    def test_emulated_port(self):
+        port, dummy = connect('unit1', list(generate_bottles(1, seed=1)))
+        logger = DataLogger(port)
+        try:
+            logger.bottles
+            self.assertFalse(logger.stats.line_limited)
+            self.assertIsNone(logger.stats.efficiency)
+        finally:
+            logger.close()
+            dummy.terminated = True
+            dummy.join()
+
+
+class ExecutorTest(unittest.TestCase):
+    def setUp(self):
+        self.bottles = list(generate_bottles(2, seed=1))
+        port, self.dummy = connect('unit1', self.bottles)
+        self.logger = DataLogger(port)
+
+    def tearDown(self):
+        self.logger.close()
+        self.dummy.terminated = True
+        self.dummy.join()
+
+    def hold(self):
+        # Blocks the execution thread in the next command executed until the
+        # returned event is set, so that further commands queue up behind it.
+        # Returns the event and the list of commands in the order executed
+        started = threading.Event()
+        release = threading.Event()
+        executed = []
+        execute = self.logger._execute
+        def _execute(request):
+            started.set()
+            release.wait(5)
+            executed.append((request.command,) + request.args)
+            return execute(request)
+        self.logger._execute = _execute
+        held = self.logger.submit('MAID')
+        started.wait(5)
+        return held, release, executed
+
+    def test_foreground_before_background(self):
+        serial = self.bottles[1].serial
+        held, release, executed = self.hold()
+        background = self.logger.submit('GPRB', serial, background=True)
+        foreground = self.logger.submit('GAPB')
+        release.set()
+        self.assertEqual(background.result(), self.logger._GPRB(serial))
+        self.assertEqual(foreground.result(), self.logger._GAPB())
+        self.assertEqual(executed[:3], [
+            ('MAID',),
+            ('GAPB',),
+            ('GPRB', serial),
+            ])
+
+    def test_exception_propagation(self):
+        # GMSK with too few arguments is answered with INVALID COMMAND
+        request = self.logger.submit('GMSK', self.bottles[0].serial)
+        with self.assertRaises(UnexpectedReply):
+            request.result()
+        self.assertTrue(request.done())
+        # The execution thread survives the failure
+        self.assertEqual(self.logger.submit('MAID').result(), 'OC110\r')
+
+    def test_close_while_queued(self):
+        held, release, executed = self.hold()
+        queued = self.logger.submit('GAPB')
+        closer = threading.Thread(target=self.logger.close)
+        closer.start()
+        release.set()
+        closer.join(5)
+        self.assertFalse(closer.is_alive())
+        # Commands queued before the close are still executed
+        self.assertEqual(held.result(), 'OC110\r')
+        self.assertIn(self.bottles[0].serial, queued.result())
+        self.assertEqual(
+            [command[0] for command in executed], ['MAID', 'GAPB', 'CLOC'])
+        with self.assertRaises(LoggerError):
+            self.logger.submit('MAID')
+
+    def test_pending_carried_across_replies(self):
+        # Stop the emulator and answer by hand, delivering two replies in a
+        # single read; the second must be taken from what's left of the first
+        self.dummy.terminated = True
+        self.dummy.join()
+        dummy_port = self.dummy.port
+        dummy_port.open()
+        dummy_port.write(b'OC110\r>\rOC111\r>\r')
+        received = self.logger.stats.bytes_received
+        self.assertEqual(self.logger.submit('MAID').result(), 'OC110\r')
+        self.assertEqual(self.logger.stats.bytes_received, received + 16)
+        self.assertEqual(self.logger.submit('MAID').result(), 'OC111\r')
+        self.assertEqual(self.logger.stats.bytes_received, received + 16)
+        self.assertEqual(self.logger._pending, b'')
+
+
+class PrefetchTest(unittest.TestCase):
+    def test_progress_while_waiting(self):
+        # Requesting the last bottle while the prefetcher downloads the first
+        # reports the progress of both transfers in the requesting thread
+        source = list(generate_bottles(
+            3, seed=1, modes=('bod',), heads=1, measurements=1000,
+            duration=timedelta(days=5)))
+        port, dummy_port = null_modem(
+            baudrate=115200, timeout=1, rtscts=True)
+        dummy = DummyLogger(dummy_port, source)
+        calls = []
+        def record(name):
+            return lambda *args: calls.append(
+                (name, threading.current_thread()))
+        logger = DataLogger(port, progress=(
+            record('start'), record('update'), record('finish')),
+            prefetch=True)
+        try:
+            head = logger.bottles[-1].heads[0]
+            # Wait for the prefetcher to start on the first bottle
+            while logger._prefetcher._current is None:
+                time.sleep(0.01)
+            del calls[:]
+            self.assertEqual(
+                list(head.auto_readings),
+                list(source[-1].heads[0].auto_readings))
+            self.assertTrue(calls)
+            self.assertEqual(
+                set(thread for (name, thread) in calls),
+                set([threading.current_thread()]))
+            self.assertEqual([name for (name, _) in calls].count('start'), 2)
+            self.assertIn('update', [name for (name, _) in calls])
+        finally:
+            logger.close()
+            dummy.terminated = True
+            dummy.join()
+
+
+class LoggerManagerTest(unittest.TestCase):
+    def setUp(self):
+        # Both units store bottles 12120301 and 12120302 (the serials are
+        # derived from the start dates, which the units share)
+        self.unit1 = list(generate_bottles(3, seed=1))
+        self.unit2 = list(generate_bottles(
+            2, seed=2, modes=('bod',), heads=2))
+        self.ports = []
+        self.dummies = []
+        for name, bottles in (('unit1', self.unit1), ('unit2', self.unit2)):
+            port, dummy = connect(name, bottles)
+            self.ports.append(port)
+            self.dummies.append(dummy)
+        self.manager = LoggerManager(self.ports)
+
+    def tearDown(self):
+        self.manager.close()
+        for dummy in self.dummies:
+            dummy.terminated = True
+        for dummy in self.dummies:
+            dummy.join()
+
+    def test_bottles_combined(self):
+        self.assertEqual(
+            [(bottle.serial, bottle.port) for bottle in self.manager.bottles],
+            [(bottle.serial, 'unit1') for bottle in self.unit1] +
+            [(bottle.serial, 'unit2') for bottle in self.unit2])
+
+    def test_bottle_unique(self):
+        bottle = self.manager.bottle('12120303')
+        self.assertEqual(bottle.port, 'unit1')
+
+    def test_bottle_duplicate(self):
+        with self.assertRaises(ValueError) as cm:
+            self.manager.bottle('12120301')
+        self.assertIn('unit1, unit2', str(cm.exception))
+        bottle = self.manager.bottle('12120301', port='unit2')
+        self.assertEqual(bottle.port, 'unit2')
+        self.assertEqual(len(bottle.heads), 2)
+
+    def test_bottle_missing(self):
+        with self.assertRaises(ValueError):
+            self.manager.bottle('12120303', port='unit2')
+
+    def test_download(self):
+        self.manager.download()
+        expected = self.unit1 + self.unit2
+        for bottle, source in zip(self.manager.bottles, expected):
+            self.assertEqual(
+                [list(head.auto_readings) for head in bottle.heads],
+                [list(head.auto_readings) for head in source.heads])
+
+    def test_download_failure(self):
+        # The failure of one unit is reported once all units have finished,
+        # and doesn't prevent the others from downloading
+        bottles = self.manager.bottles
+        self.dummies[1].terminated = True
+        self.dummies[1].join()
+        with self.assertRaises(LoggerError):
+            self.manager.download()
+        for bottle in bottles[:len(self.unit1)]:
+            self.assertEqual(len(bottle.heads[0].auto_readings), 361)
+
+
+class LoggerManagerFailureTest(unittest.TestCase):
+    def test_connect_failure(self):
+        port1, dummy1 = connect('unit1', list(generate_bottles(1, seed=1)))
+        port2, _ = connect('unit2', None, timeout=0.2)
+        try:
+            with self.assertRaises(TimeoutError):
+                LoggerManager([port1, port2])
+            # The unit which connected successfully is closed again
+            self.assertFalse(port1.isOpen())
+        finally:
+            dummy1.terminated = True
+            dummy1.join()
+
+    def test_no_ports(self):
+        with self.assertRaises(ValueError):
+            LoggerManager([])
+
+
+class DummyLoggerTest(unittest.TestCase):
+    def setUp(self):
+        self.bottles = list(generate_bottles(
+            2, seed=1, modes=('bod',), heads=3, measurements=25))
+        port, dummy_port = null_modem(timeout=1, throttle=False)
+        self.dummy = DummyLogger(dummy_port, self.bottles, threaded=False)
+        self.replies = []
+        self.dummy.reply = self.replies.append
+
+    def test_handle(self):
+        self.dummy.handle('MAID')
+        self.dummy.handle('GSNS', self.bottles[0].serial)
+        self.assertEqual(self.replies[0], 'OC110\r')
+        self.assertNotEqual(self.replies[1], 'INVALID COMMAND\r')
+
+    def test_wrong_argument_count(self):
+        serial = self.bottles[0].serial
+        self.dummy.handle('MAID', serial)
+        self.dummy.handle('GPRB')
+        self.dummy.handle('GMSK', serial)
+        self.dummy.handle('GMSK', serial, '1', '2')
+        self.assertEqual(self.replies, ['INVALID COMMAND\r'] * 4)
+
+    def test_readings_string(self):
+        for head in self.bottles[0].heads:
+            self.assertEqual(
+                self.dummy.readings_string(head), str(head.auto_readings))
+
+class FaultyLoggerTest(unittest.TestCase):
+    def setUp(self):
+        self.bottles = list(generate_bottles(2, seed=1))
+
+    def check_restart(self, dummy, port):
+        logger = DataLogger(port)
+        # Nothing is sent until the unit has restarted, then the banner
+        dummy.faults['restart'] = 1.0
+        start = time.time()
+        port.write(b'GAPB\r\n')
+        self.assertEqual(port.read(1), b'\r')
+        self.assertGreaterEqual(time.time() - start, 0.4)
+        dummy.faults['restart'] = 0.0
+        # The client recovers despite the rest of the banner
+        try:
+            self.assertEqual(
+                [bottle.serial for bottle in logger.bottles],
+                [bottle.serial for bottle in self.bottles])
+        finally:
+            logger.close()
+
+    def test_restart(self):
+        port, dummy_port = null_modem(timeout=1, throttle=False)
+        dummy = FaultyLogger(dummy_port, self.bottles, {'restart': 0.0})
+        try:
+            self.check_restart(dummy, port)
+        finally:
+            dummy.terminated = True
+            dummy.join()
+
+    def test_restart_pooled(self):
+        port, dummy_port = null_modem(timeout=1, throttle=False)
+        dummy = FaultyLogger(
+            dummy_port, self.bottles, {'restart': 0.0}, threaded=False)
+        pool = DummyLoggerPool([dummy], workers=1)
+        try:
+            self.check_restart(dummy, port)
+        finally:
+            pool.terminated = True
+            pool.join()
+
+
+class DummyLoggerPoolTest(unittest.TestCase):
+    def test_interleaved_replies(self):
+        # Six units share two workers. Each client downloads concurrently over
+        # a throttled port, and the replies are long enough that serving any
+        # unit's reply in one go would starve the other units on the same
+        # worker past the clients' timeout
+        units = [
+            list(generate_bottles(
+                1, seed=i, measurements=1000, duration=timedelta(days=5)))
+            for i in range(6)
+            ]
+        ports = []
+        loggers = []
+        for bottles in units:
+            port, dummy_port = null_modem(
+                baudrate=115200, timeout=0.4, rtscts=True)
+            ports.append(port)
+            loggers.append(DummyLogger(dummy_port, bottles, threaded=False))
+        pool = DummyLoggerPool(loggers, workers=2)
+        try:
+            def download(port):
+                logger = DataLogger(port)
+                try:
+                    return [
+                        list(head.auto_readings)
+                        for bottle in logger.bottles
+                        for head in bottle.heads
+                        ]
+                finally:
+                    logger.close()
+            self.assertEqual(
+                concurrent_map(download, ports),
+                [
+                    [list(head.auto_readings) for head in bottles[0].heads]
+                    for bottles in units
+                    ])
+        finally:
+            pool.terminated = True
+            pool.join()
@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+# vim: set et sw=4 sts=4:
+
+# Copyright 2012 Dave Hughes.
+#
+# This file is part of oxitopped.
+#
+# oxitopped is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# oxitopped is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# A PARTICULAR PURPOSE.  See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# oxitopped.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Tests for the null-modem serial port emulation."""
+
+from __future__ import (
+    unicode_literals,
+    print_function,
+    absolute_import,
+    division,
+    )
+
+import time
+import random
+import unittest
+import threading
+
+import serial
+
+from oxitopped.nullmodem import null_modem
+
+
+class ThrottleTest(unittest.TestCase):
+    def transfer_time(self, size, **kwargs):
+        # Returns the time taken for size bytes written at one end of a
+        # throttled null-modem to arrive at the other
+        port1, port2 = null_modem(timeout=5, **kwargs)
+        data = b'x' * size
+        writer = threading.Thread(target=port1.write, args=(data,))
+        start = time.time()
+        writer.start()
+        try:
+            self.assertEqual(port2.read(size), data)
+            return time.time() - start
+        finally:
+            writer.join()
+
+    def test_baudrate(self):
+        # 8N1 framing is 10 bits per byte; the first burst goes out at once
+        elapsed = self.transfer_time(960, baudrate=19200)
+        expected = (960 - 16) / 1920
+        self.assertGreater(elapsed, expected * 0.95)
+        self.assertLess(elapsed, expected * 1.2 + 0.05)
+
+    def test_framing(self):
+        # 8E2 framing is 12 bits per byte
+        elapsed = self.transfer_time(
+            816, baudrate=19200, parity=serial.PARITY_EVEN,
+            stopbits=serial.STOPBITS_TWO)
+        expected = (816 - 16) / 1600
+        self.assertGreater(elapsed, expected * 0.95)
+        self.assertLess(elapsed, expected * 1.2 + 0.05)
+
+    def test_unthrottled(self):
+        port1, port2 = null_modem(timeout=0, throttle=False)
+        data = b'x' * 100000
+        port1.write(data)
+        self.assertEqual(port2.inWaiting(), len(data))
+        self.assertEqual(port2.read(len(data)), data)
+
+
+class TransferTest(unittest.TestCase):
+    def check_transfer(self, **kwargs):
+        # Writes chunks of varying size at one end while the other end reads
+        # with a mixture of read and readinto calls of varying size, and
+        # checks that everything arrives exactly once and in order
+        port1, port2 = null_modem(timeout=0.05, **kwargs)
+        rand = random.Random(1)
+        data = bytes(bytearray(rand.randrange(256) for i in range(50000)))
+        def write():
+            sent = 0
+            while sent < len(data):
+                size = rand.randint(1, 2000)
+                port1.write(data[sent:sent + size])
+                sent += size
+        writer = threading.Thread(target=write)
+        writer.start()
+        received = bytearray()
+        sizes = random.Random(2)
+        deadline = time.time() + 10
+        try:
+            while len(received) < len(data) and time.time() < deadline:
+                size = sizes.randint(1, 3000)
+                if sizes.random() < 0.5:
+                    received += port2.read(size)
+                else:
+                    buf = bytearray(size)
+                    count = port2.readinto(buf)
+                    self.assertLessEqual(count, size)
+                    received += buf[:count]
+        finally:
+            writer.join()
+        self.assertEqual(port2.inWaiting(), 0)
+        self.assertEqual(bytes(received), data)
+
+    def test_unthrottled(self):
+        self.check_transfer(throttle=False)
+
+    def test_throttled(self):
+        self.check_transfer(baudrate=1000000)
+
+    def test_read_timeout(self):
+        port1, port2 = null_modem(timeout=0.2, throttle=False)
+        port1.write(b'abc')
+        start = time.time()
+        self.assertEqual(port2.read(10), b'abc')
+        self.assertGreaterEqual(time.time() - start, 0.15)
+        buf = bytearray(10)
+        self.assertEqual(port2.readinto(buf), 0)
+
+    def test_closed_end_discards(self):
+        port1, port2 = null_modem(timeout=0, throttle=False)
+        port2.close()
+        port1.write(b'lost')
+        port2.open()
+        self.assertEqual(port2.inWaiting(), 0)
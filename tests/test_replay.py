@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+# vim: set et sw=4 sts=4:
+
+# Copyright 2012 Dave Hughes.
+#
+# This file is part of oxitopped.
+#
+# oxitopped is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# oxitopped is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# A PARTICULAR PURPOSE.  See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# oxitopped.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Tests for recording and replaying serial sessions."""
+
+from __future__ import (
+    unicode_literals,
+    print_function,
+    absolute_import,
+    division,
+    )
+
+import io
+import unittest
+
+import serial
+
+from oxitopped.nullmodem import null_modem
+from oxitopped.synthetic import generate_bottles
+from oxitopped.logger import DataLogger, DummyLogger
+from oxitopped.replay import RecordingPort, ReplayPort, read_session
+
+
+def download(port):
+    """
+    Returns the serials of the bottles served at `port`, and the readings of
+    all their heads.
+    """
+    logger = DataLogger(port)
+    try:
+        return [
+            (bottle.serial, [list(head.auto_readings) for head in bottle.heads])
+            for bottle in logger.bottles
+            ]
+    finally:
+        logger.close()
+
+
+class ReplayTest(unittest.TestCase):
+    def setUp(self):
+        self.bottles = list(generate_bottles(
+            2, seed=1, modes=('pressure', 'bod'), heads=2, measurements=50))
+        port, dummy_port = null_modem(timeout=0.5, throttle=False)
+        port.port = 'unit1'
+        dummy = DummyLogger(dummy_port, self.bottles)
+        self.session = io.StringIO()
+        try:
+            self.recorded = download(RecordingPort(port, self.session))
+        finally:
+            dummy.terminated = True
+            dummy.join()
+
+    def replay(self, **kwargs):
+        return ReplayPort(io.StringIO(self.session.getvalue()), **kwargs)
+
+    def test_round_trip(self):
+        self.assertEqual(
+            [serial for (serial, readings) in self.recorded],
+            [bottle.serial for bottle in self.bottles])
+        self.assertEqual(download(self.replay()), self.recorded)
+
+    def test_session_file(self):
+        self.assertTrue(self.session.getvalue().startswith(
+            '# oxitopped session recorded from unit1 at 9600 baud\n'))
+        events = read_session(io.StringIO(self.session.getvalue()))
+        self.assertEqual(
+            set(direction for (timestamp, direction, data) in events),
+            set(['R', 'W']))
+        self.assertEqual(
+            [timestamp for (timestamp, direction, data) in events],
+            sorted(timestamp for (timestamp, direction, data) in events))
+
+    def test_diverged(self):
+        logger = DataLogger(self.replay())
+        with self.assertRaises(serial.SerialException) as cm:
+            logger.submit('GPRB', '99999999').result()
+        self.assertIn('diverged', str(cm.exception))
+
+    def test_past_end(self):
+        port = self.replay()
+        download(port)
+        port.open()
+        with self.assertRaises(serial.SerialException) as cm:
+            port.write(b'MAID\r\n')
+        self.assertIn('past the end', str(cm.exception))
@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+# vim: set et sw=4 sts=4:
+
+# Copyright 2012 Dave Hughes.
+#
+# This file is part of oxitopped.
+#
+# oxitopped is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# oxitopped is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# A PARTICULAR PURPOSE.  See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# oxitopped.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Tests for the synthetic bottle generator."""
+
+from __future__ import (
+    unicode_literals,
+    print_function,
+    absolute_import,
+    division,
+    )
+
+import io
+import unittest
+
+from oxitopped.synthetic import EPOCH, generate_bottles, write_bottles
+
+
+class GenerateBottlesTest(unittest.TestCase):
+    def generate(self, **kwargs):
+        output = io.BytesIO()
+        write_bottles(generate_bottles(
+            4, modes=('pressure', 'bod'), heads=(2, 6), manual_readings=3,
+            **kwargs), output)
+        return output.getvalue()
+
+    def test_seed_repeatable(self):
+        self.assertEqual(self.generate(seed=42), self.generate(seed=42))
+        self.assertNotEqual(self.generate(seed=42), self.generate(seed=43))
+
+    def test_seed_anchored_to_epoch(self):
+        for bottle in generate_bottles(4, seed=42):
+            self.assertLessEqual(bottle.finish, EPOCH)
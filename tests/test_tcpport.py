@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+# vim: set et sw=4 sts=4:
+
+# Copyright 2012 Dave Hughes.
+#
+# This file is part of oxitopped.
+#
+# oxitopped is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# oxitopped is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# A PARTICULAR PURPOSE.  See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# oxitopped.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Tests for the TCP serial port emulations."""
+
+from __future__ import (
+    unicode_literals,
+    print_function,
+    absolute_import,
+    division,
+    )
+
+import time
+import unittest
+
+import serial
+
+from oxitopped.synthetic import generate_bottles
+from oxitopped.logger import DataLogger, DummyLogger
+from oxitopped.tcpport import TcpPort, TcpServerPort, parse_url
+
+
+class ParseUrlTest(unittest.TestCase):
+    def test_parse_url(self):
+        self.assertEqual(
+            parse_url('socket://example.com:7777'), ('example.com', 7777))
+        self.assertEqual(parse_url('socket://:7777/'), ('localhost', 7777))
+        for url in ('tcp://localhost:7777', 'socket://localhost',
+                'socket://localhost:70000'):
+            with self.assertRaises(ValueError):
+                parse_url(url)
+
+
+class TcpPortTest(unittest.TestCase):
+    def setUp(self):
+        self.server = TcpServerPort('socket://127.0.0.1:0', timeout=0.5)
+        self.client = TcpPort(self.server.port, timeout=0.5)
+
+    def tearDown(self):
+        self.client.close()
+        self.server.destroy()
+
+    def test_in_waiting(self):
+        self.assertEqual(self.client.inWaiting(), 0)
+        self.server.inWaiting()
+        self.server.write(b'foo\r\n')
+        deadline = time.time() + 1
+        while self.client.inWaiting() < 5 and time.time() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(self.client.inWaiting(), 5)
+        self.assertEqual(self.client.read(10), b'foo\r\n')
+        self.assertEqual(self.client.inWaiting(), 0)
+
+    def test_peer_closed(self):
+        self.server.inWaiting()
+        self.server.destroy()
+        with self.assertRaises(serial.SerialException):
+            self.client.read(1)
+
+    def test_data_logger(self):
+        bottles = list(generate_bottles(2, seed=1))
+        dummy = DummyLogger(self.server, bottles)
+        try:
+            logger = DataLogger(self.client)
+            try:
+                self.assertEqual(
+                    [bottle.serial for bottle in logger.bottles],
+                    [bottle.serial for bottle in bottles])
+                self.assertEqual(
+                    list(logger.bottles[1].heads[0].auto_readings),
+                    list(bottles[1].heads[0].auto_readings))
+            finally:
+                logger.close()
+        finally:
+            dummy.terminated = True
+            dummy.join()
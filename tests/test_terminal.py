@@ -0,0 +1,373 @@
+# -*- coding: utf-8 -*-
+# vim: set et sw=4 sts=4:
+
+# Copyright 2012 Dave Hughes.
+#
+# This file is part of oxitopped.
+#
+# oxitopped is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# oxitopped is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# A PARTICULAR PURPOSE.  See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# oxitopped.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Tests for the command line utilities."""
+
+from __future__ import (
+    unicode_literals,
+    print_function,
+    absolute_import,
+    division,
+    )
+
+import os
+import io
+import sys
+import json
+import time
+import shutil
+import optparse
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+
+from oxitopped.bottles import DataAnalyzer
+from oxitopped.nullmodem import null_modem
+from oxitopped.synthetic import generate_bottles, write_bottles
+from oxitopped.logger import DummyLogger, FileLogger, LoggerManager
+from oxitopped.terminal import OxiTopApplication
+from oxitopped.oxitoplist import ListApplication
+from oxitopped.oxitopdump import DumpApplication
+
+
+class SelectApplication(OxiTopApplication):
+    """
+    %prog [options] [bottle-serial]...
+
+    Selects bottles for testing.
+    """
+
+    def __init__(self, data_logger):
+        super(SelectApplication, self).__init__()
+        self.add_client_options()
+        self.add_filter_options()
+        self.data_logger = data_logger
+
+
+def select(data_logger, *args):
+    # Each selection gets a new parser as the parser's defaults (e.g. the list
+    # --id appends to) are only meant to be used once
+    app = SelectApplication(data_logger)
+    options, args = app.parser.parse_args(list(args))
+    return app.select_bottles(options, args)
+
+
+def emulated(cls, units, baudrate=None):
+    """
+    Returns an instance of the application class `cls` whose ports are
+    emulated data loggers. The `units` mapping associates port names with the
+    bottles served by the unit on that port. If `baudrate` is specified, the
+    ports are throttled to that rate.
+    """
+    class EmulatedApplication(cls):
+        __doc__ = cls.__doc__
+
+        def open_port(self, port, timeout):
+            port_name = port
+            port, dummy_port = null_modem(
+                baudrate=baudrate or 9600, timeout=0.5,
+                throttle=baudrate is not None)
+            port.port = port_name
+            self.dummy_loggers.append(
+                DummyLogger(dummy_port, units[port_name]))
+            return port
+
+    return EmulatedApplication()
+
+
+class Capture(object):
+    """
+    Context manager which captures everything written to stdout.
+    """
+
+    def __enter__(self):
+        self.stdout = sys.stdout
+        sys.stdout = self.output = io.StringIO()
+        return self.output
+
+    def __exit__(self, *exc):
+        sys.stdout = self.stdout
+
+
+class MultiPortTest(unittest.TestCase):
+    def setUp(self):
+        # Both units store bottles 12120301 and 12120302
+        self.units = {
+            'unit1': list(generate_bottles(3, seed=1)),
+            'unit2': list(generate_bottles(2, seed=2)),
+            }
+        self.tempdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def run_app(self, cls, *args):
+        app = emulated(cls, self.units)
+        try:
+            return app(['-q', '-p', 'unit1', '-p', 'unit2'] + list(args))
+        finally:
+            for dummy in app.dummy_loggers:
+                dummy.join()
+
+    def test_select_duplicate_serials(self):
+        ports = []
+        dummies = []
+        for name in ('unit1', 'unit2'):
+            port, dummy_port = null_modem(timeout=0.5, throttle=False)
+            port.port = name
+            ports.append(port)
+            dummies.append(DummyLogger(dummy_port, self.units[name]))
+        data_logger = LoggerManager(ports)
+        try:
+            self.assertEqual(
+                [
+                    (bottle.serial, bottle.port)
+                    for bottle in select(data_logger, '12120301', '12120303')
+                    ],
+                [
+                    ('12120301', 'unit1'),
+                    ('12120303', 'unit1'),
+                    ('12120301', 'unit2'),
+                    ])
+        finally:
+            data_logger.close()
+            for dummy in dummies:
+                dummy.terminated = True
+                dummy.join()
+
+    def test_list(self):
+        with Capture() as output:
+            self.assertEqual(
+                self.run_app(ListApplication, '--format', 'jsonl'), 0)
+        self.assertEqual(
+            [
+                json.loads(line)['serial']
+                for line in output.getvalue().splitlines()
+                ],
+            [
+                bottle.serial
+                for name in ('unit1', 'unit2')
+                for bottle in self.units[name]
+                ])
+
+    def test_dump(self):
+        self.assertEqual(self.run_app(
+            DumpApplication, '1212030*',
+            os.path.join(self.tempdir, '{bottle.port}_{bottle.serial}.csv')),
+            0)
+        self.assertEqual(sorted(os.listdir(self.tempdir)), [
+            'unit1_12120301.csv',
+            'unit1_12120302.csv',
+            'unit1_12120303.csv',
+            'unit2_12120301.csv',
+            'unit2_12120302.csv',
+            ])
+
+    def test_dump_duplicate_filenames(self):
+        with self.assertRaises(optparse.OptParseError):
+            self.run_app(
+                DumpApplication, '1212030*',
+                os.path.join(self.tempdir, '{bottle.serial}.csv'))
+        self.assertEqual(os.listdir(self.tempdir), [])
+
+
+class SelectBottlesTest(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.source = os.path.join(self.tempdir, 'bottles.xml')
+        with io.open(self.source, 'wb') as output:
+            write_bottles(generate_bottles(
+                6, modes=('pressure', 'bod'), heads=(2, 3), seed=1), output)
+        self.data_logger = FileLogger(self.source)
+
+    def select(self, *args):
+        return [
+            bottle.serial
+            for bottle in select(self.data_logger, *args)
+            ]
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def test_no_selection(self):
+        self.assertEqual(len(self.select()), 6)
+
+    def test_patterns(self):
+        self.assertEqual(
+            self.select('1212030[12]', '12120305'),
+            ['12120301', '12120302', '12120305'])
+
+    def test_filters(self):
+        self.assertEqual(self.select('--mode', 'bod'), ['12120303'])
+        self.assertEqual(
+            self.select('--id', '2', '--id', '4'),
+            ['12120302', '12120304'])
+        self.assertEqual(
+            self.select('--heads', '2'), ['12120303'])
+        self.assertEqual(
+            self.select('--started-after', '2012-12-03 21:00:00'),
+            ['12120304', '12120305', '12120306'])
+        self.assertEqual(
+            self.select('--started-before', '2012-12-03'), [])
+
+    def test_filters_and_patterns(self):
+        self.assertEqual(
+            self.select('--mode', 'pressure', '1212030[2-4]'),
+            ['12120302', '12120304'])
+
+    def test_invalid_filters(self):
+        with self.assertRaises(optparse.OptParseError):
+            self.select('--mode', 'foo')
+        with self.assertRaises(optparse.OptParseError):
+            self.select('--finished-after', 'yesterday')
+
+    def test_parse_filter_options(self):
+        app = SelectApplication(self.data_logger)
+        options, args = app.parser.parse_args(
+            ['--finished-before', '2013-01-01'])
+        self.assertTrue(app.parse_filter_options(options))
+        self.assertEqual(options.finished_before, datetime(2013, 1, 1))
+        app = SelectApplication(self.data_logger)
+        options, args = app.parser.parse_args([])
+        self.assertFalse(app.parse_filter_options(options))
+
+
+class ListJsonlTest(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.source = os.path.join(self.tempdir, 'bottles.xml')
+        with io.open(self.source, 'wb') as output:
+            write_bottles(generate_bottles(
+                3, modes=('pressure', 'bod'), heads=(2, 3), measurements=40,
+                seed=1), output)
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def check_readings(self, delta, points):
+        args = ['--source', self.source, '--format', 'jsonl', '--readings',
+            '--moving-average', str(points)]
+        if not delta:
+            args.append('--absolute')
+        with Capture() as output:
+            self.assertEqual(ListApplication()(args), 0)
+        rows = [
+            line for line in output.getvalue().splitlines()
+            if json.loads(line)['type'] == 'reading'
+            ]
+        # The fast path which formats reading rows must produce exactly what
+        # print_json would for the same values
+        app = ListApplication()
+        with Capture() as output:
+            for bottle in FileLogger(self.source).bottles:
+                analyzer = DataAnalyzer(bottle, delta, points)
+                for head, readings in zip(bottle.heads, analyzer.heads):
+                    for index, value in enumerate(readings):
+                        app.print_json(dict(
+                            type='reading',
+                            serial=bottle.serial,
+                            head=head.serial,
+                            index=index,
+                            timestamp=analyzer.timestamps[index].isoformat(),
+                            value=value,
+                            ))
+        self.assertTrue(rows)
+        self.assertEqual(rows, output.getvalue().splitlines())
+
+    def test_readings(self):
+        self.check_readings(delta=True, points=1)
+
+    def test_absolute_readings(self):
+        self.check_readings(delta=False, points=1)
+
+    def test_moving_average(self):
+        self.check_readings(delta=True, points=5)
+        self.check_readings(delta=False, points=3)
+
+
+class DumpFiltersTest(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.source = os.path.join(self.tempdir, 'bottles.xml')
+        with io.open(self.source, 'wb') as output:
+            write_bottles(generate_bottles(
+                6, modes=('pressure', 'bod'), heads=(2, 3), seed=1), output)
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def dump(self, *args):
+        return DumpApplication()(['--source', self.source] + list(args))
+
+    def test_filters_export_readings(self):
+        filename = os.path.join(self.tempdir, '{bottle.serial}.csv')
+        self.assertEqual(self.dump('--id', '1', '--id', '3', filename), 0)
+        self.assertEqual(
+            sorted(os.listdir(self.tempdir)),
+            ['12120301.csv', '12120303.csv', 'bottles.xml'])
+
+    def test_invalid_options_before_connecting(self):
+        filename = os.path.join(self.tempdir, 'out.csv')
+        for args in (
+                ['-p', '/dev/nonexistent', '-j', 'x', filename],
+                ['-p', '/dev/nonexistent', '-m', '2', filename],
+                ['-p', '/dev/nonexistent', '--mode', 'foo', filename],
+                ['-p', '/dev/nonexistent', filename + '.foo'],
+                ):
+            with self.assertRaises(optparse.OptParseError):
+                DumpApplication()(args)
+
+
+class DumpAllReadingsTest(unittest.TestCase):
+    def setUp(self):
+        self.units = dict(
+            ('unit%d' % i, list(generate_bottles(
+                1, seed=i, measurements=1000, duration=timedelta(days=5))))
+            for i in (1, 2)
+            )
+        self.tempdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def dump(self, *ports):
+        # Returns the time taken to export the readings of the units on
+        # ports to a single file, and the number of rows in the file
+        filename = os.path.join(self.tempdir, 'readings.csv')
+        app = emulated(DumpApplication, self.units, baudrate=115200)
+        args = ['-q', '-A']
+        for port in ports:
+            args.extend(['-p', port])
+        start = time.time()
+        try:
+            self.assertEqual(app(args + [filename]), 0)
+        finally:
+            for dummy in app.dummy_loggers:
+                dummy.join()
+        with io.open(filename, 'r') as f:
+            return time.time() - start, len(f.readlines())
+
+    def test_concurrent_downloads(self):
+        # The units are downloaded concurrently, so together they take little
+        # more than either alone
+        time1, rows1 = self.dump('unit1')
+        time2, rows2 = self.dump('unit2')
+        time12, rows12 = self.dump('unit1', 'unit2')
+        self.assertEqual(rows12, rows1 + rows2)
+        self.assertLess(time12, (time1 + time2) * 0.8)